@@ -4,3 +4,5 @@ from speedinfo.profiler import Profiler
 
 default_app_config = "speedinfo.apps.SpeedinfoConfig"
 profiler = Profiler()
+
+from speedinfo.profiling import profile  # noqa: E402, F401, I202
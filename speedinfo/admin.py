@@ -1,20 +1,25 @@
 # coding: utf-8
 
 import csv
-
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
+import json
+from collections import OrderedDict
 
 from django.conf.urls import url
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse, HttpResponseRedirect
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.utils.html import format_html
 
 from speedinfo import profiler
 from speedinfo.conf import speedinfo_settings
-from speedinfo.models import ViewProfiler
+from speedinfo.dimensions.dispatcher import BREAKDOWN_PREFIX, dimensions_dispatcher
+from speedinfo.forms import ProfilingSessionForm, SamplingRulesForm
+from speedinfo.models import SlowRequest, Snapshot, ViewProfiler
+from speedinfo.snapshots import compare_counters
+from speedinfo.storage.base import AbstractStorage
 
 try:
     from django.urls import reverse  # Django >= 1.10
@@ -22,25 +27,164 @@ except ImportError:
     from django.core.urlresolvers import reverse
 
 
-def field_wrapper(col):
+def field_wrapper(col, sortable=True):
     """Helper function to dynamically create list display method
     for :class:`ViewProfilerAdmin` to control value formatting
     and sort order.
 
     :type col: tuple(str, str, str)
+    :param bool sortable: Whether the storage can sort the entries by the column
     :rtype: function
     """
     def field_format(obj):
         return col[1].format(getattr(obj, col[2]))
 
     field_format.short_description = col[0]
-    field_format.admin_order_field = col[2]
+
+    if sortable:
+        field_format.admin_order_field = col[2]
 
     return field_format
 
 
+def is_sortable(field_name):
+    """Checks if the entries can be sorted by the field or property of :class:`speedinfo.models.ViewProfiler`.
+
+    :param str field_name: Field or property name
+    :rtype: bool
+    """
+    model_field_names = [field.name for field in ViewProfiler._meta.get_fields()]
+    return (field_name in model_field_names) or (field_name in AbstractStorage.SORTABLE_PROPERTIES)
+
+
+class Echo(object):
+    """
+    File-like object that returns written value instead of
+    buffering it. Used to stream CSV rows.
+    """
+    def write(self, value):
+        return value
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "raw": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+
+def export_rows(rows, columns, export_format):
+    """Generates lines of the exported data one by one.
+
+    :param rows: iterable of objects to export
+    :param columns: list of columns in the same form as SPEEDINFO_ADMIN_COLUMNS
+    :type columns: list[tuple(str, str, str)]
+    :param str export_format: one of `csv` (formatted values), `raw` (CSV with unformatted values)
+        or `jsonl` (JSON Lines with unformatted values)
+    :return: generator of the lines
+    """
+    if export_format == "jsonl":
+        for row in rows:
+            yield json.dumps(
+                OrderedDict((col[2], getattr(row, col[2])) for col in columns),
+                cls=DjangoJSONEncoder,
+            ) + "\n"
+        return
+
+    csv_writer = csv.writer(Echo())
+
+    if export_format == "raw":
+        yield csv_writer.writerow([col[2] for col in columns])
+
+        for row in rows:
+            yield csv_writer.writerow([getattr(row, col[2]) for col in columns])
+    else:
+        yield csv_writer.writerow([col[0] for col in columns])
+
+        for row in rows:
+            yield csv_writer.writerow([col[1].format(getattr(row, col[2])) for col in columns])
+
+
+def group_by_value(breakdown):
+    """Groups the views by the values of the dimension.
+
+    :param dict breakdown: counters of the dimension as returned by
+        :meth:`speedinfo.storage.base.AbstractStorage.fetch_breakdowns`
+    :return: list of dimension values with the total calls and time and the list of views,
+        ordered by the total time
+    :rtype: list[dict]
+    """
+    groups = {}
+
+    for (view_name, method), values in breakdown.items():
+        for value, (calls, total_time) in values.items():
+            group = groups.setdefault(value, {"value": value, "calls": 0, "total_time": 0, "views": []})
+            group["calls"] += calls
+            group["total_time"] += total_time
+            group["views"].append({
+                "view_name": view_name,
+                "method": method,
+                "calls": calls,
+                "total_time": total_time,
+                "time_per_call": total_time / float(calls) if calls else 0,
+            })
+
+    for group in groups.values():
+        group["time_per_call"] = group["total_time"] / float(group["calls"]) if group["calls"] else 0
+        group["views"].sort(key=lambda item: item["total_time"], reverse=True)
+
+    return sorted(groups.values(), key=lambda item: item["total_time"], reverse=True)
+
+
+class MethodListFilter(admin.SimpleListFilter):
+    title = "HTTP method or kind"
+    parameter_name = "method"
+
+    def lookups(self, request, model_admin):
+        return [
+            (method, method)
+            for method in ("GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS", "TASK", "COMMAND", "BLOCK")
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter_storage(method=self.value())
+
+
+class MinCallsListFilter(admin.SimpleListFilter):
+    title = "total calls"
+    parameter_name = "min_calls"
+
+    def lookups(self, request, model_admin):
+        return [(str(value), "{} and more".format(value)) for value in (10, 100, 1000, 10000)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            try:
+                return queryset.filter_storage(min_calls=int(self.value()))
+            except ValueError as e:
+                raise IncorrectLookupParameters(e)
+
+
+class MinTimePerCallListFilter(admin.SimpleListFilter):
+    title = "time per call"
+    parameter_name = "min_time_per_call"
+
+    def lookups(self, request, model_admin):
+        return [(str(value), "{}s and more".format(value)) for value in (0.1, 0.5, 1, 5)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            try:
+                return queryset.filter_storage(min_time_per_call=float(self.value()))
+            except ValueError as e:
+                raise IncorrectLookupParameters(e)
+
+
 class ViewProfilerAdmin(admin.ModelAdmin):
     list_display_links = None
+    list_filter = (MethodListFilter, MinCallsListFilter, MinTimePerCallListFilter)
+    search_fields = ("view_name",)
     actions = None
     ordering = ("-total_time",)
 
@@ -58,7 +202,7 @@ class ViewProfilerAdmin(admin.ModelAdmin):
 
         for rc in speedinfo_settings.SPEEDINFO_ADMIN_COLUMNS:
             method_name = "{}_wrapper".format(rc[2])
-            setattr(self, method_name, field_wrapper(rc))
+            setattr(self, method_name, field_wrapper(rc, is_sortable(rc[2])))
             self.list_display.append(method_name)
 
     def change_view(self, *args, **kwargs):
@@ -70,10 +214,37 @@ class ViewProfilerAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
 
+    def get_search_results(self, request, queryset, search_term):
+        """Passes the search term down to the storage as a view name filter."""
+        if search_term:
+            queryset = queryset.filter_storage(view_name=search_term)
+
+        return queryset, False
+
     def changelist_view(self, request, extra_context=None):
+        # Session expired by duration is stopped even if there are no requests to profile
+        profiler.check_session(count_request=False)
+        evictions = profiler.storage.count_evictions()
+
+        if evictions:
+            self.message_user(request, "{} entries were evicted from the storage since the last reset, "
+                                       "profiling data is incomplete.".format(evictions), messages.WARNING)
+
+        # Queue time of all requests with the known queue time
+        queue_calls, queue_time = 0, 0
+
+        for values in profiler.storage.fetch_breakdowns("queue").values():
+            for calls, total_time in values.values():
+                queue_calls += calls
+                queue_time += total_time
+
         return super(ViewProfilerAdmin, self).changelist_view(request, extra_context={
             "title": "Views profiler",
+            "queue_time_per_call": queue_time / float(queue_calls) if queue_calls else None,
             "profiler_is_on": profiler.is_on,
+            "profiler_session": profiler.session,
+            "profiler_baseline": profiler.baseline,
+            "profiler_dimensions": [dimension.name for dimension in dimensions_dispatcher.get_dimensions()],
         })
 
     def get_urls(self):
@@ -81,31 +252,61 @@ class ViewProfilerAdmin(admin.ModelAdmin):
             url(r"^switch/$", self.admin_site.admin_view(self.switch), name="speedinfo-profiler-switch"),
             url(r"^export/$", self.admin_site.admin_view(self.export), name="speedinfo-profiler-export"),
             url(r"^reset/$", self.admin_site.admin_view(self.reset), name="speedinfo-profiler-reset"),
+            url(r"^sampling/$", self.admin_site.admin_view(self.sampling), name="speedinfo-profiler-sampling"),
+            url(r"^session/$", self.admin_site.admin_view(self.start_session), name="speedinfo-profiler-session"),
+            url(
+                r"^session/stop/$", self.admin_site.admin_view(self.stop_session),
+                name="speedinfo-profiler-session-stop",
+            ),
+            url(r"^baseline/$", self.admin_site.admin_view(self.freeze_baseline), name="speedinfo-profiler-baseline"),
+            url(
+                r"^regressions/$", self.admin_site.admin_view(self.regressions),
+                name="speedinfo-profiler-regressions",
+            ),
+            url(r"^dimensions/$", self.admin_site.admin_view(self.dimensions), name="speedinfo-profiler-dimensions"),
         ] + super(ViewProfilerAdmin, self).get_urls()
 
     def switch(self, request):
-        profiler.is_on = not profiler.is_on
+        if profiler.is_on and profiler.session:
+            profiler.stop_session()
+        else:
+            profiler.is_on = not profiler.is_on
+
         return HttpResponseRedirect(reverse("admin:speedinfo_viewprofiler_changelist"))
 
     def export(self, request):
-        """Exports profiling data as a comma-separated file.
+        """Streams profiling data as a file. Query parameters:
+
+            - `format` - `csv` (default) for the values formatted as in the admin,
+              `raw` for CSV with unformatted values or `jsonl` for JSON Lines
+            - `dataset` - `views` (default) for aggregated data or
+              `slow` for the timestamped slow requests
 
         :param request: :class:`django.http.HttpRequest`
-        :return: comma-separated file
-        :rtype: :class:`django.http.HttpResponse`
+        :return: exported data file
+        :rtype: :class:`django.http.StreamingHttpResponse`
         """
-        output = StringIO()
-        csv_writer = csv.writer(output)
-        csv_writer.writerow([col[0] for col in speedinfo_settings.SPEEDINFO_ADMIN_COLUMNS])
+        export_format = request.GET.get("format", "csv")
+        dataset = request.GET.get("dataset", "views")
 
-        for row in self.get_queryset(request):
-            csv_writer.writerow([
-                col[1].format(getattr(row, col[2]))
-                for col in speedinfo_settings.SPEEDINFO_ADMIN_COLUMNS
-            ])
+        if (export_format not in EXPORT_FORMATS) or (dataset not in ("views", "slow")):
+            return HttpResponseBadRequest()
 
-        response = HttpResponse(output.getvalue(), content_type="text/csv")
-        response["Content-Disposition"] = "attachment; filename=profiler.csv"
+        if dataset == "slow":
+            filename = "slow-requests"
+            rows = SlowRequest.objects.order_by("created_at")
+            columns = [
+                (field.verbose_name, "{}", field.name)
+                for field in SlowRequest._meta.fields if not field.primary_key
+            ]
+        else:
+            filename = "profiler"
+            rows = self.get_queryset(request).iterator()
+            columns = speedinfo_settings.SPEEDINFO_ADMIN_COLUMNS
+
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(export_rows(rows, columns, export_format), content_type=content_type)
+        response["Content-Disposition"] = "attachment; filename={}.{}".format(filename, extension)
 
         return response
 
@@ -113,5 +314,215 @@ class ViewProfilerAdmin(admin.ModelAdmin):
         profiler.storage.reset()
         return HttpResponseRedirect(reverse("admin:speedinfo_viewprofiler_changelist"))
 
+    def sampling(self, request):
+        """Edits sampling rates of the views and URL namespaces.
+
+        :param request: :class:`django.http.HttpRequest`
+        :rtype: :class:`django.http.HttpResponse`
+        """
+        if request.method == "POST":
+            form = SamplingRulesForm(request.POST)
+
+            if form.is_valid():
+                profiler.sampling_rules = form.cleaned_data["rules"]
+                return HttpResponseRedirect(reverse("admin:speedinfo_viewprofiler_changelist"))
+        else:
+            form = SamplingRulesForm(initial={
+                "rules": SamplingRulesForm.format_rules(profiler.sampling_rules),
+            })
+
+        return TemplateResponse(request, "admin/speedinfo/form.html", dict(
+            self.admin_site.each_context(request),
+            title="Sampling rules",
+            opts=self.model._meta,
+            form=form,
+        ))
+
+    def start_session(self, request):
+        """Starts the profiling session limited by the duration and/or
+        the number of profiled requests. Profiling data is reset.
+
+        :param request: :class:`django.http.HttpRequest`
+        :rtype: :class:`django.http.HttpResponse`
+        """
+        if request.method == "POST":
+            form = ProfilingSessionForm(request.POST)
+
+            if form.is_valid():
+                duration = form.cleaned_data["duration"]
+                profiler.start_session(
+                    name=form.cleaned_data["name"],
+                    duration=duration * 60 if duration else None,
+                    max_requests=form.cleaned_data["max_requests"],
+                )
+                return HttpResponseRedirect(reverse("admin:speedinfo_viewprofiler_changelist"))
+        else:
+            form = ProfilingSessionForm()
+
+        return TemplateResponse(request, "admin/speedinfo/form.html", dict(
+            self.admin_site.each_context(request),
+            title="Start profiling session",
+            opts=self.model._meta,
+            form=form,
+            submit_label="Start",
+        ))
+
+    def stop_session(self, request):
+        profiler.stop_session()
+        return HttpResponseRedirect(reverse("admin:speedinfo_viewprofiler_changelist"))
+
+    def freeze_baseline(self, request):
+        profiler.freeze_baseline("Baseline")
+        return HttpResponseRedirect(reverse("admin:speedinfo_viewprofiler_changelist"))
+
+    def regressions(self, request):
+        """Shows the views which performance regressed compared to the baseline snapshot.
+
+        :param request: :class:`django.http.HttpRequest`
+        :rtype: :class:`django.http.HttpResponse`
+        """
+        regressions = profiler.detect_regressions()
+
+        if regressions is None:
+            raise Http404("Baseline snapshot not found")
+
+        return TemplateResponse(request, "admin/speedinfo/regressions.html", dict(
+            self.admin_site.each_context(request),
+            title="Performance regressions",
+            opts=self.model._meta,
+            regressions=regressions,
+        ))
+
+    def dimensions(self, request):
+        """Shows the calls and time grouped by the values of the custom dimension
+        set in `dimension` query parameter, the first dimension is used if omitted.
+
+        :param request: :class:`django.http.HttpRequest`
+        :rtype: :class:`django.http.HttpResponse`
+        """
+        names = [dimension.name for dimension in dimensions_dispatcher.get_dimensions()]
+        name = request.GET.get("dimension") or (names[0] if names else None)
+
+        if name not in names:
+            raise Http404("Dimension not found")
+
+        return TemplateResponse(request, "admin/speedinfo/dimensions.html", dict(
+            self.admin_site.each_context(request),
+            title="Views by {}".format(name),
+            opts=self.model._meta,
+            dimensions=names,
+            dimension=name,
+            groups=group_by_value(profiler.storage.fetch_breakdowns(BREAKDOWN_PREFIX + name)),
+        ))
+
+
+class SlowRequestAdmin(admin.ModelAdmin):
+    list_display = (
+        "created_at", "view_name", "method", "path", "query_hash", "user_id",
+        "status_code", "is_cache_hit", "sql_count", "sql_time", "duration",
+    )
+    list_display_links = None
+    actions = None
+    ordering = ("-duration",)
+
+    def change_view(self, *args, **kwargs):
+        raise PermissionDenied
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class SnapshotAdmin(admin.ModelAdmin):
+    list_display = ("name", "started_at", "finished_at", "compare_link", "baseline_link")
+    list_display_links = None
+    actions = None
+    ordering = ("-finished_at",)
+
+    def compare_link(self, obj):
+        return format_html(
+            '<a href="{}?baseline={}">Compare with current data</a>',
+            reverse("admin:speedinfo-snapshot-compare"), obj.id,
+        )
+
+    compare_link.short_description = "Compare"
+
+    def baseline_link(self, obj):
+        if obj.id == profiler.baseline:
+            return "Baseline"
+
+        return format_html(
+            '<a href="{}?snapshot={}">Use as baseline</a>',
+            reverse("admin:speedinfo-snapshot-baseline"), obj.id,
+        )
+
+    baseline_link.short_description = "Baseline"
+
+    def change_view(self, *args, **kwargs):
+        raise PermissionDenied
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            url(r"^compare/$", self.admin_site.admin_view(self.compare), name="speedinfo-snapshot-compare"),
+            url(r"^baseline/$", self.admin_site.admin_view(self.set_baseline), name="speedinfo-snapshot-baseline"),
+        ] + super(SnapshotAdmin, self).get_urls()
+
+    def compare(self, request):
+        """Compares time per call of the views in two snapshots. Query parameters:
+
+            - `baseline` - ID of the baseline snapshot
+            - `snapshot` - ID of the snapshot to compare with the baseline,
+              current profiling data is used if omitted
+
+        :param request: :class:`django.http.HttpRequest`
+        :rtype: :class:`django.http.HttpResponse`
+        """
+        baseline_id = request.GET.get("baseline")
+        snapshot_id = request.GET.get("snapshot")
+        baseline = profiler.storage.fetch_snapshot_counters(baseline_id) if baseline_id else None
+
+        if snapshot_id:
+            counters = profiler.storage.fetch_snapshot_counters(snapshot_id)
+        else:
+            counters = profiler.storage.fetch_counters()
+
+        if (baseline is None) or (counters is None):
+            raise Http404("Snapshot not found")
+
+        return TemplateResponse(request, "admin/speedinfo/compare.html", dict(
+            self.admin_site.each_context(request),
+            title="Compare snapshots",
+            opts=self.model._meta,
+            snapshots=profiler.storage.fetch_snapshots(["-finished_at"]),
+            baseline_id=baseline_id,
+            snapshot_id=snapshot_id or "",
+            results=compare_counters(baseline, counters),
+        ))
+
+    def set_baseline(self, request):
+        """Sets the snapshot passed in `snapshot` query parameter
+        as the baseline for performance regressions detection.
+
+        :param request: :class:`django.http.HttpRequest`
+        :rtype: :class:`django.http.HttpResponse`
+        """
+        snapshot_id = request.GET.get("snapshot")
+
+        if not snapshot_id or profiler.storage.fetch_snapshot_counters(snapshot_id) is None:
+            raise Http404("Snapshot not found")
+
+        profiler.baseline = snapshot_id
+        return HttpResponseRedirect(reverse("admin:speedinfo_snapshot_changelist"))
+
 
 admin.site.register(ViewProfiler, ViewProfilerAdmin)
+admin.site.register(SlowRequest, SlowRequestAdmin)
+admin.site.register(Snapshot, SnapshotAdmin)
@@ -1,10 +1,15 @@
 # coding: utf-8
 
+import gc
+import re
+
 import django
 from django.apps import AppConfig
 from django.conf import settings
 from django.core.checks import Error, Warning, register
 
+from speedinfo.conf import speedinfo_settings
+from speedinfo.dimensions.dispatcher import BREAKDOWN_PREFIX
 from speedinfo.utils import import_class
 
 if django.VERSION < (1, 10):
@@ -96,6 +101,103 @@ def check_storage(app_configs, **kwargs):
         return []
 
 
+def check_celery(app_configs, **kwargs):
+    if not speedinfo_settings.SPEEDINFO_PROFILE_CELERY_TASKS:
+        return []
+
+    try:
+        import celery  # noqa: F401
+    except ImportError:
+        return [
+            Error(
+                "SPEEDINFO_PROFILE_CELERY_TASKS is enabled, but Celery is not installed",
+                hint="Install Celery or disable SPEEDINFO_PROFILE_CELERY_TASKS",
+                id="speedinfo.E006",
+            ),
+        ]
+    else:
+        return []
+
+
+def check_gc(app_configs, **kwargs):
+    if speedinfo_settings.SPEEDINFO_PROFILE_GC and not hasattr(gc, "callbacks"):
+        return [
+            Warning(
+                "SPEEDINFO_PROFILE_GC is enabled, but garbage collector callbacks are not supported",
+                hint="Garbage collections are measured on Python 3.3+ only",
+                id="speedinfo.W002",
+            ),
+        ]
+    else:
+        return []
+
+
+def check_node_storage(app_configs, **kwargs):
+    if speedinfo_settings.SPEEDINFO_STORAGE != "speedinfo.storage.node.storage.NodeStorage":
+        return []
+
+    errors = []
+
+    if not speedinfo_settings.SPEEDINFO_NODE_STORAGE:
+        errors.append(
+            Error(
+                "SPEEDINFO_NODE_STORAGE is None or missing from the settings",
+                hint="Assign a dotted module path to the storage class which keeps collected data "
+                     "to the SPEEDINFO_NODE_STORAGE",
+                id="speedinfo.E007",
+            ),
+        )
+
+    if speedinfo_settings.SPEEDINFO_NODE_COLLECTOR_URL and not speedinfo_settings.SPEEDINFO_COLLECTOR_TOKEN:
+        errors.append(
+            Error(
+                "SPEEDINFO_NODE_COLLECTOR_URL is set, but SPEEDINFO_COLLECTOR_TOKEN is missing",
+                hint="Set the same SPEEDINFO_COLLECTOR_TOKEN on the nodes and the collector",
+                id="speedinfo.E008",
+            ),
+        )
+
+    return errors
+
+
+# Dimension name is used as a Prometheus label name and is stored
+# with the prefix in the database storage field of 32 characters
+DIMENSION_NAME_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]{{0,{}}}$".format(31 - len(BREAKDOWN_PREFIX)))
+
+
+def check_dimensions(app_configs, **kwargs):
+    errors = []
+    names = set()
+
+    for module_path in speedinfo_settings.SPEEDINFO_DIMENSIONS:
+        try:
+            name = import_class(module_path).name
+        except ImportError:
+            errors.append(
+                Error(
+                    "Could not import class '{}' in SPEEDINFO_DIMENSIONS".format(module_path),
+                    hint="Ensure that module and class at specified path is importable",
+                    id="speedinfo.E009",
+                ),
+            )
+            continue
+
+        if (not DIMENSION_NAME_RE.match(name or "")) or (name in names):
+            errors.append(
+                Error(
+                    "Dimension '{}' has invalid or duplicate name '{}'".format(module_path, name),
+                    hint="Use unique names of up to {} latin letters, digits and underscores".format(
+                        32 - len(BREAKDOWN_PREFIX),
+                    ),
+                    id="speedinfo.E010",
+                ),
+            )
+
+        names.add(name)
+
+    return errors
+
+
 class SpeedinfoConfig(AppConfig):
     name = "speedinfo"
 
@@ -103,3 +205,14 @@ class SpeedinfoConfig(AppConfig):
         register()(check_middleware)
         register()(check_cache_backend)
         register()(check_storage)
+        register()(check_celery)
+        register()(check_gc)
+        register()(check_node_storage)
+        register()(check_dimensions)
+
+        if speedinfo_settings.SPEEDINFO_PROFILE_CELERY_TASKS:
+            try:
+                from speedinfo.integrations.celery import connect_signals
+                connect_signals()
+            except ImportError:
+                pass  # Reported by check_celery
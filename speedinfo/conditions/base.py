@@ -14,9 +14,13 @@ class AbstractCondition(object):
     @abstractmethod
     def process_request(self, request):
         """
+        Sampling conditions may return a positive integer instead of True.
+        It is a weight of the request, i.e. the number of requests
+        represented by the profiled one.
+
         :type request: :class:`django.http.HttpRequest`
         :return: False if the requested page should not be profiled
-        :rtype: bool
+        :rtype: bool or int
         """
 
     @abstractmethod
@@ -4,6 +4,70 @@ import re
 
 from speedinfo.conditions.base import AbstractCondition
 from speedinfo.conf import speedinfo_settings
+from speedinfo.utils import LRUCache
+
+REGEX_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+# Numbered or named backreference, e.g. '\1' or '(?P=name)'
+BACKREFERENCE_RE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class URLMatcher(object):
+    """
+    Tests path against the list of regex patterns in a single pass.
+    Literal patterns (e.g. '/admin/' or '/news/$') are tested by prefix
+    or exact comparison, the rest are combined into a single regex.
+    Patterns with backreferences are tested separately, as the groups
+    they refer to would be renumbered in the combined regex.
+    """
+    def __init__(self, patterns):
+        prefixes = []
+        paths = []
+        regexes = []
+        separate_regexes = []
+
+        for pattern in patterns:
+            literal = pattern[1:] if pattern.startswith("^") else pattern
+            is_exact = literal.endswith("$")
+            literal = literal[:-1] if is_exact else literal
+
+            if BACKREFERENCE_RE.search(pattern):
+                separate_regexes.append(re.compile(pattern))
+            elif REGEX_SPECIAL_CHARS.intersection(literal):
+                regexes.append(pattern)
+            elif is_exact:
+                paths.append(literal)
+            else:
+                prefixes.append(literal)
+
+        self.prefixes = tuple(prefixes)
+        self.paths = frozenset(paths)
+
+        try:
+            self.regexes = [re.compile("|".join("(?:{})".format(pattern) for pattern in regexes))] if regexes else []
+        except (re.error, AssertionError):
+            # Patterns can't be combined, e.g. because of the same group names, inline flags
+            # or too many groups (AssertionError is raised by Python 2)
+            self.regexes = [re.compile(pattern) for pattern in regexes]
+
+        self.regexes.extend(separate_regexes)
+
+    def __bool__(self):
+        return bool(self.prefixes or self.paths or self.regexes)
+
+    __nonzero__ = __bool__  # Python 2
+
+    def match(self, path):
+        """
+        :param str path: path to test
+        :return: True if path matches to any of the patterns
+        :rtype: bool
+        """
+        return bool(
+            (self.prefixes and path.startswith(self.prefixes)) or
+            (path in self.paths) or
+            any(regex.match(path) for regex in self.regexes),
+        )
 
 
 class ExcludeURLCondition(AbstractCondition):
@@ -11,28 +75,41 @@ class ExcludeURLCondition(AbstractCondition):
     Condition allows to exclude some urls from profiling by adding them
     to the SPEEDINFO_EXCLUDE_URLS list (default is empty). Each entry in
     SPEEDINFO_EXCLUDE_URLS is a regex compatible expression to test requested url.
+    If SPEEDINFO_INCLUDE_URLS list is not empty, only urls matching to any of
+    its entries are profiled. Decisions are cached for SPEEDINFO_EXCLUDE_URLS_CACHE_SIZE
+    most recently requested urls.
     """
     def __init__(self):
-        self.patterns = None
+        self.matchers = None
+        self.decisions = LRUCache(speedinfo_settings.SPEEDINFO_EXCLUDE_URLS_CACHE_SIZE)
 
-    def get_patterns(self):
-        if (self.patterns is None) or speedinfo_settings.SPEEDINFO_TESTS:
-            self.patterns = [re.compile(pattern) for pattern in speedinfo_settings.SPEEDINFO_EXCLUDE_URLS]
+    def get_matchers(self):
+        if (self.matchers is None) or speedinfo_settings.SPEEDINFO_TESTS:
+            self.matchers = (
+                URLMatcher(speedinfo_settings.SPEEDINFO_EXCLUDE_URLS),
+                URLMatcher(speedinfo_settings.SPEEDINFO_INCLUDE_URLS),
+            )
+            self.decisions.clear()
 
-        return self.patterns
+        return self.matchers
 
     def process_request(self, request):
-        """Checks requested url against the list of excluded urls.
+        """Checks requested url against the lists of excluded and included urls.
 
         :type request: :class:`django.http.HttpRequest`
         :return: False if path matches to any of the exclude urls
+            or doesn't match to any of the include urls
         :rtype: bool
         """
-        for pattern in self.get_patterns():
-            if pattern.match(request.path):
-                return False
+        exclude_matcher, include_matcher = self.get_matchers()
+        decision = self.decisions.get(request.path)
 
-        return True
+        if decision is None:
+            decision = (not include_matcher or include_matcher.match(request.path)) and \
+                not exclude_matcher.match(request.path)
+            self.decisions.set(request.path, decision)
+
+        return decision
 
     def process_response(self, response):
         return True
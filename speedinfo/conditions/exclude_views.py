@@ -0,0 +1,46 @@
+# coding: utf-8
+
+from fnmatch import fnmatchcase
+
+from speedinfo.conditions.base import AbstractCondition
+from speedinfo.conf import speedinfo_settings
+from speedinfo.utils import get_view_name
+
+
+class ExcludeViewCondition(AbstractCondition):
+    """
+    Condition allows to exclude views from profiling by adding their full names
+    to the SPEEDINFO_EXCLUDE_VIEWS list (default is empty). Each entry in
+    SPEEDINFO_EXCLUDE_VIEWS is a shell-style wildcard to test the view name
+    (e.g. 'django.contrib.admin.*'). Decision is made once for each view.
+    """
+    def __init__(self):
+        self.patterns = None
+        self.decisions = {}
+
+    def get_patterns(self):
+        if (self.patterns is None) or speedinfo_settings.SPEEDINFO_TESTS:
+            self.patterns = list(speedinfo_settings.SPEEDINFO_EXCLUDE_VIEWS)
+            self.decisions = {}
+
+        return self.patterns
+
+    def process_request(self, request):
+        """Checks resolved view name against the list of excluded views.
+
+        :type request: :class:`django.http.HttpRequest`
+        :return: False if view name matches to any of the excluded views
+        :rtype: bool
+        """
+        patterns = self.get_patterns()
+        view_name = get_view_name(request) or ""
+
+        try:
+            return self.decisions[view_name]
+        except KeyError:
+            decision = not any(fnmatchcase(view_name, pattern) for pattern in patterns)
+            self.decisions[view_name] = decision
+            return decision
+
+    def process_response(self, response):
+        return True
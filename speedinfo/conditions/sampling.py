@@ -0,0 +1,131 @@
+# coding: utf-8
+
+import random
+import threading
+from timeit import default_timer
+
+from speedinfo.conditions.base import AbstractCondition
+from speedinfo.conf import speedinfo_settings
+from speedinfo.utils import get_view_name
+
+
+def round_weight(weight):
+    """Rounds fractional weight to one of the nearest integers with probability
+    proportional to the fractional part. Keeps the expected value of the weight
+    unchanged, so counters remain unbiased estimates while storing integers.
+
+    :param float weight: weight to round
+    :rtype: int
+    """
+    integer_part = int(weight)
+    return integer_part + (1 if random.random() < weight - integer_part else 0)
+
+
+class SamplingCondition(AbstractCondition):
+    """
+    Base class for sampling conditions. Requests rejected by sampling
+    conditions are still profiled by the middleware when `TailSamplingCondition`
+    is enabled and the request turns out to be slow.
+    """
+    def process_response(self, response):
+        return True
+
+    def process_tail_sampled(self, request):
+        """Called when the request rejected by the condition is profiled by tail sampling.
+
+        :type request: :class:`django.http.HttpRequest`
+        """
+        pass
+
+
+class RateSamplingCondition(SamplingCondition):
+    """
+    Profiles randomly chosen SPEEDINFO_SAMPLING_RATE fraction of requests
+    (default is 1.0, i.e. all requests). Each profiled request is weighted
+    by 1 / SPEEDINFO_SAMPLING_RATE.
+    """
+    def process_request(self, request):
+        """
+        :type request: :class:`django.http.HttpRequest`
+        :return: weight of the sampled request or 0 if the request should not be profiled
+        :rtype: int
+        """
+        rate = speedinfo_settings.SPEEDINFO_SAMPLING_RATE
+
+        if rate <= 0 or random.random() >= rate:
+            return 0
+
+        return round_weight(1.0 / rate)
+
+
+class RateLimitCondition(SamplingCondition):
+    """
+    Limits the number of profiled requests per second for each view
+    using the token bucket algorithm. SPEEDINFO_SAMPLING_RATE_LIMIT sets
+    the rate (default is 10 requests per second) and SPEEDINFO_SAMPLING_RATE_LIMIT_BURST
+    sets the bucket size (default is equal to the rate). Each profiled request
+    is weighted by the number of requests of the view since the previous profiled one.
+    Buckets are kept in the process memory.
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def process_request(self, request):
+        """
+        :type request: :class:`django.http.HttpRequest`
+        :return: weight of the sampled request or 0 if the request should not be profiled
+        :rtype: int
+        """
+        rate = speedinfo_settings.SPEEDINFO_SAMPLING_RATE_LIMIT
+        burst = speedinfo_settings.SPEEDINFO_SAMPLING_RATE_LIMIT_BURST or rate
+        view_name = get_view_name(request)
+        now = default_timer()
+
+        with self.lock:
+            # Bucket is a list of [tokens, last update time, number of skipped requests]
+            bucket = self.buckets.setdefault(view_name, [burst, now, 0])
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return 0
+
+            weight = bucket[2] + 1
+            bucket[0] -= 1
+            bucket[2] = 0
+
+        return weight
+
+    def process_tail_sampled(self, request):
+        """Excludes the skipped request profiled by tail sampling from the weight
+        of the next sampled request, so the request is not counted twice.
+
+        :type request: :class:`django.http.HttpRequest`
+        """
+        with self.lock:
+            bucket = self.buckets.get(get_view_name(request))
+
+            # Skipped requests may have been taken by the sampled request in another thread
+            if (bucket is not None) and (bucket[2] > 0):
+                bucket[2] -= 1
+
+
+class TailSamplingCondition(AbstractCondition):
+    """
+    Profiles requests slower than SPEEDINFO_TAIL_SAMPLING_THRESHOLD seconds
+    (default is 1.0) even when they were rejected by sampling conditions.
+    Such requests are weighted by 1 to keep the counters unbiased, since
+    all slow requests are profiled. Requests rejected by sampling conditions
+    are timed (including SQL queries) to make the decision.
+    """
+    @property
+    def threshold(self):
+        return speedinfo_settings.SPEEDINFO_TAIL_SAMPLING_THRESHOLD
+
+    def process_request(self, request):
+        return True
+
+    def process_response(self, response):
+        return True
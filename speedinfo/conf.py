@@ -6,9 +6,52 @@ DEFAULTS = {
     "SPEEDINFO_TESTS": False,
     "SPEEDINFO_CACHED_RESPONSE_ATTR_NAME": "_is_cached",
     "SPEEDINFO_STORAGE": None,
+    "SPEEDINFO_CONFIG_REFRESH_INTERVAL": 10,
+    "SPEEDINFO_STORAGE_MAX_ENTRIES": None,
     "SPEEDINFO_CACHE_STORAGE_CACHE_ALIAS": "default",
+    "SPEEDINFO_STATSD_HOST": "127.0.0.1",
+    "SPEEDINFO_STATSD_PORT": 8125,
+    "SPEEDINFO_STATSD_PREFIX": "speedinfo",
+    "SPEEDINFO_STATSD_DOGSTATSD": False,
+    "SPEEDINFO_STATSD_MAX_PACKET_SIZE": 1432,
+    "SPEEDINFO_STATSD_FLUSH_INTERVAL": 1.0,
+    "SPEEDINFO_STATSD_QUEUE_SIZE": 10000,
+    "SPEEDINFO_NODE_STORAGE": None,
+    "SPEEDINFO_NODE_NAME": None,
+    "SPEEDINFO_NODE_FLUSH_INTERVAL": 10,
+    "SPEEDINFO_NODE_COLLECTOR_URL": None,
+    "SPEEDINFO_NODE_BATCH_SIZE": 100,
+    "SPEEDINFO_COLLECTOR_TOKEN": None,
+    "SPEEDINFO_PROFILE_CELERY_TASKS": False,
+    "SPEEDINFO_PROFILE_GC": False,
+    "SPEEDINFO_PROFILE_CONNECTIONS": False,
+    "SPEEDINFO_PROFILE_HTTP": False,
     "SPEEDINFO_PROFILING_CONDITIONS": [],
     "SPEEDINFO_EXCLUDE_URLS": [],
+    "SPEEDINFO_INCLUDE_URLS": [],
+    "SPEEDINFO_EXCLUDE_URLS_CACHE_SIZE": 1024,
+    "SPEEDINFO_EXCLUDE_VIEWS": [],
+    "SPEEDINFO_DIMENSIONS": [],
+    "SPEEDINFO_DIMENSION_MAX_VALUES": 100,
+    "SPEEDINFO_RELEASE": None,
+    "SPEEDINFO_SAMPLING_RATE": 1.0,
+    "SPEEDINFO_SAMPLING_RATE_LIMIT": 10,
+    "SPEEDINFO_SAMPLING_RATE_LIMIT_BURST": None,
+    "SPEEDINFO_TAIL_SAMPLING_THRESHOLD": 1.0,
+    "SPEEDINFO_QUEUE_TIME_HEADERS": [],
+    "SPEEDINFO_QUEUE_TIME_UNIT": None,
+    "SPEEDINFO_SLOW_REQUEST_THRESHOLD": None,
+    "SPEEDINFO_SLOW_REQUESTS_PER_VIEW": 10,
+    "SPEEDINFO_SLOW_REQUESTS_LIMIT": 100,
+    "SPEEDINFO_SNAPSHOTS_LIMIT": 20,
+    "SPEEDINFO_EWMA_HALF_LIFE": None,
+    "SPEEDINFO_REGRESSION_THRESHOLD": 0.2,
+    "SPEEDINFO_REGRESSION_Z_SCORE": 3.0,
+    "SPEEDINFO_REGRESSION_MIN_CALLS": 10,
+    "SPEEDINFO_OVERHEAD_BUDGET_RATIO": None,
+    "SPEEDINFO_OVERHEAD_BUDGET_TIME": None,
+    "SPEEDINFO_OVERHEAD_WINDOW": 10,
+    "SPEEDINFO_OVERHEAD_MIN_RATE": 0.01,
     "SPEEDINFO_ADMIN_COLUMNS": (
         ("View name", "{}", "view_name"),
         ("HTTP method", "{}", "method"),
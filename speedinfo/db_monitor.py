@@ -0,0 +1,147 @@
+# coding: utf-8
+
+from functools import wraps
+from timeit import default_timer
+
+# Breakdown names of the connection establishment, transaction and commit counters
+CONNECTION_BREAKDOWNS = ("db_connect", "db_transaction", "db_commit")
+
+
+def timed(func, counters):
+    """Wraps the function to count the calls and the time spent in it.
+
+    :param func: Function to wrap
+    :param list counters: [number of calls, total time] to update
+    :return: wrapped function
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start_time = default_timer()
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            counters[0] += 1
+            counters[1] += default_timer() - start_time
+
+    return wrapper
+
+
+def instrument_queries(conn):
+    """Adds the execute wrapper (Django 2.0+) counting SQL queries executed by the connection
+    and their time. Unlike the queries log of the debug cursor, the counters aren't limited
+    by the number of queries and don't keep SQL statements in memory.
+
+    :param conn: Database connection wrapper
+    :type conn: :class:`django.db.backends.base.base.BaseDatabaseWrapper`
+    :return: [number of queries, total time] or None if execute wrappers aren't supported
+    :rtype: list or None
+    """
+    stats = getattr(conn, "_speedinfo_sql_stats", None)
+
+    if (stats is not None) or not hasattr(conn, "execute_wrappers"):
+        return stats
+
+    def execute_wrapper(execute, sql, params, many, context):
+        return execute(sql, params, many, context)
+
+    stats = conn._speedinfo_sql_stats = [0, 0.0]
+
+    # connection.execute_wrapper() context manager removes the last wrapper on exit,
+    # so the permanent wrapper is added to the beginning of the list
+    conn.execute_wrappers.insert(0, timed(execute_wrapper, stats))
+    return stats
+
+
+def get_query_stats(conn):
+    """Returns the number of SQL queries executed by the connection and their time.
+    Queries log of the debug cursor is used if the connection is not instrumented.
+
+    :param conn: Database connection wrapper
+    :type conn: :class:`django.db.backends.base.base.BaseDatabaseWrapper`
+    :return: number of SQL queries and SQL time
+    :rtype: tuple(int, float)
+    """
+    stats = getattr(conn, "_speedinfo_sql_stats", None)
+
+    if stats is not None:
+        return stats[0], stats[1]
+
+    return len(conn.queries), sum(float(q["time"]) for q in conn.queries)
+
+
+def instrument_connection(conn):
+    """Wraps the methods of the database connection wrapper to measure establishing
+    of the connection, transactions (from disabling to restoring autocommit, e.g.
+    the outermost `transaction.atomic` block) and commits. Transactions started
+    without disabling autocommit (SQLite on Django < 2.0) last until the commit
+    or the rollback. Connection wrappers are thread-local, so the counters
+    are updated by a single thread.
+
+    :param conn: Database connection wrapper
+    :type conn: :class:`django.db.backends.base.base.BaseDatabaseWrapper`
+    :return: dict of breakdown names to [number of calls, total time]
+    :rtype: dict
+    """
+    stats = getattr(conn, "_speedinfo_stats", None)
+
+    if stats is not None:
+        return stats
+
+    stats = conn._speedinfo_stats = dict((name, [0, 0.0]) for name in CONNECTION_BREAKDOWNS)
+    conn.connect = timed(conn.connect, stats["db_connect"])
+    set_autocommit = conn.set_autocommit
+    transaction = {"start_time": None, "under_autocommit": False}
+
+    def finish_transaction():
+        if transaction["start_time"] is not None:
+            stats["db_transaction"][0] += 1
+            stats["db_transaction"][1] += default_timer() - transaction["start_time"]
+            transaction["start_time"] = None
+            transaction["under_autocommit"] = False
+
+    def finishes_transaction_under_autocommit(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if transaction["under_autocommit"]:
+                    finish_transaction()
+
+        return wrapper
+
+    @wraps(set_autocommit)
+    def set_autocommit_wrapper(autocommit, *args, **kwargs):
+        if not autocommit and conn.autocommit and conn.connection is not None:
+            transaction["start_time"] = default_timer()
+
+        result = set_autocommit(autocommit, *args, **kwargs)
+
+        if autocommit:
+            finish_transaction()
+
+        return result
+
+    conn.set_autocommit = set_autocommit_wrapper
+    conn.commit = finishes_transaction_under_autocommit(timed(conn.commit, stats["db_commit"]))
+
+    if hasattr(conn, "rollback"):
+        conn.rollback = finishes_transaction_under_autocommit(conn.rollback)
+
+    # Atomic blocks of Django < 2.0 start SQLite transactions without disabling autocommit
+    start_transaction = getattr(conn, "_start_transaction_under_autocommit", None)
+
+    if start_transaction is not None:
+        @wraps(start_transaction)
+        def start_transaction_wrapper(*args, **kwargs):
+            # Django >= 2.0 calls the method from set_autocommit, the transaction has been started already
+            if transaction["start_time"] is None:
+                transaction["start_time"] = default_timer()
+                transaction["under_autocommit"] = True
+
+            return start_transaction(*args, **kwargs)
+
+        conn._start_transaction_under_autocommit = start_transaction_wrapper
+
+    return stats
@@ -0,0 +1,25 @@
+# coding: utf-8
+
+from abc import ABCMeta, abstractmethod
+
+
+class AbstractDimension(object):
+    """
+    Base class for user-defined aggregation dimensions. Dimension splits
+    the calls and time of the view by the value extracted from the request
+    or response, e.g. the matched URL route, a tenant or an API version.
+    Name of the dimension is used as a Prometheus label name, so it should
+    consist of latin letters, digits and underscores.
+    """
+    __metaclass__ = ABCMeta
+
+    name = None
+
+    @abstractmethod
+    def get_value(self, request, response):
+        """
+        :type request: :class:`django.http.HttpRequest`
+        :type response: :class:`django.http.HttpResponse`
+        :return: dimension value or None if the request has no value in this dimension
+        :rtype: str or None
+        """
@@ -0,0 +1,49 @@
+# coding: utf-8
+
+from speedinfo.conf import speedinfo_settings
+from speedinfo.dimensions.base import AbstractDimension
+from speedinfo.utils import resolve_request
+
+
+class RouteDimension(AbstractDimension):
+    """
+    Matched URL pattern, e.g. 'articles/<int:year>/'. Useful for the views
+    which serve several URL patterns. Django < 2.2 doesn't expose the matched
+    pattern, namespaced URL name (e.g. 'blog:article-archive') is used instead.
+    """
+    name = "route"
+
+    def get_value(self, request, response):
+        match = resolve_request(request)
+
+        if not match:
+            return None
+
+        # ResolverMatch.route is available since Django 2.2
+        return getattr(match, "route", None) or match.view_name
+
+
+class ReleaseDimension(AbstractDimension):
+    """
+    Release tag of the application set in SPEEDINFO_RELEASE,
+    e.g. the version number or commit hash of the deployed code.
+    """
+    name = "release"
+
+    def get_value(self, request, response):
+        return speedinfo_settings.SPEEDINFO_RELEASE
+
+
+class HeaderDimension(AbstractDimension):
+    """
+    Value of the request header. Subclass it to set the dimension
+    name and the header key in `request.META` format::
+
+        class APIVersionDimension(HeaderDimension):
+            name = "api_version"
+            header = "HTTP_X_API_VERSION"
+    """
+    header = None
+
+    def get_value(self, request, response):
+        return request.META.get(self.header) or None
@@ -0,0 +1,82 @@
+# coding: utf-8
+
+import threading
+
+from speedinfo.conf import speedinfo_settings
+from speedinfo.utils import import_class
+
+# Breakdown names of the dimensions are prefixed to avoid clashes with the built-in ones
+BREAKDOWN_PREFIX = "dimension."
+
+# Value which replaces the new values of the dimension over the cardinality limit
+OTHER_VALUE = "other"
+
+# Maximum length of the dimension value
+MAX_VALUE_LENGTH = 255
+
+
+class DimensionsDispatcher(object):
+    """
+    Extracts the values of the dimensions listed in SPEEDINFO_DIMENSIONS
+    from the profiled request. Number of distinct values of each dimension
+    is limited by SPEEDINFO_DIMENSION_MAX_VALUES in the current process,
+    the values beyond the limit are counted as 'other'.
+    """
+    def __init__(self):
+        self.dimensions = None
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def import_dimensions(self):
+        self.dimensions = []
+
+        for module_path in speedinfo_settings.SPEEDINFO_DIMENSIONS:
+            self.dimensions.append(import_class(module_path)())
+
+    def get_dimensions(self):
+        if (self.dimensions is None) or speedinfo_settings.SPEEDINFO_TESTS:
+            self.import_dimensions()
+
+        return self.dimensions
+
+    def limit_value(self, name, value):
+        """Replaces the value with 'other' once the dimension reaches the cardinality limit.
+
+        :param str name: Dimension name
+        :param str value: Dimension value
+        :rtype: str
+        """
+        with self.lock:
+            values = self.values.setdefault(name, set())
+
+            if value in values:
+                return value
+
+            if len(values) >= speedinfo_settings.SPEEDINFO_DIMENSION_MAX_VALUES:
+                return OTHER_VALUE
+
+            values.add(value)
+            return value
+
+    def get_breakdowns(self, request, response, execution_time):
+        """Returns the calls and time of the request broken down by the dimensions.
+
+        :type request: :class:`django.http.HttpRequest`
+        :type response: :class:`django.http.HttpResponse`
+        :param float execution_time: View execution time
+        :return: breakdowns in the form of {breakdown name: {value: (1, execution time)}}
+        :rtype: dict
+        """
+        breakdowns = {}
+
+        for dimension in self.get_dimensions():
+            value = dimension.get_value(request, response)
+
+            if value is not None:
+                value = self.limit_value(dimension.name, "{}".format(value)[:MAX_VALUE_LENGTH])
+                breakdowns[BREAKDOWN_PREFIX + dimension.name] = {value: (1, execution_time)}
+
+        return breakdowns
+
+
+dimensions_dispatcher = DimensionsDispatcher()
@@ -0,0 +1,80 @@
+# coding: utf-8
+
+from django import forms
+
+
+class SamplingRulesForm(forms.Form):
+    """
+    Edits sampling rules of the profiler. Each line of the rules contains
+    a target and a sampling rate separated by whitespace. Target is a full view name
+    (e.g. 'app.views.index'), a URL namespace followed by colon (e.g. 'admin:')
+    or '*' for all other views.
+    """
+    rules = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={"rows": 15, "cols": 80}),
+        help_text=(
+            "One rule per line: target and sampling rate from 0 (profiling is disabled) "
+            "to 1 (all requests are profiled), e.g. 'admin: 0' or 'app.views.index 0.1'."
+        ),
+    )
+
+    @staticmethod
+    def format_rules(rules):
+        """Formats sampling rules as text.
+
+        :param dict rules: sampling rules
+        :rtype: str
+        """
+        return "\n".join("{} {:g}".format(target, rate) for target, rate in sorted(rules.items()))
+
+    def clean_rules(self):
+        """Parses and validates sampling rules.
+
+        :return: dict of target to sampling rate
+        :rtype: dict
+        """
+        rules = {}
+
+        for line_number, line in enumerate(self.cleaned_data["rules"].splitlines(), 1):
+            line = line.strip()
+
+            if not line:
+                continue
+
+            try:
+                target, rate = line.split()
+                rate = float(rate)
+            except ValueError:
+                raise forms.ValidationError("Line {}: expected target and sampling rate.".format(line_number))
+
+            if not 0 <= rate <= 1:
+                raise forms.ValidationError("Line {}: sampling rate must be between 0 and 1.".format(line_number))
+
+            rules[target] = rate
+
+        return rules
+
+
+class ProfilingSessionForm(forms.Form):
+    """
+    Starts the named profiling session limited by the duration
+    and/or the number of profiled requests.
+    """
+    name = forms.CharField(max_length=255)
+    duration = forms.IntegerField(
+        required=False, min_value=1,
+        help_text="Session duration in minutes. Leave empty for unlimited duration.",
+    )
+    max_requests = forms.IntegerField(
+        required=False, min_value=1,
+        help_text="Maximum number of profiled requests. Leave empty for unlimited number of requests.",
+    )
+
+    def clean(self):
+        cleaned_data = super(ProfilingSessionForm, self).clean()
+
+        if not (cleaned_data.get("duration") or cleaned_data.get("max_requests")):
+            raise forms.ValidationError("Session must be limited by the duration or the number of requests.")
+
+        return cleaned_data
@@ -0,0 +1,36 @@
+# coding: utf-8
+
+import gc
+from timeit import default_timer
+
+from speedinfo.monitor import ContextStackMonitor
+
+
+class GCMonitor(ContextStackMonitor):
+    """
+    Measures garbage collections triggered in the profiled code using `gc.callbacks`
+    (Python 3.3+). Collections are counted by generation, e.g. 'gen2'.
+    """
+    @property
+    def is_supported(self):
+        return hasattr(gc, "callbacks")
+
+    def install(self):
+        with self.lock:
+            if not self.is_installed and self.is_supported:
+                gc.callbacks.append(self.callback)
+                self.is_installed = True
+
+    def callback(self, phase, info):
+        if not self.stack:
+            return
+
+        if phase == "start":
+            self.local.start_time = default_timer()
+        elif getattr(self.local, "start_time", None) is not None:
+            pause = default_timer() - self.local.start_time
+            self.local.start_time = None
+            self.record("gen{}".format(info["generation"]), pause)
+
+
+gc_monitor = GCMonitor()
@@ -0,0 +1,54 @@
+# coding: utf-8
+
+from functools import wraps
+from timeit import default_timer
+
+from speedinfo.monitor import ContextStackMonitor
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection  # Python 2
+
+
+class HTTPMonitor(ContextStackMonitor):
+    """
+    Measures outbound HTTP requests made in the profiled code by the standard
+    library HTTP client, which is used by `urllib`, `urllib3` and `requests` as well.
+    Request time is measured from sending the request line to receiving
+    the response headers, reading of the response body is not included.
+    Requests are counted by host and port, e.g. 'api.example.com:443'.
+    """
+    def install(self):
+        with self.lock:
+            if not self.is_installed:
+                HTTPConnection.putrequest = self.wrap_putrequest(HTTPConnection.putrequest)
+                HTTPConnection.getresponse = self.wrap_getresponse(HTTPConnection.getresponse)
+                self.is_installed = True
+
+    def wrap_putrequest(self, putrequest):
+        @wraps(putrequest)
+        def wrapper(conn, *args, **kwargs):
+            conn._speedinfo_start_time = default_timer()
+            return putrequest(conn, *args, **kwargs)
+
+        return wrapper
+
+    def wrap_getresponse(self, getresponse):
+        monitor = self
+
+        @wraps(getresponse)
+        def wrapper(conn, *args, **kwargs):
+            try:
+                return getresponse(conn, *args, **kwargs)
+            finally:
+                start_time = getattr(conn, "_speedinfo_start_time", None)
+                conn._speedinfo_start_time = None
+
+                if start_time is not None:
+                    monitor.record("{}:{}".format(conn.host, conn.port), default_timer() - start_time)
+
+        return wrapper
+
+
+http_monitor = HTTPMonitor()
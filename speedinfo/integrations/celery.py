@@ -0,0 +1,31 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+
+from speedinfo.profiling import profile
+
+# Profiled blocks of the running tasks by task id
+active_blocks = {}
+
+
+def task_prerun_handler(task_id=None, task=None, **kwargs):
+    block = profile(task.name, kind="TASK")
+    block.__enter__()
+    active_blocks[task_id] = block
+
+
+def task_postrun_handler(task_id=None, **kwargs):
+    block = active_blocks.pop(task_id, None)
+
+    if block is not None:
+        block.__exit__(None, None, None)
+
+
+def connect_signals():
+    """Connects Celery signal handlers to profile all tasks.
+    Tasks are saved under their names with 'TASK' kind.
+    """
+    from celery.signals import task_postrun, task_prerun
+
+    task_prerun.connect(task_prerun_handler, weak=False, dispatch_uid="speedinfo.task_prerun")
+    task_postrun.connect(task_postrun_handler, weak=False, dispatch_uid="speedinfo.task_postrun")
@@ -0,0 +1,17 @@
+# coding: utf-8
+
+from speedinfo.profiling import profile
+
+
+class ProfiledCommandMixin(object):
+    """
+    Mixin for management commands to profile their execution. Commands are saved
+    under their module names (e.g. 'app.management.commands.rebuild_index')
+    with 'COMMAND' kind::
+
+        class Command(ProfiledCommandMixin, BaseCommand):
+            ...
+    """
+    def execute(self, *args, **options):
+        with profile(self.__class__.__module__, kind="COMMAND"):
+            return super(ProfiledCommandMixin, self).execute(*args, **options)
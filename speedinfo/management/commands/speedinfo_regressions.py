@@ -0,0 +1,51 @@
+# coding: utf-8
+
+from django.core.management.base import BaseCommand, CommandError
+
+from speedinfo import profiler
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares profiling data with the baseline snapshot and exits with non-zero status "
+        "if time or number of SQL queries per call of any view regressed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--freeze", action="store_true",
+            help="Save current profiling data as the baseline snapshot and reset the data.",
+        )
+        # call_command() of Django < 1.10 takes the command name as "name" argument
+        parser.add_argument(
+            "--snapshot-name", dest="snapshot_name", default="Baseline", help="Name of the frozen baseline snapshot.",
+        )
+        parser.add_argument("--baseline", help="Baseline snapshot ID, the configured baseline is used by default.")
+        parser.add_argument("--threshold", type=float, help="Minimal relative increase, e.g. 0.2 for 20%%.")
+        parser.add_argument("--z-score", type=float, help="Minimal z-score of the increase.")
+        parser.add_argument("--min-calls", type=int, help="Minimal number of calls of the view.")
+
+    def handle(self, *args, **options):
+        if options["freeze"]:
+            snapshot_id = profiler.freeze_baseline(options["snapshot_name"])
+            self.stdout.write("Baseline snapshot {} is saved.".format(snapshot_id))
+            return
+
+        regressions = profiler.detect_regressions(
+            options["baseline"], threshold=options["threshold"],
+            z_score=options["z_score"], min_calls=options["min_calls"],
+        )
+
+        if regressions is None:
+            raise CommandError("Baseline snapshot not found.")
+
+        for item in regressions:
+            self.stdout.write("{} {}: {} {:.6f} -> {:.6f} ({})".format(
+                item["view_name"], item["method"], item["metric"], item["baseline_value"], item["value"],
+                "+{:.0%}".format(item["change"]) if item["change"] is not None else "new",
+            ))
+
+        if regressions:
+            raise CommandError("{} regression(s) found.".format(len(regressions)))
+
+        self.stdout.write("No regressions found.")
@@ -9,11 +9,73 @@ class ViewProfilerQuerySet(models.QuerySet):
     """
     Overrides standard QuerySet behaviour to return objects
     from profiler storage. Hack is working only for `all()`,
-    `order_by()` and `count()` methods and was made for integration
-    with Django admin.
+    `order_by()`, `filter_storage()`, slicing, `iterator()` and `count()` methods
+    and was made for integration with Django admin. Filtering, ordering
+    and slicing are passed down to the storage.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ViewProfilerQuerySet, self).__init__(*args, **kwargs)
+        self.storage_filters = {}
+
+    def _clone(self, *args, **kwargs):
+        clone = super(ViewProfilerQuerySet, self)._clone(*args, **kwargs)
+        clone.storage_filters = dict(self.storage_filters)
+        return clone
+
+    def filter_storage(self, **filters):
+        """Returns a new QuerySet with the storage filters applied.
+        See :meth:`speedinfo.storage.base.AbstractStorage.fetch_all` for the list of filters.
+
+        :rtype: :class:`ViewProfilerQuerySet`
+        """
+        clone = self._clone()
+        clone.storage_filters.update(filters)
+        return clone
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            low_mark, high_mark = self.query.low_mark, self.query.high_mark
+            self._result_cache = profiler.storage.fetch_all(
+                self.query.order_by,
+                filters=self.storage_filters,
+                offset=low_mark,
+                limit=None if high_mark is None else high_mark - low_mark,
+            )
+
+    def iterator(self, *args, **kwargs):
+        return profiler.storage.iter_all(self.query.order_by, filters=self.storage_filters)
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+
+        count = max(0, profiler.storage.count(self.storage_filters) - self.query.low_mark)
+
+        if self.query.high_mark is not None:
+            count = min(count, self.query.high_mark - self.query.low_mark)
+
+        return count
+
+
+class SlowRequestQuerySet(models.QuerySet):
+    """
+    Returns slow requests from profiler storage.
+    Works the same way as :class:`ViewProfilerQuerySet`.
+    """
+    def _fetch_all(self):
+        self._result_cache = profiler.storage.fetch_slow_requests(self.query.order_by)
+
+    def count(self):
+        return len(self)
+
+
+class SnapshotQuerySet(models.QuerySet):
+    """
+    Returns snapshots from profiler storage.
+    Works the same way as :class:`ViewProfilerQuerySet`.
     """
     def _fetch_all(self):
-        self._result_cache = profiler.storage.fetch_all(self.query.order_by)
+        self._result_cache = profiler.storage.fetch_snapshots(self.query.order_by)
 
     def count(self):
         return len(self)
@@ -0,0 +1,205 @@
+# coding: utf-8
+
+import os
+
+from speedinfo.dimensions.dispatcher import BREAKDOWN_PREFIX, dimensions_dispatcher
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# List of (metric name, metric type, help text, list of (sample suffix, counter name))
+METRICS = (
+    ("speedinfo_view_calls", "counter", "Number of view calls", (
+        ("_total", "total_calls"),
+    )),
+    ("speedinfo_view_anonymous_calls", "counter", "Number of anonymous view calls", (
+        ("_total", "anon_calls"),
+    )),
+    ("speedinfo_view_cache_hits", "counter", "Number of view responses retrieved from the cache", (
+        ("_total", "cache_hits"),
+    )),
+    ("speedinfo_view_sql_queries", "counter", "Number of SQL queries executed by view", (
+        ("_total", "sql_total_count"),
+    )),
+    ("speedinfo_view_sql_duration_seconds", "counter", "Time spent executing SQL queries by view", (
+        ("_total", "sql_total_time"),
+    )),
+    ("speedinfo_view_duration_seconds", "summary", "View execution time", (
+        ("_count", "total_calls"),
+        ("_sum", "total_time"),
+    )),
+)
+
+
+def escape_label_value(value):
+    """Escapes label value according to the exposition format.
+
+    :param str value: label value
+    :rtype: str
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value):
+    """Formats sample value preserving float precision.
+
+    :rtype: str
+    """
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(value)
+
+
+# List of (breakdown name, label name, list of (metric name, help text, counter position))
+BREAKDOWN_METRICS = (
+    ("sql_alias", "database", (
+        ("speedinfo_view_database_sql_queries", "Number of SQL queries executed by view per database", 0),
+        ("speedinfo_view_database_sql_duration_seconds", "Time spent executing SQL queries by view per database", 1),
+    )),
+    ("status", "status", (
+        ("speedinfo_view_responses", "Number of view responses per status class", 0),
+        ("speedinfo_view_responses_duration_seconds", "Time spent by view per response status class", 1),
+    )),
+    ("exception", "exception", (
+        ("speedinfo_view_exceptions", "Number of exceptions raised by view per exception type", 0),
+        ("speedinfo_view_exceptions_duration_seconds", "Time spent by view per raised exception type", 1),
+    )),
+    ("db_connect", "database", (
+        ("speedinfo_view_database_connections", "Number of database connections established by view", 0),
+        ("speedinfo_view_database_connect_duration_seconds", "Time spent by view establishing connections", 1),
+    )),
+    ("db_transaction", "database", (
+        ("speedinfo_view_database_transactions", "Number of database transactions made by view", 0),
+        ("speedinfo_view_database_transaction_duration_seconds", "Time spent by view in transactions", 1),
+    )),
+    ("db_commit", "database", (
+        ("speedinfo_view_database_commits", "Number of database commits made by view", 0),
+        ("speedinfo_view_database_commit_duration_seconds", "Time spent by view committing transactions", 1),
+    )),
+    ("http", "host", (
+        ("speedinfo_view_http_requests", "Number of outbound HTTP requests made by view per host", 0),
+        ("speedinfo_view_http_duration_seconds", "Time spent by view waiting for HTTP responses per host", 1),
+    )),
+    ("size", "body", (
+        ("speedinfo_view_bodies", "Number of request and response bodies of view with the known size", 0),
+        ("speedinfo_view_body_bytes", "Size of request and response bodies of view", 1),
+    )),
+    ("gc", "generation", (
+        ("speedinfo_view_gc_collections", "Number of garbage collections triggered by view per generation", 0),
+        ("speedinfo_view_gc_duration_seconds", "Time spent in garbage collections triggered by view", 1),
+    )),
+    ("queue", "header", (
+        ("speedinfo_view_queued_requests", "Number of view requests with the known queue time", 0),
+        ("speedinfo_view_queue_duration_seconds", "Time spent by view requests in the queue before processing", 1),
+    )),
+)
+
+
+def get_breakdown_metrics():
+    """Returns the breakdown metrics extended with the metrics
+    of the custom dimensions listed in SPEEDINFO_DIMENSIONS.
+
+    :return: list in the same form as `BREAKDOWN_METRICS`
+    :rtype: list
+    """
+    metrics = list(BREAKDOWN_METRICS)
+
+    for dimension in dimensions_dispatcher.get_dimensions():
+        metrics.append((BREAKDOWN_PREFIX + dimension.name, dimension.name, (
+            ("speedinfo_view_{}_calls".format(dimension.name), "Number of view calls per {}".format(dimension.name), 0),
+            (
+                "speedinfo_view_{}_duration_seconds".format(dimension.name),
+                "Time spent by view per {}".format(dimension.name), 1,
+            ),
+        )))
+
+    return metrics
+
+
+def render_metrics(entries, is_on, openmetrics=True, overhead=None, breakdowns=None, evictions=None):
+    """Renders profiling data in OpenMetrics or Prometheus text exposition format.
+
+    :param entries: raw counters as returned by :meth:`speedinfo.storage.base.AbstractStorage.fetch_counters`
+    :type entries: list[dict]
+    :param bool is_on: profiler state
+    :param bool openmetrics: True to render OpenMetrics format, False for Prometheus text format
+    :param overhead: profiler overhead monitor of the current process
+    :type overhead: :class:`speedinfo.overhead.OverheadMonitor` or None
+    :param breakdowns: counters broken down by dimensions as returned by
+        :meth:`speedinfo.storage.base.AbstractStorage.fetch_breakdowns_by_names`
+    :type breakdowns: dict or None
+    :param evictions: number of entries lost by the storage, see
+        :meth:`speedinfo.storage.base.AbstractStorage.count_evictions`
+    :type evictions: int or None
+    :return: exposition text
+    :rtype: str
+    """
+    labels = [
+        'view="{}",method="{}"'.format(escape_label_value(entry["view_name"]), escape_label_value(entry["method"]))
+        for entry in entries
+    ]
+    lines = [
+        "# HELP speedinfo_profiler_enabled Profiler state",
+        "# TYPE speedinfo_profiler_enabled gauge",
+        "speedinfo_profiler_enabled {}".format(int(bool(is_on))),
+    ]
+
+    if overhead is not None:
+        # Overhead is measured per process, so the samples are labeled by the process id
+        label = 'pid="{}"'.format(os.getpid())
+        total_name = "speedinfo_overhead_seconds" if openmetrics else "speedinfo_overhead_seconds_total"
+        requests_name = "speedinfo_overhead_requests" if openmetrics else "speedinfo_overhead_requests_total"
+
+        lines.extend([
+            "# HELP {} Time spent by the profiler itself".format(total_name),
+            "# TYPE {} counter".format(total_name),
+            "speedinfo_overhead_seconds_total{{{}}} {}".format(label, format_value(overhead.total_overhead)),
+            "# HELP {} Number of requests measured by the profiler".format(requests_name),
+            "# TYPE {} counter".format(requests_name),
+            "speedinfo_overhead_requests_total{{{}}} {}".format(label, format_value(overhead.total_requests)),
+            "# HELP speedinfo_overhead_sampling_rate Sampling rate lowered to fit the overhead budget",
+            "# TYPE speedinfo_overhead_sampling_rate gauge",
+            "speedinfo_overhead_sampling_rate{{{}}} {}".format(label, format_value(overhead.rate)),
+        ])
+
+    if evictions is not None:
+        type_name = "speedinfo_storage_evictions" if openmetrics else "speedinfo_storage_evictions_total"
+
+        lines.extend([
+            "# HELP {} Number of entries evicted from the storage".format(type_name),
+            "# TYPE {} counter".format(type_name),
+            "speedinfo_storage_evictions_total {}".format(format_value(evictions)),
+        ])
+
+    for name, metric_type, help_text, samples in METRICS:
+        # Prometheus text format declares counters with the sample name
+        type_name = name if openmetrics or metric_type != "counter" else name + "_total"
+
+        lines.append("# HELP {} {}".format(type_name, help_text))
+        lines.append("# TYPE {} {}".format(type_name, metric_type))
+
+        for entry, label in zip(entries, labels):
+            for suffix, counter in samples:
+                lines.append("{}{}{{{}}} {}".format(name, suffix, label, format_value(entry[counter])))
+
+    for breakdown_name, label_name, samples in get_breakdown_metrics():
+        breakdown = sorted((breakdowns or {}).get(breakdown_name, {}).items())
+
+        for name, help_text, position in samples:
+            type_name = name if openmetrics else name + "_total"
+
+            lines.append("# HELP {} {}".format(type_name, help_text))
+            lines.append("# TYPE {} counter".format(type_name))
+
+            for (view_name, method), values in breakdown:
+                for value, counters in sorted(values.items()):
+                    lines.append('{}_total{{view="{}",method="{}",{}="{}"}} {}'.format(
+                        name, escape_label_value(view_name), escape_label_value(method),
+                        label_name, escape_label_value(value), format_value(counters[position]),
+                    ))
+
+    if openmetrics:
+        lines.append("# EOF")
+
+    return "\n".join(lines) + "\n"
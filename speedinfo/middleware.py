@@ -1,18 +1,37 @@
 # coding: utf-8
 
+import random
+import time
+import zlib
 from timeit import default_timer
 
-from django.conf import settings
-from django.db import connections
+from django.utils import timezone
 
 from speedinfo import profiler
 from speedinfo.conditions.dispatcher import conditions_dispatcher
+from speedinfo.conditions.sampling import SamplingCondition, TailSamplingCondition, round_weight
 from speedinfo.conf import speedinfo_settings
+from speedinfo.dimensions.dispatcher import dimensions_dispatcher
+from speedinfo.profiling import ProfilingContext
+from speedinfo.utils import (
+    get_exception_name, get_header_name, get_status_class, get_view_name, parse_request_start, resolve_request,
+)
 
-try:
-    from django.urls import resolve, Resolver404  # Django >= 1.10
-except ImportError:
-    from django.core.urlresolvers import resolve, Resolver404
+
+class ProfilingState(object):
+    """
+    Profiling state of the request. It's kept in the request object
+    as the middleware instance is shared by the threads serving the requests.
+    """
+    def __init__(self):
+        self.weight = 0
+        self.is_sampled_out = False
+        self.sampled_out_by = None
+        self.tail_threshold = None
+        self.context = None
+        self.exception = None
+        self.queue_time = None
+        self.overhead = 0
 
 
 class ProfilerMiddleware(object):
@@ -22,10 +41,6 @@ class ProfilerMiddleware(object):
     """
     def __init__(self, get_response=None):
         self.get_response = get_response
-        self.is_active = False
-        self.start_time = 0
-        self.initial_sql_count = 0
-        self.initial_sql_time = 0
 
     def get_view_name(self, request):
         """Returns full view name from request, eg. 'app.module.view_name'.
@@ -35,27 +50,143 @@ class ProfilerMiddleware(object):
         :return: view name or None if name can't be resolved
         :rtype: str or None
         """
+        return get_view_name(request)
+
+    def get_user_id(self, request):
+        """Returns primary key of the authenticated user.
+
+        :type request: :class:`django.http.HttpRequest`
+        :return: user primary key or empty string in case of an anonymous request
+        :rtype: str
+        """
+        user = getattr(request, "user", None)
+
+        if (user is None) or (user.pk is None):
+            return ""
+
+        return str(user.pk)
+
+    def get_query_hash(self, request):
+        """Returns short hash of the query string.
+
+        :type request: :class:`django.http.HttpRequest`
+        :return: query string hash or empty string if there is no query string
+        :rtype: str
+        """
+        query_string = request.META.get("QUERY_STRING", "")
+
+        if not query_string:
+            return ""
+
+        return "{:08x}".format(zlib.crc32(query_string.encode("utf-8")) & 0xffffffff)
+
+    def get_queue_time(self, request, now):
+        """Returns the time the request waited in the proxy or application server queue
+        before Django started to process it. Time is measured from the timestamp
+        set by the proxy in the first of SPEEDINFO_QUEUE_TIME_HEADERS present in the request.
+
+        :type request: :class:`django.http.HttpRequest`
+        :param float now: Unix timestamp of the request processing start
+        :return: header name and queue time in seconds or None if the headers are missing
+        :rtype: tuple(str, float) or None
+        """
+        for key in speedinfo_settings.SPEEDINFO_QUEUE_TIME_HEADERS:
+            value = request.META.get(key)
+
+            if value:
+                start = parse_request_start(value, speedinfo_settings.SPEEDINFO_QUEUE_TIME_UNIT)
+
+                if start is not None:
+                    # Clocks of the proxy and the application hosts may be slightly out of sync
+                    return get_header_name(key), max(now - start, 0)
+
+        return None
+
+    def get_body_sizes(self, request, response):
+        """Returns the sizes of the request and response bodies. Response compressed before
+        it reaches the profiler (e.g. by GZipMiddleware listed after ProfilerMiddleware)
+        is counted separately by the content encoding, e.g. as 'response_gzip'.
+
+        :type request: :class:`django.http.HttpRequest`
+        :type response: :class:`django.http.HttpResponse` or :class:`django.http.StreamingHttpResponse`
+        :return: dict of body kind to (1, size in bytes), bodies of unknown size are omitted
+        :rtype: dict
+        """
+        sizes = {}
+
         try:
-            return resolve(request.path)._func_path
-        except Resolver404:
-            return None
+            sizes["request"] = (1, int(request.META["CONTENT_LENGTH"]))
+        except (KeyError, ValueError):
+            pass
 
-    def can_process_request(self, request):
-        """Checks conditions to start profiling the request
+        try:
+            size = int(response["Content-Length"]) if response.streaming else len(response.content)
+        except (KeyError, ValueError):
+            return sizes
+
+        # The last of the applied encodings, e.g. 'gzip'
+        encoding = response.get("Content-Encoding", "").split(",")[-1].strip().lower()
+        sizes["response_{}".format(encoding) if encoding else "response"] = (1, size)
+
+        return sizes
+
+    def can_process_request(self, request, state):
+        """Checks sampling rules and conditions to start profiling the request.
+        Request rejected by sampling rules or sampling conditions only is still
+        processed if tail sampling is enabled, `is_sampled_out` flag of the state is set in that case.
 
         :type request: :class:`django.http.HttpRequest`
-        :return: True if request can be processed
-        :rtype: bool
+        :param state: Profiling state of the request
+        :type state: :class:`ProfilingState`
+        :return: weight of the request or 0 if request can't be processed
+        :rtype: int
         """
-        ok = profiler.is_on and self.get_view_name(request)
+        if not (profiler.is_on and self.get_view_name(request)):
+            return 0
+
+        weight = 1
+
+        # Sampling rate of the view or URL namespace set in the admin
+        # lowered when the profiler overhead exceeds the budget
+        rate = profiler.get_sampling_rate(self.get_view_name(request), resolve_request(request).namespace)
+        rate *= profiler.overhead.rate
+
+        if rate <= 0:
+            return 0
+        elif rate < 1:
+            if random.random() < rate:
+                weight = round_weight(1.0 / rate)
+            else:
+                state.is_sampled_out = True
 
         for condition in conditions_dispatcher.get_conditions():
-            ok = ok and condition.process_request(request)
+            if isinstance(condition, TailSamplingCondition):
+                state.tail_threshold = condition.threshold
+                continue
 
-            if not ok:
-                break
+            # Rejected request must not affect the state of other sampling conditions
+            if state.is_sampled_out and isinstance(condition, SamplingCondition):
+                continue
 
-        return ok
+            result = condition.process_request(request)
+
+            if not result:
+                if not isinstance(condition, SamplingCondition):
+                    return 0
+
+                state.is_sampled_out = True
+                state.sampled_out_by = condition
+            elif not isinstance(result, bool):
+                weight *= result
+
+        if state.is_sampled_out and (state.tail_threshold is None):
+            return 0
+
+        # Profiling session is stopped once its limits are exceeded
+        if not profiler.check_session():
+            return 0
+
+        return weight
 
     def can_process_response(self, response):
         """Checks conditions to finish profiling the request
@@ -80,19 +211,35 @@ class ProfilerMiddleware(object):
         :return: Response object or None
         :rtype: :class:`django.http.HttpResponse` or None
         """
-        self.is_active = self.can_process_request(request)
+        request_start_time = default_timer()
+        now = time.time()
+
+        # Request is profiled once even if the middleware is listed twice
+        if hasattr(request, "_speedinfo_ctx"):
+            return None
+
+        state = ProfilingState()
+        state.weight = self.can_process_request(request, state)
 
-        if self.is_active:
-            self.initial_sql_count = 0
-            self.initial_sql_time = 0
+        if state.weight > 0:
+            state.queue_time = self.get_queue_time(request, now)
+            state.context = ProfilingContext()
+            state.context.start()
+            state.overhead = state.context.start_time - request_start_time
+            request._speedinfo_ctx = state
 
-            # Force DB connection to debug mode to get SQL time and number of SQL queries
-            for conn in connections.all():
-                conn.force_debug_cursor = True
-                self.initial_sql_count += len(conn.queries)
-                self.initial_sql_time += sum(float(q["time"]) for q in conn.queries)
+    def process_exception(self, request, exception):
+        """Remembers the exception raised by the view. Response is created
+        by Django exception handler and passed to :meth:`process_response`.
+
+        :param request: Request object
+        :type request: :class:`django.http.HttpRequest`
+        :param Exception exception: Exception raised by the view
+        """
+        state = getattr(request, "_speedinfo_ctx", None)
 
-            self.start_time = default_timer()
+        if state is not None:
+            state.exception = exception
 
     def process_response(self, request, response):
         """Aggregates request and response statistics and saves it in profiler data.
@@ -104,20 +251,32 @@ class ProfilerMiddleware(object):
         :return: View response
         :rtype: :class:`django.http.HttpResponse` or :class:`django.http.StreamingHttpResponse`
         """
-        if self.is_active:
-            if self.can_process_response(response):
-                view_execution_time = default_timer() - self.start_time
+        state = getattr(request, "_speedinfo_ctx", None)
+
+        if state is not None:
+            del request._speedinfo_ctx
+            finish_time = default_timer()
+            view_execution_time = finish_time - state.context.start_time
+            weight = state.weight
+
+            # Slow requests rejected by sampling are profiled with weight 1 with tail sampling enabled,
+            # sampled requests keep their weight to represent the skipped ones
+            if state.is_sampled_out:
+                is_slow = (state.tail_threshold is not None) and (view_execution_time >= state.tail_threshold)
+                weight = 1 if is_slow else 0
+
+            if weight and not self.can_process_response(response):
+                weight = 0
 
-                # Calculate the execution time and the number of SQL queries.
-                # Exclude queries made before the call of our middleware (e.g. in SessionMiddleware).
-                sql_count = sum([
-                    len(conn.queries) for conn in connections.all()
-                ]) - self.initial_sql_count
+            # Request profiled by tail sampling must not be represented by the sampled ones
+            if weight and (state.sampled_out_by is not None):
+                state.sampled_out_by.process_tail_sampled(request)
 
-                sql_time = sum([
-                    sum(float(q["time"]) for q in conn.queries)
-                    for conn in connections.all()
-                ]) - self.initial_sql_time
+            if weight:
+                # Calculate the number of SQL queries and SQL time
+                sql_stats = state.context.get_sql_stats_by_alias()
+                sql_count = sum(item[0] for item in sql_stats.values())
+                sql_time = sum(item[1] for item in sql_stats.values())
 
                 # Collects request and response params
                 view_name = self.get_view_name(request)
@@ -131,17 +290,50 @@ class ProfilerMiddleware(object):
                     else:
                         is_anon_call = request.user.is_anonymous
 
+                # Calls and time by response status class and by exception type,
+                # garbage collections, outbound HTTP requests and bodies sizes
+                breakdowns = {
+                    "sql_alias": sql_stats,
+                    "status": {get_status_class(response.status_code): (1, view_execution_time)},
+                    "gc": state.context.get_gc_stats(),
+                    "http": state.context.get_http_stats(),
+                    "size": self.get_body_sizes(request, response),
+                }
+                breakdowns.update(state.context.get_connection_stats())
+
+                if state.exception is not None:
+                    breakdowns["exception"] = {
+                        get_exception_name(type(state.exception)): (1, view_execution_time),
+                    }
+
+                # Number of requests with the known queue time and total queue time
+                if state.queue_time is not None:
+                    header_name, queue_time = state.queue_time
+                    breakdowns["queue"] = {header_name: (1, queue_time)}
+
+                # Calls and time by the custom dimensions, e.g. URL route or tenant
+                breakdowns.update(dimensions_dispatcher.get_breakdowns(request, response, view_execution_time))
+
                 # Saves profiler data
                 profiler.storage.add(
                     view_name=view_name, method=request.method, is_anon_call=is_anon_call, is_cache_hit=is_cache_hit,
                     sql_time=sql_time, sql_count=sql_count, view_execution_time=view_execution_time,
+                    weight=weight, breakdowns=breakdowns,
                 )
 
-            # Disable debug cursor and clear queries log if DEBUG is False
-            if not settings.DEBUG:
-                for conn in connections.all():
-                    conn.force_debug_cursor = False
-                    conn.queries_log.clear()
+                # Saves details of the slow request
+                threshold = speedinfo_settings.SPEEDINFO_SLOW_REQUEST_THRESHOLD
+
+                if (threshold is not None) and (view_execution_time >= threshold):
+                    profiler.storage.add_slow_request(
+                        view_name=view_name, method=request.method, path=request.path,
+                        query_hash=self.get_query_hash(request), user_id=self.get_user_id(request),
+                        status_code=response.status_code, is_cache_hit=is_cache_hit, sql_time=sql_time,
+                        sql_count=sql_count, duration=view_execution_time, created_at=timezone.now(),
+                    )
+
+            state.context.stop()
+            profiler.overhead.record(state.overhead + default_timer() - finish_time, view_execution_time, weight)
 
         return response
 
@@ -2,7 +2,9 @@
 
 from django.db import models
 
-from speedinfo.managers import ViewProfilerQuerySet
+from speedinfo.dimensions.dispatcher import BREAKDOWN_PREFIX
+from speedinfo.managers import SlowRequestQuerySet, SnapshotQuerySet, ViewProfilerQuerySet
+from speedinfo.stats import get_stddev
 
 
 class ViewProfiler(models.Model):
@@ -19,7 +21,19 @@ class ViewProfiler(models.Model):
     sql_total_time = models.FloatField("SQL total time", default=0)
     sql_total_count = models.PositiveIntegerField("SQL total queries count", default=0)
     total_calls = models.PositiveIntegerField("Total calls", default=0)
+    sampled_calls = models.PositiveIntegerField("Sampled calls", default=0)
     total_time = models.FloatField("Total time", default=0)
+    time_min = models.FloatField("Min time", default=0)
+    time_max = models.FloatField("Max time", default=0)
+    time_m2 = models.FloatField("Time sum of squared deviations", default=0)
+    sql_count_min = models.PositiveIntegerField("Min SQL queries count", default=0)
+    sql_count_max = models.PositiveIntegerField("Max SQL queries count", default=0)
+    sql_count_m2 = models.FloatField("SQL queries count sum of squared deviations", default=0)
+    ewma_time_per_call = models.FloatField("Recent time per call", default=0)
+    ewma_sql_count_per_call = models.FloatField("Recent SQL queries per call", default=0)
+    ewma_weight = models.FloatField("Recent calls weight", default=0)
+    ewma_updated_at = models.FloatField("Recent values update timestamp", default=0)
+    time_error = models.FloatField("Total time error", default=0)
 
     objects = ViewProfilerQuerySet.as_manager()
 
@@ -37,6 +51,7 @@ class ViewProfiler(models.Model):
                 extra_fields[field_name] = kwargs.pop(field_name)
 
         super(ViewProfiler, self).__init__(*args, **kwargs)
+        self.breakdowns = extra_fields.pop("breakdowns", None) or {}
 
         # Assign extra fields to the object if the field names
         # do not override existing fields
@@ -92,6 +107,279 @@ class ViewProfiler(models.Model):
         else:
             return 0
 
+    @property
+    def time_stddev(self):
+        """Standard deviation of the execution time.
+
+        :return: execution time standard deviation
+        :rtype: float
+        """
+        return get_stddev(self.total_calls, self.time_m2)
+
+    @property
+    def sql_count_stddev(self):
+        """Standard deviation of SQL queries count.
+
+        :return: SQL queries count standard deviation
+        :rtype: float
+        """
+        return get_stddev(self.total_calls, self.sql_count_m2)
+
+    @property
+    def sql_by_alias(self):
+        """SQL queries count and time by database alias.
+
+        :return: dict of database alias to (count, time) pairs
+        :rtype: dict
+        """
+        return self.breakdowns.get("sql_alias", {})
+
+    @property
+    def sql_by_alias_per_call(self):
+        """SQL queries count and time per call by database alias.
+
+        :return: formatted list of database aliases with the count and time per call,
+            e.g. 'default: 1.0 / 0.0020s, replica: 5.0 / 0.0100s'
+        :rtype: str
+        """
+        if self.total_calls > 0:
+            return ", ".join(
+                "{}: {:.1f} / {:.4f}s".format(alias, count / float(self.total_calls), time / float(self.total_calls))
+                for alias, (count, time) in sorted(self.sql_by_alias.items())
+            )
+        else:
+            return ""
+
+    @property
+    def by_node(self):
+        """Calls and time per call by application node, see :class:`speedinfo.storage.node.storage.NodeStorage`.
+
+        :return: formatted list of nodes with the number of calls and time per call,
+            e.g. 'web1: 120 / 0.0500s, web2: 98 / 0.0700s'
+        :rtype: str
+        """
+        return ", ".join(
+            "{}: {} / {:.4f}s".format(node, calls, time / float(calls) if calls else 0)
+            for node, (calls, time) in sorted(self.breakdowns.get("node", {}).items())
+        )
+
+    @property
+    def by_status(self):
+        """Share of calls and time per call by response status class.
+
+        :return: formatted list of status classes with the share of calls and time per call,
+            e.g. '2xx: 97.5% / 0.0500s, 5xx: 2.5% / 1.2000s'
+        :rtype: str
+        """
+        if self.total_calls > 0:
+            return ", ".join(
+                "{}: {:.1f}% / {:.4f}s".format(
+                    status, 100.0 * calls / self.total_calls, time / float(calls) if calls else 0,
+                )
+                for status, (calls, time) in sorted(self.breakdowns.get("status", {}).items())
+            )
+        else:
+            return ""
+
+    @property
+    def errors_ratio(self):
+        """Ratio of calls responded with server error (5xx) to the total calls.
+
+        :return: percents of server errors
+        :rtype: float
+        """
+        if self.total_calls > 0:
+            return 100.0 * self.breakdowns.get("status", {}).get("5xx", (0, 0))[0] / self.total_calls
+        else:
+            return 0
+
+    @property
+    def exceptions(self):
+        """Number of exceptions and time per call by exception type.
+
+        :return: formatted list of exception types with the number of exceptions and time per call,
+            e.g. 'ValueError: 3 / 0.0100s'
+        :rtype: str
+        """
+        return ", ".join(
+            "{}: {} / {:.4f}s".format(name, calls, time / float(calls) if calls else 0)
+            for name, (calls, time) in sorted(self.breakdowns.get("exception", {}).items())
+        )
+
+    def get_body_size_per_call(self, kinds):
+        """Returns the average size of the bodies of the listed kinds.
+
+        :param kinds: list of body kinds, e.g. ['request']
+        :type kinds: list[str]
+        :rtype: float
+        """
+        sizes = [value for kind, value in self.breakdowns.get("size", {}).items() if kind in kinds]
+        count = sum(item[0] for item in sizes)
+
+        if count > 0:
+            return sum(item[1] for item in sizes) / float(count)
+        else:
+            return 0
+
+    @property
+    def request_size_per_call(self):
+        """Average size of the request body in bytes.
+
+        :rtype: float
+        """
+        return self.get_body_size_per_call(["request"])
+
+    @property
+    def response_size_per_call(self):
+        """Average size of the uncompressed response body in bytes.
+
+        :rtype: float
+        """
+        return self.get_body_size_per_call(["response"])
+
+    @property
+    def compressed_response_size_per_call(self):
+        """Average size of the response body compressed by any encoding (e.g. gzip) in bytes.
+
+        :rtype: float
+        """
+        return self.get_body_size_per_call([
+            kind for kind in self.breakdowns.get("size", {}) if kind.startswith("response_")
+        ])
+
+    @property
+    def response_total_size(self):
+        """Total size of the response bodies in bytes as sent by the view.
+
+        :rtype: float
+        """
+        return sum(value[1] for kind, value in self.breakdowns.get("size", {}).items() if kind.startswith("response"))
+
+    @property
+    def http_time_ratio(self):
+        """Ratio of the time spent waiting for outbound HTTP responses to the total time,
+        see SPEEDINFO_PROFILE_HTTP.
+
+        :return: percents of the outbound HTTP requests time
+        :rtype: float
+        """
+        if self.total_time > 0:
+            return 100.0 * sum(item[1] for item in self.breakdowns.get("http", {}).values()) / self.total_time
+        else:
+            return 0
+
+    @property
+    def http_by_host_per_call(self):
+        """Outbound HTTP requests count and time per call by host.
+
+        :return: formatted list of hosts with the count and time per call,
+            e.g. 'api.example.com:443: 2.0 / 0.0800s'
+        :rtype: str
+        """
+        if self.total_calls > 0:
+            return ", ".join(
+                "{}: {:.1f} / {:.4f}s".format(host, count / float(self.total_calls), time / float(self.total_calls))
+                for host, (count, time) in sorted(self.breakdowns.get("http", {}).items())
+            )
+        else:
+            return ""
+
+    def get_breakdown_time_per_call(self, name):
+        """Returns the time of the breakdown summed up by all values per call of the view.
+
+        :param str name: Breakdown name
+        :rtype: float
+        """
+        if self.total_calls > 0:
+            return sum(item[1] for item in self.breakdowns.get(name, {}).values()) / float(self.total_calls)
+        else:
+            return 0
+
+    @property
+    def connect_time_per_call(self):
+        """Time spent establishing database connections per call, see SPEEDINFO_PROFILE_CONNECTIONS.
+
+        :rtype: float
+        """
+        return self.get_breakdown_time_per_call("db_connect")
+
+    @property
+    def transaction_time_per_call(self):
+        """Time spent in database transactions (including commits) per call.
+
+        :rtype: float
+        """
+        return self.get_breakdown_time_per_call("db_transaction")
+
+    @property
+    def commit_time_per_call(self):
+        """Time spent committing database transactions per call.
+
+        :rtype: float
+        """
+        return self.get_breakdown_time_per_call("db_commit")
+
+    @property
+    def gc_pauses(self):
+        """Number of garbage collections and average pause time by generation, see SPEEDINFO_PROFILE_GC.
+
+        :return: formatted list of generations with the number of collections and pause time per collection,
+            e.g. 'gen0: 120 / 0.0002s, gen2: 3 / 0.0400s'
+        :rtype: str
+        """
+        return ", ".join(
+            "{}: {} / {:.4f}s".format(generation, count, time / float(count) if count else 0)
+            for generation, (count, time) in sorted(self.breakdowns.get("gc", {}).items())
+        )
+
+    @property
+    def gc_time_ratio(self):
+        """Ratio of the time spent in garbage collections to the total time.
+
+        :return: percents of the garbage collection time
+        :rtype: float
+        """
+        if self.total_time > 0:
+            return 100.0 * sum(item[1] for item in self.breakdowns.get("gc", {}).values()) / self.total_time
+        else:
+            return 0
+
+    @property
+    def queue_time_per_call(self):
+        """Average time the requests waited in the proxy or application server queue,
+        see SPEEDINFO_QUEUE_TIME_HEADERS.
+
+        :return: queue time per call of the requests with the known queue time, 0 if there are no such requests
+        :rtype: float
+        """
+        calls = sum(item[0] for item in self.breakdowns.get("queue", {}).values())
+        total_time = sum(item[1] for item in self.breakdowns.get("queue", {}).values())
+
+        if calls > 0:
+            return total_time / float(calls)
+        else:
+            return 0
+
+    @property
+    def dimensions(self):
+        """Share of calls and time per call by the values of the custom dimensions (SPEEDINFO_DIMENSIONS).
+
+        :return: formatted list of dimension values with the share of calls and time per call,
+            e.g. 'route=articles/<int:year>/: 75.0% / 0.0500s, route=articles/: 25.0% / 0.0200s'
+        :rtype: str
+        """
+        if self.total_calls > 0:
+            return ", ".join(
+                "{}={}: {:.1f}% / {:.4f}s".format(
+                    name[len(BREAKDOWN_PREFIX):], value,
+                    100.0 * calls / self.total_calls, time / float(calls) if calls else 0,
+                )
+                for name, values in sorted(self.breakdowns.items()) if name.startswith(BREAKDOWN_PREFIX)
+                for value, (calls, time) in sorted(values.items())
+            )
+        else:
+            return ""
+
     @property
     def time_per_call(self):
         """Time per call.
@@ -103,3 +391,49 @@ class ViewProfiler(models.Model):
             return self.total_time / float(self.total_calls)
         else:
             return 0
+
+
+class SlowRequest(models.Model):
+    """
+    Details of the individual request which execution time exceeded
+    SPEEDINFO_SLOW_REQUEST_THRESHOLD. Like :class:`ViewProfiler` model
+    doesn't have associated table in the database.
+    """
+    view_name = models.CharField("View name", max_length=255)
+    method = models.CharField("HTTP method", max_length=8)
+    path = models.CharField("Path", max_length=255)
+    query_hash = models.CharField("Query string hash", max_length=8, blank=True)
+    user_id = models.CharField("User ID", max_length=64, blank=True)
+    status_code = models.PositiveIntegerField("Status code", default=0)
+    is_cache_hit = models.BooleanField("Cache hit", default=False)
+    sql_count = models.PositiveIntegerField("SQL queries count", default=0)
+    sql_time = models.FloatField("SQL time", default=0)
+    duration = models.FloatField("Duration", default=0)
+    created_at = models.DateTimeField("Time")
+
+    objects = SlowRequestQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = "Slow requests"
+        managed = False
+
+
+class Snapshot(models.Model):
+    """
+    Named copy of the profiling data saved at the end of the profiling
+    session. Like :class:`ViewProfiler` model doesn't have associated
+    table in the database.
+    """
+    id = models.CharField("ID", max_length=32, primary_key=True)
+    name = models.CharField("Name", max_length=255)
+    started_at = models.DateTimeField("Started at")
+    finished_at = models.DateTimeField("Finished at")
+
+    objects = SnapshotQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = "Snapshots"
+        managed = False
+
+    def __str__(self):
+        return self.name
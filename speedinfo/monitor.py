@@ -0,0 +1,60 @@
+# coding: utf-8
+
+import threading
+from abc import ABCMeta, abstractmethod
+
+
+class ContextStackMonitor(object):
+    """
+    Base class for the monitors which count events (e.g. garbage collections or
+    outbound HTTP requests) and their time in the profiled code. Events are attributed
+    to the profiling contexts active in the thread where they happened, nested
+    contexts get the events as well. Subclasses install the hooks calling :meth:`record`.
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.is_installed = False
+
+    @abstractmethod
+    def install(self):
+        """Installs the hooks once per process."""
+
+    @property
+    def stack(self):
+        """Stats of the profiling contexts active in the current thread.
+
+        :rtype: list[dict]
+        """
+        return getattr(self.local, "stack", None) or []
+
+    def record(self, key, duration):
+        """Counts the event in all active profiling contexts of the current thread.
+
+        :param str key: Key to count the event by, e.g. garbage collector generation
+        :param float duration: Event time
+        """
+        for stats in self.stack:
+            counters = stats.setdefault(key, [0, 0.0])
+            counters[0] += 1
+            counters[1] += duration
+
+    def start(self):
+        """Starts counting events in the current thread.
+
+        :return: dict to be updated with the number of events and time by key
+        :rtype: dict
+        """
+        self.install()
+        stats = {}
+        self.local.stack = self.stack + [stats]
+        return stats
+
+    def stop(self, stats):
+        """Stops counting events to the dict returned by :meth:`start`.
+
+        :param dict stats: Events stats
+        """
+        self.local.stack = [item for item in self.stack if item is not stats]
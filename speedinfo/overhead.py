@@ -0,0 +1,81 @@
+# coding: utf-8
+
+import threading
+from timeit import default_timer
+
+from speedinfo.conf import speedinfo_settings
+
+
+class OverheadMonitor(object):
+    """
+    Measures time spent by the profiler itself (condition checks, SQL accounting
+    and saving of profiling data) in the current process and lowers the sampling
+    rate when the overhead exceeds the budget. Budget is set as a fraction
+    of the request time (SPEEDINFO_OVERHEAD_BUDGET_RATIO) and/or as an average
+    time per request in seconds (SPEEDINFO_OVERHEAD_BUDGET_TIME). Rate is adjusted
+    every SPEEDINFO_OVERHEAD_WINDOW seconds and never falls below SPEEDINFO_OVERHEAD_MIN_RATE.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate = 1.0
+        self.total_overhead = 0.0
+        self.total_requests = 0
+        self.reset_window(default_timer())
+
+    def reset_window(self, now):
+        self.window_start = now
+        self.window_overhead = 0.0
+        self.window_time = 0.0
+        self.window_weight = 0
+
+    def record(self, overhead, duration, weight):
+        """Records the overhead of the profiled request.
+
+        :param float overhead: Time spent by the profiler
+        :param float duration: View execution time
+        :param int weight: Number of requests represented by the request, 0 if the request
+            is represented by the other ones (e.g. it was rejected by sampling and timed for tail sampling)
+        """
+        now = default_timer()
+
+        with self.lock:
+            self.total_overhead += overhead
+            self.total_requests += 1
+            self.window_overhead += overhead
+            self.window_time += duration * weight
+            self.window_weight += weight
+
+            if now - self.window_start >= speedinfo_settings.SPEEDINFO_OVERHEAD_WINDOW:
+                self.adjust_rate()
+                self.reset_window(now)
+
+    def get_load(self):
+        """Returns the overhead of the current window relative to the budget.
+        Requests rejected by sampling are represented by the weights of the profiled ones.
+
+        :return: overhead to budget ratio, 0 if the budget is not set
+        :rtype: float
+        """
+        budget_ratio = speedinfo_settings.SPEEDINFO_OVERHEAD_BUDGET_RATIO
+        budget_time = speedinfo_settings.SPEEDINFO_OVERHEAD_BUDGET_TIME
+        load = 0
+
+        if budget_ratio and self.window_time:
+            load = max(load, self.window_overhead / self.window_time / budget_ratio)
+
+        if budget_time and self.window_weight:
+            load = max(load, self.window_overhead / self.window_weight / budget_time)
+
+        return load
+
+    def adjust_rate(self):
+        """Lowers the rate proportionally to the budget excess. Overhead
+        is proportional to the rate, so the next window fits the budget.
+        Rate is restored gradually when the overhead is well below the budget.
+        """
+        load = self.get_load()
+
+        if load > 1:
+            self.rate = max(speedinfo_settings.SPEEDINFO_OVERHEAD_MIN_RATE, self.rate / load)
+        elif load < 0.5:
+            self.rate = min(1.0, self.rate * 2)
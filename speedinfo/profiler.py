@@ -1,8 +1,16 @@
 # coding: utf-8
 
+import uuid
+from datetime import timedelta
+from timeit import default_timer
+
 from django.core.cache import cache
+from django.utils import timezone
 
 from speedinfo.conf import speedinfo_settings
+from speedinfo.overhead import OverheadMonitor
+from speedinfo.snapshots import detect_regressions
+from speedinfo.storage.base import upgrade_storage_class
 from speedinfo.utils import import_class
 
 
@@ -11,9 +19,15 @@ class Profiler(object):
     Used to store profiler state and storage.
     """
     PROFILER_STATE_CACHE_KEY = "speedinfo.profiler.is_on"
+    PROFILER_CONFIG_CACHE_KEY = "speedinfo.profiler.config"
+    PROFILER_SESSION_REQUESTS_CACHE_KEY = "speedinfo.profiler.session.requests:{}"
+    PROFILER_SESSION_STOPPED_CACHE_KEY = "speedinfo.profiler.session.stopped:{}"
 
     def __init__(self):
         self._storage = None
+        self._config = None
+        self._config_expires_at = 0
+        self.overhead = OverheadMonitor()
 
     @property
     def is_on(self):
@@ -32,6 +46,227 @@ class Profiler(object):
         """
         cache.set(self.PROFILER_STATE_CACHE_KEY, value, None)
 
+    @property
+    def config(self):
+        """Returns profiler config shared between workers. Config is cached
+        in the process memory and refreshed every SPEEDINFO_CONFIG_REFRESH_INTERVAL seconds.
+
+        :return: profiler config
+        :rtype: dict
+        """
+        now = default_timer()
+
+        if (self._config is None) or (now >= self._config_expires_at) or speedinfo_settings.SPEEDINFO_TESTS:
+            self._config = cache.get(self.PROFILER_CONFIG_CACHE_KEY) or {}
+            self._config_expires_at = now + speedinfo_settings.SPEEDINFO_CONFIG_REFRESH_INTERVAL
+
+        return self._config
+
+    @config.setter
+    def config(self, value):
+        """Sets profiler config.
+
+        :param dict value: Config value
+        """
+        cache.set(self.PROFILER_CONFIG_CACHE_KEY, value, None)
+        self._config = value
+
+    @property
+    def sampling_rules(self):
+        """Returns sampling rates of the views and URL namespaces.
+
+        :return: dict of view name or URL namespace followed by colon (e.g. 'admin:') to sampling rate
+        :rtype: dict
+        """
+        return self.config.get("sampling_rules", {})
+
+    @sampling_rules.setter
+    def sampling_rules(self, value):
+        """Sets sampling rates of the views and URL namespaces.
+
+        :param dict value: Sampling rules
+        """
+        self.config = dict(self.config, sampling_rules=value)
+
+    def get_sampling_rate(self, view_name, namespace=""):
+        """Returns sampling rate of the view. Rule for the view name takes precedence
+        over the rules for URL namespaces, the most nested namespace wins. Rule '*'
+        applies to all other views.
+
+        :param str view_name: Full view name
+        :param str namespace: URL namespace of the view (e.g. 'admin' or 'api:v1')
+        :return: sampling rate from 0 (profiling is disabled) to 1 (all requests are profiled)
+        :rtype: float
+        """
+        rules = self.sampling_rules
+
+        if view_name in rules:
+            return rules[view_name]
+
+        namespace = namespace.split(":") if namespace else []
+
+        for i in range(len(namespace), 0, -1):
+            target = ":".join(namespace[:i]) + ":"
+
+            if target in rules:
+                return rules[target]
+
+        return rules.get("*", 1.0)
+
+    @property
+    def session(self):
+        """Returns the active profiling session.
+
+        :return: dict with `id`, `name`, `started_at`, `duration` and `max_requests` keys
+            or None if there is no active session
+        :rtype: dict or None
+        """
+        return self.config.get("session")
+
+    def start_session(self, name, duration=None, max_requests=None):
+        """Starts the named profiling session. Active session is stopped, profiling data
+        is reset and profiler is turned on. Session is stopped automatically after
+        the duration or the number of profiled requests is exceeded.
+
+        :param str name: Session name
+        :param duration: Session duration in seconds
+        :type duration: int or None
+        :param max_requests: Maximum number of profiled requests
+        :type max_requests: int or None
+        """
+        self.stop_session()
+        self.storage.reset()
+
+        session = {
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "started_at": timezone.now(),
+            "duration": duration,
+            "max_requests": max_requests,
+        }
+
+        if max_requests is not None:
+            cache.set(self.PROFILER_SESSION_REQUESTS_CACHE_KEY.format(session["id"]), 0, None)
+
+        self.config = dict(self.config, session=session)
+        self.is_on = True
+
+    def stop_session(self):
+        """Stops the active profiling session, turns off the profiler and saves
+        the profiling data as a snapshot. Session is stopped only once
+        when several workers try to stop it simultaneously.
+
+        :return: stopped session or None if there is no active session
+        :rtype: dict or None
+        """
+        session = self.session
+
+        if session is None:
+            return None
+
+        # Workers may see the stale session until the config is refreshed
+        if cache.add(self.PROFILER_SESSION_STOPPED_CACHE_KEY.format(session["id"]), True, 86400):
+            self.is_on = False
+            self.storage.save_snapshot(session["name"], session["started_at"], timezone.now())
+            cache.delete(self.PROFILER_SESSION_REQUESTS_CACHE_KEY.format(session["id"]))
+
+            config = dict(self.config)
+            config.pop("session", None)
+            self.config = config
+        else:
+            self._config = None
+
+        return session
+
+    def check_session(self, count_request=True):
+        """Checks the limits of the active profiling session and stops it
+        if the limits are exceeded.
+
+        :param bool count_request: True to count the request in the session budget
+        :return: False if the session is over, True if the session is active
+            or there is no active session
+        :rtype: bool
+        """
+        session = self.session
+
+        if session is None:
+            return True
+
+        if session["duration"] is not None:
+            if timezone.now() >= session["started_at"] + timedelta(seconds=session["duration"]):
+                self.stop_session()
+                return False
+
+        if count_request and (session["max_requests"] is not None):
+            key = self.PROFILER_SESSION_REQUESTS_CACHE_KEY.format(session["id"])
+
+            try:
+                requests_count = cache.incr(key)
+            except ValueError:
+                # Counter was evicted from the cache
+                cache.add(key, 0, None)
+                requests_count = cache.incr(key)
+            except TypeError:
+                # Django 1.8 backends wrapped by speedinfo.backends.proxy_cache fail to increment
+                # the value, so it's counted non-atomically and the limit may be slightly exceeded
+                requests_count = (cache.get(key) or 0) + 1
+                cache.set(key, requests_count, None)
+
+            if requests_count > session["max_requests"]:
+                self.stop_session()
+                return False
+
+        return True
+
+    @property
+    def baseline(self):
+        """Returns ID of the baseline snapshot used to detect performance regressions.
+
+        :return: snapshot ID or None if the baseline is not set
+        :rtype: str or None
+        """
+        return self.config.get("baseline")
+
+    @baseline.setter
+    def baseline(self, value):
+        """Sets ID of the baseline snapshot.
+
+        :param value: Snapshot ID
+        :type value: str or None
+        """
+        self.config = dict(self.config, baseline=value)
+
+    def freeze_baseline(self, name):
+        """Saves the current profiling data as the baseline snapshot (e.g. before a deploy)
+        and resets profiling data, so the data collected afterwards is compared with the baseline.
+
+        :param str name: Snapshot name
+        :return: baseline snapshot ID
+        :rtype: str
+        """
+        now = timezone.now()
+        self.baseline = self.storage.save_snapshot(name, now, now)
+        self.storage.reset()
+
+        return self.baseline
+
+    def detect_regressions(self, baseline_id=None, **kwargs):
+        """Compares the current profiling data with the baseline snapshot.
+        See :func:`speedinfo.snapshots.detect_regressions` for the keyword arguments.
+
+        :param baseline_id: Baseline snapshot ID, the configured baseline is used by default
+        :type baseline_id: str or None
+        :return: list of regressions or None if the baseline snapshot is not found
+        :rtype: list[dict] or None
+        """
+        baseline_id = baseline_id or self.baseline
+        baseline = self.storage.fetch_snapshot_counters(baseline_id) if baseline_id else None
+
+        if baseline is None:
+            return None
+
+        return detect_regressions(baseline, self.storage.fetch_counters(), **kwargs)
+
     @property
     def storage(self):
         """Returns profiler storage.
@@ -40,6 +275,6 @@ class Profiler(object):
         :rtype: :class:`speedinfo.storage.base.AbstractStorage`
         """
         if self._storage is None:
-            self._storage = import_class(speedinfo_settings.SPEEDINFO_STORAGE)()
+            self._storage = upgrade_storage_class(import_class(speedinfo_settings.SPEEDINFO_STORAGE))()
 
         return self._storage
@@ -0,0 +1,227 @@
+# coding: utf-8
+
+import random
+from functools import wraps
+from timeit import default_timer
+
+from django.conf import settings
+from django.db import connections
+
+from speedinfo import profiler
+from speedinfo.conditions.sampling import round_weight
+from speedinfo.conf import speedinfo_settings
+from speedinfo.db_monitor import get_query_stats, instrument_connection, instrument_queries
+from speedinfo.gc_monitor import gc_monitor
+from speedinfo.http_monitor import http_monitor
+from speedinfo.utils import get_exception_name
+
+
+class ProfilingContext(object):
+    """
+    Measures execution time and SQL queries of the code block.
+    Contexts can be nested, e.g. a profiled code block inside a profiled view.
+    """
+    def __init__(self):
+        self.start_time = 0
+        self.initial_sql_stats = {}
+        self.debug_cursors = {}
+        self.initial_connection_stats = {}
+        self.gc_stats = None
+        self.http_stats = None
+
+    def start(self):
+        # Exclude queries made before the start (e.g. in SessionMiddleware)
+        for conn in connections.all():
+            if instrument_queries(conn) is None:
+                # Force DB connection to debug mode to get SQL time and number of SQL queries
+                # from the queries log, since execute wrappers are not supported before Django 2.0
+                self.debug_cursors[conn.alias] = conn.force_debug_cursor
+                conn.force_debug_cursor = True
+
+            self.initial_sql_stats[conn.alias] = get_query_stats(conn)
+
+            if speedinfo_settings.SPEEDINFO_PROFILE_CONNECTIONS:
+                self.initial_connection_stats[conn.alias] = dict(
+                    (name, tuple(counters)) for name, counters in instrument_connection(conn).items()
+                )
+
+        if speedinfo_settings.SPEEDINFO_PROFILE_GC:
+            self.gc_stats = gc_monitor.start()
+
+        if speedinfo_settings.SPEEDINFO_PROFILE_HTTP:
+            self.http_stats = http_monitor.start()
+
+        self.start_time = default_timer()
+
+    def get_sql_stats_by_alias(self):
+        """Returns the number of SQL queries and SQL time since the start
+        for each database alias which executed queries.
+
+        :return: dict of database alias to the number of SQL queries and SQL time
+        :rtype: dict
+        """
+        stats = {}
+
+        for conn in connections.all():
+            initial_count, initial_time = self.initial_sql_stats.get(conn.alias, (0, 0))
+            sql_count, sql_time = get_query_stats(conn)
+
+            if sql_count > initial_count:
+                stats[conn.alias] = (sql_count - initial_count, sql_time - initial_time)
+
+        return stats
+
+    def get_sql_stats(self):
+        """Returns the number of SQL queries and SQL time since the start.
+
+        :return: number of SQL queries and SQL time
+        :rtype: tuple(int, float)
+        """
+        stats = self.get_sql_stats_by_alias().values()
+        return sum(item[0] for item in stats), sum(item[1] for item in stats)
+
+    def get_connection_stats(self):
+        """Returns the number and time of the database connections established, transactions
+        and commits since the start by database alias, see SPEEDINFO_PROFILE_CONNECTIONS.
+
+        :return: dict of breakdown names (e.g. 'db_connect') to dict of database alias
+            to the number of calls and time
+        :rtype: dict
+        """
+        stats = {}
+
+        for conn in connections.all():
+            initial_stats = self.initial_connection_stats.get(conn.alias)
+
+            if initial_stats is None:
+                continue
+
+            for name, (count, total_time) in getattr(conn, "_speedinfo_stats", {}).items():
+                initial_count, initial_time = initial_stats[name]
+
+                if count > initial_count:
+                    stats.setdefault(name, {})[conn.alias] = (count - initial_count, total_time - initial_time)
+
+        return stats
+
+    def get_gc_stats(self):
+        """Returns the number of garbage collections and the pause time
+        by generation since the start, see SPEEDINFO_PROFILE_GC.
+
+        :return: dict of generation (e.g. 'gen2') to the number of collections and pause time
+        :rtype: dict
+        """
+        return dict((generation, tuple(counters)) for generation, counters in (self.gc_stats or {}).items())
+
+    def get_http_stats(self):
+        """Returns the number and time of outbound HTTP requests
+        by host since the start, see SPEEDINFO_PROFILE_HTTP.
+
+        :return: dict of host (e.g. 'api.example.com:443') to the number of requests and time
+        :rtype: dict
+        """
+        return dict((host, tuple(counters)) for host, counters in (self.http_stats or {}).items())
+
+    def stop(self):
+        """Disables debug cursor forced by the context and clears queries log if DEBUG is False.
+        Connections forced to debug mode by the outer context are kept as is.
+        """
+        if self.gc_stats is not None:
+            gc_monitor.stop(self.gc_stats)
+
+        if self.http_stats is not None:
+            http_monitor.stop(self.http_stats)
+
+        if not settings.DEBUG:
+            for conn in connections.all():
+                if (conn.alias in self.debug_cursors) and not self.debug_cursors[conn.alias]:
+                    conn.force_debug_cursor = False
+                    conn.queries_log.clear()
+
+
+def get_block_weight(name):
+    """Applies sampling rules and the profiling session limits to the code block.
+
+    :param str name: Code block name
+    :return: weight of the code block or 0 if it shouldn't be profiled
+    :rtype: int
+    """
+    if not profiler.is_on:
+        return 0
+
+    rate = profiler.get_sampling_rate(name) * profiler.overhead.rate
+    weight = 1
+
+    if rate <= 0:
+        return 0
+    elif rate < 1:
+        if random.random() >= rate:
+            return 0
+
+        weight = round_weight(1.0 / rate)
+
+    if not profiler.check_session():
+        return 0
+
+    return weight
+
+
+class profile(object):
+    """
+    Profiles arbitrary code block and saves the data to the profiler storage
+    along with the views. Block kind (e.g. 'TASK' or 'COMMAND') is saved
+    in place of HTTP method. Can be used as a context manager or decorator::
+
+        with profile("app.reports.build"):
+            ...
+
+        @profile("app.tasks.send_email", kind="TASK")
+        def send_email():
+            ...
+    """
+    def __init__(self, name, kind="BLOCK"):
+        self.name = name
+        self.kind = kind
+        self.weight = 0
+        self.context = None
+
+    def __enter__(self):
+        self.weight = get_block_weight(self.name)
+
+        if self.weight:
+            self.context = ProfilingContext()
+            self.context.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.weight:
+            execution_time = default_timer() - self.context.start_time
+            sql_stats = self.context.get_sql_stats_by_alias()
+            breakdowns = {
+                "sql_alias": sql_stats,
+                "gc": self.context.get_gc_stats(),
+                "http": self.context.get_http_stats(),
+            }
+            breakdowns.update(self.context.get_connection_stats())
+            self.context.stop()
+
+            if exc_type is not None:
+                breakdowns["exception"] = {get_exception_name(exc_type): (1, execution_time)}
+
+            profiler.storage.add(
+                view_name=self.name, method=self.kind, is_anon_call=False, is_cache_hit=False,
+                sql_time=sum(item[1] for item in sql_stats.values()),
+                sql_count=sum(item[0] for item in sql_stats.values()),
+                view_execution_time=execution_time, weight=self.weight,
+                breakdowns=breakdowns,
+            )
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # New instance keeps the decorated function reentrant and thread-safe
+            with profile(self.name, self.kind):
+                return func(*args, **kwargs)
+
+        return wrapper
@@ -0,0 +1,174 @@
+# coding: utf-8
+
+import math
+
+from speedinfo.conf import speedinfo_settings
+from speedinfo.stats import get_stddev
+
+# Metric name, counter field and the sum of squared deviations field
+REGRESSION_METRICS = (
+    ("time_per_call", "total_time", "time_m2"),
+    ("sql_count_per_call", "sql_total_count", "sql_count_m2"),
+)
+
+
+def get_time_per_call(entry):
+    """Returns time per call of the raw counters entry.
+
+    :param dict entry: raw counters
+    :rtype: float
+    """
+    if entry["total_calls"] > 0:
+        return entry["total_time"] / float(entry["total_calls"])
+    else:
+        return 0
+
+
+def compare_counters(baseline, counters):
+    """Compares profiling data with the baseline view by view.
+
+    :param baseline: raw counters of the baseline as returned by
+        :meth:`speedinfo.storage.base.AbstractStorage.fetch_counters`
+    :type baseline: list[dict]
+    :param counters: raw counters to compare with the baseline
+    :type counters: list[dict]
+    :return: list of dicts with `view_name`, `method`, `baseline_calls`, `calls`,
+        `baseline_time_per_call`, `time_per_call` and `change` keys sorted by change
+        in descending order. Change is a relative change of the time per call
+        or None if the view is missing in one of the datasets.
+    :rtype: list[dict]
+    """
+    baseline = dict(((entry["view_name"], entry["method"]), entry) for entry in baseline)
+    counters = dict(((entry["view_name"], entry["method"]), entry) for entry in counters)
+    results = []
+
+    for key in set(baseline) | set(counters):
+        baseline_entry = baseline.get(key)
+        entry = counters.get(key)
+        baseline_time_per_call = get_time_per_call(baseline_entry) if baseline_entry else None
+        time_per_call = get_time_per_call(entry) if entry else None
+
+        if baseline_time_per_call and (time_per_call is not None):
+            change = time_per_call / baseline_time_per_call - 1
+        else:
+            change = None
+
+        results.append({
+            "view_name": key[0],
+            "method": key[1],
+            "baseline_calls": baseline_entry["total_calls"] if baseline_entry else None,
+            "calls": entry["total_calls"] if entry else None,
+            "baseline_time_per_call": baseline_time_per_call,
+            "time_per_call": time_per_call,
+            "change": change,
+        })
+
+    # Views with unknown change go last
+    return sorted(results, key=lambda item: (item["change"] is None, -(item["change"] or 0), item["view_name"]))
+
+
+def get_observations(entry):
+    """Returns the number of profiled calls. Total calls are estimated from the weights
+    of the sampled calls, so the significance is checked by the number of the sampled ones.
+
+    :param dict entry: raw counters
+    :return: number of sampled calls or total calls if the entry doesn't have it
+    :rtype: int
+    """
+    return entry.get("sampled_calls") or entry["total_calls"]
+
+
+def get_mean_stats(entry, total_field, m2_field):
+    """Returns mean and variance of the metric per call.
+
+    :param dict entry: raw counters
+    :param str total_field: counter field of the metric
+    :param str m2_field: field of the sum of squared deviations of the metric
+    :return: mean and variance or None if the entry doesn't have dispersion stats
+    :rtype: tuple(float, float or None)
+    """
+    mean = entry[total_field] / float(entry["total_calls"])
+
+    if m2_field in entry:
+        return mean, get_stddev(entry["total_calls"], entry[m2_field]) ** 2
+    else:
+        return mean, None
+
+
+def detect_regressions(baseline, counters, threshold=None, z_score=None, min_calls=None):
+    """Finds views which time or number of SQL queries per call regressed compared to the baseline.
+    Metric is regressed if its mean value increased by more than `threshold` and the increase
+    is statistically significant, i.e. z-score of the difference of the means (Welch's test)
+    is not less than `z_score`. Significance is not checked if there are no dispersion stats.
+    Number of sampled calls is used as the number of observations.
+
+    :param baseline: raw counters of the baseline as returned by
+        :meth:`speedinfo.storage.base.AbstractStorage.fetch_counters`
+    :type baseline: list[dict]
+    :param counters: raw counters to compare with the baseline
+    :type counters: list[dict]
+    :param threshold: minimal relative increase, SPEEDINFO_REGRESSION_THRESHOLD by default
+    :type threshold: float or None
+    :param z_score: minimal z-score of the increase, SPEEDINFO_REGRESSION_Z_SCORE by default
+    :type z_score: float or None
+    :param min_calls: minimal number of sampled calls in both datasets, SPEEDINFO_REGRESSION_MIN_CALLS by default
+    :type min_calls: int or None
+    :return: list of dicts with `view_name`, `method`, `metric`, `baseline_value`, `value`,
+        `change` and `z_score` keys sorted by change in descending order. Change is None
+        if the baseline value is zero, z-score is None if the significance is not checked.
+    :rtype: list[dict]
+    """
+    threshold = speedinfo_settings.SPEEDINFO_REGRESSION_THRESHOLD if threshold is None else threshold
+    z_score = speedinfo_settings.SPEEDINFO_REGRESSION_Z_SCORE if z_score is None else z_score
+    min_calls = speedinfo_settings.SPEEDINFO_REGRESSION_MIN_CALLS if min_calls is None else min_calls
+    baseline = dict(((entry["view_name"], entry["method"]), entry) for entry in baseline)
+    results = []
+
+    for entry in counters:
+        baseline_entry = baseline.get((entry["view_name"], entry["method"]))
+
+        if baseline_entry is None:
+            continue
+
+        baseline_observations = get_observations(baseline_entry)
+        observations = get_observations(entry)
+
+        if min(baseline_observations, observations) < max(min_calls, 1):
+            continue
+
+        for metric, total_field, m2_field in REGRESSION_METRICS:
+            baseline_mean, baseline_variance = get_mean_stats(baseline_entry, total_field, m2_field)
+            mean, variance = get_mean_stats(entry, total_field, m2_field)
+
+            if mean <= baseline_mean:
+                continue
+
+            change = mean / baseline_mean - 1 if baseline_mean else None
+
+            if (change is not None) and (change < threshold):
+                continue
+
+            score = None
+
+            if (baseline_variance is not None) and (variance is not None):
+                stderr = math.sqrt(baseline_variance / baseline_observations + variance / observations)
+
+                # Difference of the constant values is always significant
+                if stderr > 0:
+                    score = (mean - baseline_mean) / stderr
+
+                    if score < z_score:
+                        continue
+
+            results.append({
+                "view_name": entry["view_name"],
+                "method": entry["method"],
+                "metric": metric,
+                "baseline_value": baseline_mean,
+                "value": mean,
+                "change": change,
+                "z_score": score,
+            })
+
+    # Metrics which were zero in the baseline go first
+    return sorted(results, key=lambda item: (item["change"] is not None, -(item["change"] or 0), item["view_name"]))
@@ -0,0 +1,85 @@
+# coding: utf-8
+
+import math
+
+
+def add_value(count, total, m2, value, weight=1):
+    """Updates the sum of squared deviations from the mean with a new value
+    by Welford's online algorithm generalized for the weighted values.
+    The mean is derived from the number and the sum of the values.
+
+    :param count: number of the values before the update
+    :param total: sum of the values before the update
+    :param float m2: sum of squared deviations before the update
+    :param value: new value
+    :param int weight: number of occurrences of the new value
+    :return: updated sum of squared deviations
+    :rtype: float
+    """
+    if count <= 0:
+        return 0.0
+
+    mean = total / float(count)
+    new_mean = (total + value * weight) / float(count + weight)
+
+    return m2 + weight * (value - mean) * (value - new_mean)
+
+
+def merge_values(count_a, total_a, m2_a, count_b, total_b, m2_b):
+    """Merges the sums of squared deviations of two sets of values
+    (Chan et al. parallel algorithm), e.g. collected by different workers.
+
+    :return: sum of squared deviations of the merged set
+    :rtype: float
+    """
+    if count_a <= 0:
+        return m2_b
+
+    if count_b <= 0:
+        return m2_a
+
+    delta = total_b / float(count_b) - total_a / float(count_a)
+    return m2_a + m2_b + delta * delta * count_a * count_b / float(count_a + count_b)
+
+
+def get_stddev(count, m2):
+    """Returns the sample standard deviation.
+
+    :param count: number of the values
+    :param float m2: sum of squared deviations from the mean
+    :rtype: float
+    """
+    if count > 1:
+        return math.sqrt(max(m2, 0) / (count - 1))
+    else:
+        return 0.0
+
+
+def add_decayed_value(average, total_weight, elapsed, value, weight, half_life):
+    """Updates the exponentially weighted moving average with a new value.
+    Weights of the previous values are halved every `half_life` seconds,
+    so the average reflects the recent values regardless of the request rate.
+
+    :param float average: moving average before the update
+    :param float total_weight: decayed weight of the previous values
+    :param float elapsed: seconds since the previous update
+    :param value: new value
+    :param int weight: number of occurrences of the new value
+    :param float half_life: half-life of the weights in seconds
+    :return: updated moving average and total weight
+    :rtype: tuple(float, float)
+    """
+    total_weight *= get_decay(elapsed, half_life)
+    new_total_weight = total_weight + weight
+
+    return (average * total_weight + value * weight) / new_total_weight, new_total_weight
+
+
+def get_decay(elapsed, half_life):
+    """Returns the factor of the weight decay over the elapsed time.
+
+    :param float elapsed: seconds since the previous update
+    :param float half_life: half-life of the weights in seconds
+    :rtype: float
+    """
+    return 0.5 ** (max(elapsed, 0) / float(half_life))
@@ -1,7 +1,183 @@
 # coding: utf-8
 
+import inspect
+import numbers
 from abc import ABCMeta, abstractmethod
 
+from speedinfo.stats import merge_values
+
+try:
+    string_types = basestring  # Python 2
+except NameError:
+    string_types = str
+
+# Counters which are summed up on merge
+SUMMED_FIELDS = (
+    "anon_calls", "cache_hits", "sql_total_time", "sql_total_count", "total_calls", "sampled_calls", "total_time",
+)
+
+# View name of the entries which accumulate the counters of the views
+# evicted from the storage limited by SPEEDINFO_STORAGE_MAX_ENTRIES
+OTHER_VIEW_NAME = "other"
+
+
+def create_counters(view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight=1,
+                    breakdowns=None):
+    """Creates raw counters of the profiled request. Parameters are the same
+    as in :meth:`AbstractStorage.add`.
+
+    :return: dict with the keys listed in `AbstractStorage.COUNTER_FIELDS` and `breakdowns` key
+        in the form of {name: {value: [count, time]}}
+    :rtype: dict
+    """
+    return {
+        "view_name": view_name,
+        "method": method,
+        "anon_calls": is_anon_call and weight or 0,
+        "cache_hits": is_cache_hit and weight or 0,
+        "sql_total_time": sql_time * weight,
+        "sql_total_count": sql_count * weight,
+        "total_calls": weight,
+        "sampled_calls": 1,
+        "total_time": view_execution_time * weight,
+        "time_min": view_execution_time,
+        "time_max": view_execution_time,
+        "time_m2": 0.0,
+        "sql_count_min": sql_count,
+        "sql_count_max": sql_count,
+        "sql_count_m2": 0.0,
+        "breakdowns": dict(
+            (name, dict((value, [count * weight, time * weight]) for value, (count, time) in values.items()))
+            for name, values in (breakdowns or {}).items()
+        ),
+    }
+
+
+def filter_objects(objects, filters=None):
+    """Filters list of :class:`speedinfo.models.ViewProfiler` objects.
+
+    :param objects: list of objects to filter
+    :param filters: filters to apply, see :meth:`speedinfo.storage.base.AbstractStorage.fetch_all`
+    :type filters: dict or None
+    :return: filtered list of objects
+    :rtype: list
+    """
+    filters = filters or {}
+    view_name = filters.get("view_name")
+    method = filters.get("method")
+    min_calls = filters.get("min_calls")
+    min_time_per_call = filters.get("min_time_per_call")
+
+    def matches(obj):
+        return all([
+            not view_name or view_name.lower() in obj.view_name.lower(),
+            not method or obj.method == method,
+            min_calls is None or obj.total_calls >= min_calls,
+            min_time_per_call is None or obj.time_per_call >= min_time_per_call,
+        ])
+
+    return [obj for obj in objects if matches(obj)]
+
+
+def supports_parameter(func, name):
+    """Checks if the function accepts the keyword argument.
+
+    :param func: Function or method
+    :param str name: Argument name
+    :rtype: bool
+    """
+    try:
+        parameters = inspect.signature(func).parameters  # Python 3
+    except AttributeError:
+        spec = inspect.getargspec(func)
+        return (name in spec.args) or (spec.keywords is not None)
+
+    return (name in parameters) or any(
+        parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()
+    )
+
+
+def is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def validate_counters(counters):
+    """Checks types of the raw counters received from the untrusted source, e.g. by the collector.
+
+    :param counters: raw counters as returned by :func:`create_counters`
+    :return: True if the counters can be merged
+    :rtype: bool
+    """
+    if not isinstance(counters, dict) or not set(AbstractStorage.COUNTER_FIELDS) <= set(counters):
+        return False
+
+    if not isinstance(counters["view_name"], string_types) or not isinstance(counters["method"], string_types):
+        return False
+
+    if not all(is_number(counters[field]) for field in AbstractStorage.COUNTER_FIELDS[2:]):
+        return False
+
+    breakdowns = counters.get("breakdowns", {})
+
+    if not isinstance(breakdowns, dict):
+        return False
+
+    for name, values in breakdowns.items():
+        if not isinstance(values, dict):
+            return False
+
+        for value, value_counters in values.items():
+            if not isinstance(value_counters, (list, tuple)) or len(value_counters) != 2:
+                return False
+
+            if not all(is_number(item) for item in value_counters):
+                return False
+
+    return True
+
+
+def merge_counters(entry, counters):
+    """Merges raw counters into the entry in place.
+
+    :param dict entry: raw counters to update, empty dict for a new entry
+    :param dict counters: raw counters to merge as returned by :func:`create_counters`
+    :return: updated entry
+    :rtype: dict
+    """
+    count = entry.get("total_calls", 0)
+
+    # Entries saved by the previous versions don't have dispersion stats
+    if (count > 0) and ("time_m2" in entry):
+        entry["time_min"] = min(entry["time_min"], counters["time_min"])
+        entry["time_max"] = max(entry["time_max"], counters["time_max"])
+        entry["sql_count_min"] = min(entry["sql_count_min"], counters["sql_count_min"])
+        entry["sql_count_max"] = max(entry["sql_count_max"], counters["sql_count_max"])
+    else:
+        for field in ("time_min", "time_max", "sql_count_min", "sql_count_max"):
+            entry[field] = counters[field]
+
+    entry["time_m2"] = merge_values(
+        count, entry.get("total_time", 0), entry.get("time_m2", 0),
+        counters["total_calls"], counters["total_time"], counters["time_m2"],
+    )
+    entry["sql_count_m2"] = merge_values(
+        count, entry.get("sql_total_count", 0), entry.get("sql_count_m2", 0),
+        counters["total_calls"], counters["sql_total_count"], counters["sql_count_m2"],
+    )
+
+    for field in SUMMED_FIELDS:
+        entry[field] = entry.get(field, 0) + counters[field]
+
+    for name, values in (counters.get("breakdowns") or {}).items():
+        breakdown = entry.setdefault("breakdowns", {}).setdefault(name, {})
+
+        for value, (value_count, total_time) in values.items():
+            value_counters = breakdown.setdefault(value, [0, 0])
+            value_counters[0] += value_count
+            value_counters[1] += total_time
+
+    return entry
+
 
 class AbstractStorage(object):
     """
@@ -10,8 +186,22 @@ class AbstractStorage(object):
     """
     __metaclass__ = ABCMeta
 
+    COUNTER_FIELDS = (
+        "view_name", "method", "anon_calls", "cache_hits",
+        "sql_total_time", "sql_total_count", "total_calls", "sampled_calls", "total_time",
+        "time_min", "time_max", "time_m2", "sql_count_min", "sql_count_max", "sql_count_m2",
+    )
+
+    # Computed properties which entries can be sorted by in addition to the model fields.
+    # Other properties (e.g. calculated from the breakdowns) can't be sorted by in the database.
+    SORTABLE_PROPERTIES = (
+        "anon_calls_ratio", "cache_hits_ratio", "sql_count_per_call", "sql_time_ratio", "time_per_call",
+        "time_stddev", "sql_count_stddev",
+    )
+
     @abstractmethod
-    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time):
+    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight=1,
+            breakdowns=None):
         """Adds a new entry.
 
         :param str view_name: View name
@@ -21,21 +211,250 @@ class AbstractStorage(object):
         :param float sql_time: SQL queries execution time
         :param int sql_count: Number of executed SQL queries
         :param float view_execution_time: View execution time
+        :param int weight: Number of requests represented by the entry when profiling
+            is sampled. Counters are incremented by the values multiplied by the weight.
+            Minimum, maximum and the sum of squared deviations from the mean (see :mod:`speedinfo.stats`)
+            of the execution time and the number of SQL queries are updated as well.
+        :param breakdowns: counters broken down by dimensions, e.g. SQL queries by database alias
+            ({'sql_alias': {'default': (3, 0.05), 'replica': (10, 0.2)}}). Each counter is a pair
+            of count and time which are added to the totals of the dimension value.
+        :type breakdowns: dict or None
         :rtype: None
         """
 
+    def merge(self, entries, node=None):
+        """Merges counters aggregated elsewhere, e.g. by the application nodes
+        (see :class:`speedinfo.storage.node.storage.NodeStorage`).
+
+        :param entries: raw counters as returned by :func:`create_counters`
+        :type entries: list[dict]
+        :param node: Name of the node which aggregated the counters. Calls and time
+            are broken down by `node` dimension if specified.
+        :type node: str or None
+        :rtype: None
+        """
+        raise NotImplementedError("Storage doesn't support merging of the counters")
+
     @abstractmethod
-    def fetch_all(self, ordering=None):
-        """Returns all entries optionally sorted by specified list of fields.
+    def fetch_all(self, ordering=None, filters=None, offset=0, limit=None):
+        """Returns all entries optionally filtered and sorted by specified list of fields.
+
+        Supported filters:
+            - `view_name` - case-insensitive substring of the view name
+            - `method` - HTTP method
+            - `min_calls` - minimal number of calls
+            - `min_time_per_call` - minimal time per call
 
         :param ordering: list of field names to sort the entries (e.g. ['-sql_total_time', 'total_calls'])
         :type ordering: list[str] or None
+        :param filters: filters to apply to the entries (e.g. {'method': 'GET', 'min_calls': 10})
+        :type filters: dict or None
+        :param int offset: number of entries to skip
+        :param limit: maximum number of entries to return
+        :type limit: int or None
         :rtype: list of :class:`speedinfo.models.ViewProfiler`
         """
 
+    def iter_all(self, ordering=None, filters=None):
+        """Iterates over all entries optionally filtered and sorted by specified list of fields.
+        Storages should override the method to avoid loading all entries into memory at once.
+
+        :param ordering: list of field names to sort the entries, the same as in :meth:`fetch_all`
+        :type ordering: list[str] or None
+        :param filters: filters to apply to the entries, the same as in :meth:`fetch_all`
+        :type filters: dict or None
+        :rtype: iterator of :class:`speedinfo.models.ViewProfiler`
+        """
+        return iter(self.fetch_all(ordering, filters))
+
+    def fetch_counters(self):
+        """Returns raw counters of all entries without calculating derived
+        values. Used as a cheap read path by metrics exposition.
+
+        :return: list of dicts with the keys listed in `COUNTER_FIELDS`
+        :rtype: list[dict]
+        """
+        return [
+            dict((field, getattr(entry, field)) for field in self.COUNTER_FIELDS)
+            for entry in self.iter_all()
+        ]
+
+    def fetch_breakdowns(self, name, keys=None):
+        """Returns counters of the entries broken down by the named dimension.
+        Storages should override the method to avoid loading all entries.
+
+        :param str name: Dimension name (e.g. 'sql_alias')
+        :param keys: list of (view name, method) pairs to return the counters for, all entries if None
+        :type keys: list[tuple(str, str)] or None
+        :return: dict of (view name, method) pairs to dict of dimension values to (count, time) pairs
+        :rtype: dict
+        """
+        keys = None if keys is None else set(keys)
+        results = {}
+
+        for entry in self.iter_all():
+            key = (entry.view_name, entry.method)
+            breakdown = entry.breakdowns.get(name)
+
+            if breakdown and ((keys is None) or (key in keys)):
+                results[key] = dict((value, tuple(counters)) for value, counters in breakdown.items())
+
+        return results
+
+    def fetch_breakdowns_by_names(self, names, keys=None):
+        """Returns counters of the entries broken down by each of the named dimensions.
+        Storages should override the method to read the entries once for all dimensions.
+
+        :param names: Dimension names
+        :type names: list[str]
+        :param keys: list of (view name, method) pairs to return the counters for, all entries if None
+        :type keys: list[tuple(str, str)] or None
+        :return: dict of dimension names to the results of :meth:`fetch_breakdowns`
+        :rtype: dict
+        """
+        return dict((name, self.fetch_breakdowns(name, keys)) for name in names)
+
+    def count(self, filters=None):
+        """Returns the number of entries matching the filters.
+        Storages should override the method to avoid loading all entries.
+
+        :param filters: filters to apply to the entries, the same as in :meth:`fetch_all`
+        :type filters: dict or None
+        :rtype: int
+        """
+        return len(self.fetch_all(filters=filters))
+
+    def count_evictions(self):
+        """Returns the number of entries lost by the storage, e.g. evicted
+        from the cache under memory pressure. Storages which don't lose
+        the entries return None.
+
+        :rtype: int or None
+        """
+        return None
+
+    def add_slow_request(self, view_name, method, path, query_hash, user_id, status_code, is_cache_hit,
+                         sql_time, sql_count, duration, created_at):
+        """Adds the details of the slow request. Only SPEEDINFO_SLOW_REQUESTS_PER_VIEW
+        most recent requests are kept for each view and HTTP method.
+
+        :param str view_name: View name
+        :param str method: HTTP method (GET, POST, etc.)
+        :param str path: Requested path
+        :param str query_hash: Short hash of the query string or empty string if there is no query string
+        :param str user_id: User primary key or empty string in case of an anonymous request
+        :param int status_code: Response status code
+        :param bool is_cache_hit: True if view response was retrieved from cache
+        :param float sql_time: SQL queries execution time
+        :param int sql_count: Number of executed SQL queries
+        :param float duration: View execution time
+        :param datetime.datetime created_at: Request time
+        :rtype: None
+        """
+        # Storages which don't keep slow requests ignore them
+
+    def fetch_slow_requests(self, ordering=None):
+        """Returns SPEEDINFO_SLOW_REQUESTS_LIMIT slowest requests optionally
+        sorted by specified list of fields.
+
+        :param ordering: list of field names to sort the entries (e.g. ['-created_at'])
+        :type ordering: list[str] or None
+        :rtype: list of :class:`speedinfo.models.SlowRequest`
+        """
+        return []
+
+    def add_snapshot(self, name, started_at, finished_at, entries):
+        """Saves a named copy of the profiling data. Only SPEEDINFO_SNAPSHOTS_LIMIT
+        most recent snapshots are kept.
+
+        :param str name: Snapshot name
+        :param datetime.datetime started_at: Start time of the profiling
+        :param datetime.datetime finished_at: Finish time of the profiling
+        :param entries: raw counters in the same form as returned by :meth:`fetch_counters`
+        :type entries: list[dict]
+        :return: snapshot ID or None if the storage doesn't keep snapshots
+        :rtype: str or None
+        """
+        return None
+
+    def save_snapshot(self, name, started_at, finished_at):
+        """Saves a named copy of the current profiling data.
+
+        :param str name: Snapshot name
+        :param datetime.datetime started_at: Start time of the profiling
+        :param datetime.datetime finished_at: Finish time of the profiling
+        :return: snapshot ID or None if the storage doesn't keep snapshots
+        :rtype: str or None
+        """
+        return self.add_snapshot(name, started_at, finished_at, self.fetch_counters())
+
+    def fetch_snapshots(self, ordering=None):
+        """Returns all snapshots optionally sorted by specified list of fields.
+
+        :param ordering: list of field names to sort the snapshots (e.g. ['-finished_at'])
+        :type ordering: list[str] or None
+        :rtype: list of :class:`speedinfo.models.Snapshot`
+        """
+        return []
+
+    def fetch_snapshot_counters(self, snapshot_id):
+        """Returns raw counters of the snapshot.
+
+        :param str snapshot_id: Snapshot ID
+        :return: raw counters in the same form as returned by :meth:`fetch_counters`
+            or None if there is no such snapshot
+        :rtype: list[dict] or None
+        """
+        return None
+
     @abstractmethod
     def reset(self):
-        """Deletes all entries.
+        """Deletes all entries, breakdowns and slow requests. Snapshots are kept.
 
         :rtype: None
         """
+
+
+class LegacyAddMixin(object):
+    """
+    Adds the requests to the storage implemented for the previous versions,
+    which doesn't accept weight and breakdowns. Request is added `weight` times.
+    """
+    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight=1,
+            breakdowns=None):
+        for _ in range(weight):
+            super(LegacyAddMixin, self).add(
+                view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time,
+            )
+
+
+class LegacyFetchAllMixin(object):
+    """
+    Filters and slices the entries of the storage implemented for the previous versions,
+    which only sorts them.
+    """
+    def fetch_all(self, ordering=None, filters=None, offset=0, limit=None):
+        entries = filter_objects(super(LegacyFetchAllMixin, self).fetch_all(ordering), filters)
+        return entries[offset:] if limit is None else entries[offset:offset + limit]
+
+
+def upgrade_storage_class(storage_cls):
+    """Adapts the storage class implemented for the previous versions to the current
+    signatures of :meth:`AbstractStorage.add` and :meth:`AbstractStorage.fetch_all`.
+    Methods added to :class:`AbstractStorage` since then fall back to the defaults.
+
+    :param storage_cls: Storage class
+    :return: storage class or its subclass with the legacy methods adapted
+    """
+    mixins = []
+
+    if not supports_parameter(storage_cls.add, "breakdowns"):
+        mixins.append(LegacyAddMixin)
+
+    if not supports_parameter(storage_cls.fetch_all, "filters"):
+        mixins.append(LegacyFetchAllMixin)
+
+    if not mixins:
+        return storage_cls
+
+    return type(storage_cls.__name__, tuple(mixins) + (storage_cls,), {})
@@ -1,12 +1,34 @@
 # coding: utf-8
 
+import heapq
+import time
+import uuid
+import zlib
 from functools import cmp_to_key
 
 from django.core.cache import caches
 
 from speedinfo.conf import speedinfo_settings
-from speedinfo.models import ViewProfiler
-from speedinfo.storage.base import AbstractStorage
+from speedinfo.models import SlowRequest, Snapshot, ViewProfiler
+from speedinfo.stats import add_decayed_value
+from speedinfo.storage.base import AbstractStorage, OTHER_VIEW_NAME, create_counters, filter_objects, merge_counters
+
+
+def sort_objects(objects, ordering=None):
+    """Sorts list of objects by specified list of fields.
+
+    :param objects: list of objects to sort
+    :param ordering: list of field names to sort the objects (e.g. ['-sql_total_time', 'total_calls'])
+    :type ordering: list[str] or None
+    :return: sorted list of objects
+    :rtype: list
+    """
+    order_fields = [
+        (field[1:], True) if field.startswith("-") else (field, False)
+        for field in ordering or []
+    ]
+
+    return sorted(objects, key=cmp_to_key(comparator(order_fields)))
 
 
 def comparator(order_fields):
@@ -37,6 +59,18 @@ class CacheStorage(AbstractStorage):
     """
     CACHE_KEY_PREFIX = "speedinfo"
     CACHE_INDEXES_KEY = "speedinfo:indexes"
+    CACHE_SNAPSHOTS_KEY = "speedinfo:snapshots"
+    CACHE_EVICTIONS_KEY = "speedinfo:evictions"
+    CACHE_EVICTION_LOCK_KEY = "speedinfo:eviction_lock"
+    CACHE_EVICTION_ERROR_KEY = "speedinfo:eviction_error"
+    EVICTION_LOCK_TIMEOUT = 10
+    EVICTION_BATCH_RATIO = 0.1
+    INDEX_SHARDS = 16
+    ITER_CHUNK_SIZE = 100
+    SLOW_REQUEST_FIELDS = (
+        "view_name", "method", "path", "query_hash", "user_id", "status_code",
+        "is_cache_hit", "sql_time", "sql_count", "duration", "created_at",
+    )
 
     def __init__(self):
         self._cache = caches[speedinfo_settings.SPEEDINFO_CACHE_STORAGE_CACHE_ALIAS]
@@ -44,57 +78,330 @@ class CacheStorage(AbstractStorage):
     def get_cache_key(self, *args):
         return ".".join([self.CACHE_KEY_PREFIX] + list(args))
 
+    def get_index_key(self, name):
+        """Returns the key of the index shard which lists the entry. Index is split
+        into shards, so the eviction of a shard from the cache hides only a part
+        of the entries until they are updated again.
+
+        :param str name: Entry key
+        :rtype: str
+        """
+        return "{}:{}".format(self.CACHE_INDEXES_KEY, zlib.crc32(name.encode("utf-8")) % self.INDEX_SHARDS)
+
+    def get_index_keys(self):
+        return ["{}:{}".format(self.CACHE_INDEXES_KEY, shard) for shard in range(self.INDEX_SHARDS)]
+
     def indexes(self):
-        val = self._cache.get(self.CACHE_INDEXES_KEY)
+        shards = self._cache.get_many(self.get_index_keys())
+        return sorted(name for names in shards.values() for name in names)
 
-        if val is None:
-            self._cache.add(self.CACHE_INDEXES_KEY, [], None)
-            val = self._cache.get(self.CACHE_INDEXES_KEY)
+    def get_slow_requests_key(self, index):
+        return "{}:slow".format(index)
 
-        return val
+    def get_snapshot_key(self, snapshot_id):
+        return "speedinfo:snapshot:{}".format(snapshot_id)
 
     def add_index(self, name):
-        self._cache.set(self.CACHE_INDEXES_KEY, list(set(self.indexes() + [name])), None)
-
-    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time):
-        index = self.get_cache_key(view_name, method)
-        entry = self._cache.get(index)
-
-        if entry is None:
-            entry = {
-                "view_name": view_name,
-                "method": method,
-                "anon_calls": 0,
-                "cache_hits": 0,
-                "sql_total_time": 0,
-                "sql_total_count": 0,
-                "total_calls": 0,
-                "total_time": 0,
-            }
+        key = self.get_index_key(name)
+        self._cache.set(key, list(set((self._cache.get(key) or []) + [name])), None)
+
+    def remove_indexes(self, names):
+        shards = {}
+
+        for name in names:
+            shards.setdefault(self.get_index_key(name), set()).add(name)
+
+        for key, removed in shards.items():
+            self._cache.set(key, [name for name in self._cache.get(key) or [] if name not in removed], None)
+
+    def get_entries(self, indexes):
+        """Returns the cached entries in the order of the keys. Entries evicted
+        from the cache are counted and removed from the index.
+
+        :param indexes: list of entry keys
+        :type indexes: list[str]
+        :rtype: list[dict]
+        """
+        entries = self._cache.get_many(indexes)
+        evicted = [index for index in indexes if index not in entries]
+
+        if evicted:
+            self.remove_indexes(evicted)
+            self.add_evictions(len(evicted))
+
+        return [entries[index] for index in indexes if index in entries]
+
+    def add_evictions(self, count):
+        self._cache.add(self.CACHE_EVICTIONS_KEY, 0, None)
+
+        try:
+            self._cache.incr(self.CACHE_EVICTIONS_KEY, count)
+        except ValueError:
+            # Counter was evicted or reset right after it was added
+            pass
+
+    def count_evictions(self):
+        return self._cache.get(self.CACHE_EVICTIONS_KEY, 0)
+
+    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight=1,
+            breakdowns=None):
+        self.merge([create_counters(
+            view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight, breakdowns,
+        )])
+
+    def merge(self, entries, node=None):
+        for counters in entries:
+            index = self.get_cache_key(counters["view_name"], counters["method"])
+            values = self._cache.get_many([index, self.get_index_key(index)])
+            entry = values.get(index)
+            is_indexed = index in values.get(self.get_index_key(index), [])
+
+            if entry is None:
+                entry = {"view_name": counters["view_name"], "method": counters["method"]}
+
+                # Entry listed in the index was evicted from the cache
+                if is_indexed:
+                    self.add_evictions(1)
+
+                if counters["view_name"] != OTHER_VIEW_NAME:
+                    entry["time_error"] = self.evict()
+
+            if node is not None:
+                breakdowns = dict(counters.get("breakdowns") or {})
+                breakdowns["node"] = {node: [counters["total_calls"], counters["total_time"]]}
+                counters = dict(counters, breakdowns=breakdowns)
+
+            if speedinfo_settings.SPEEDINFO_EWMA_HALF_LIFE and counters["total_calls"] > 0:
+                self.add_ewma(
+                    entry, counters["sql_total_count"] / float(counters["total_calls"]),
+                    counters["total_time"] / float(counters["total_calls"]), counters["total_calls"],
+                )
+
+            # Breakdowns are stored in the entry as {name: {value: [count, time]}}
+            merge_counters(entry, counters)
             self._cache.set(index, entry, None)
-            self.add_index(index)
 
-        entry["anon_calls"] += is_anon_call and 1 or 0
-        entry["cache_hits"] += is_cache_hit and 1 or 0
-        entry["sql_total_time"] += sql_time
-        entry["sql_total_count"] += sql_count
-        entry["total_calls"] += 1
-        entry["total_time"] += view_execution_time
+            # Entries missing from the evicted index shard are listed again on update
+            if not is_indexed:
+                self.add_index(index)
+
+    def evict(self):
+        """Folds the entries with the least total time into the 'other' entry of the same
+        HTTP method once the number of entries reaches SPEEDINFO_STORAGE_MAX_ENTRIES.
+        New entry inherits the total time of the evicted ones as an error (Space-Saving
+        algorithm), so the views called often enough replace each other in the top
+        instead of being evicted right after they are added.
+
+        Entries are evicted in batches of EVICTION_BATCH_RATIO of the limit, so all
+        entries are read once per batch rather than for every new entry. The batch
+        is evicted by a single worker at a time, other workers add their entries
+        over the limit meanwhile.
+
+        :return: total time inherited by the new entry
+        :rtype: float
+        """
+        limit = speedinfo_settings.SPEEDINFO_STORAGE_MAX_ENTRIES
+
+        if not limit:
+            return 0
+
+        other_prefix = self.get_cache_key(OTHER_VIEW_NAME)
+        indexes = [index for index in self.indexes() if index.rsplit(".", 1)[0] != other_prefix]
+
+        if (len(indexes) < limit) or not self._cache.add(self.CACHE_EVICTION_LOCK_KEY, 1, self.EVICTION_LOCK_TIMEOUT):
+            return self._cache.get(self.CACHE_EVICTION_ERROR_KEY, 0)
+
+        try:
+            entries = self.get_entries(indexes)
+            batch_size = max(int(limit * self.EVICTION_BATCH_RATIO), 1)
+            evicted = heapq.nsmallest(
+                len(entries) - limit + batch_size, entries,
+                key=lambda entry: entry.get("total_time", 0) + entry.get("time_error", 0),
+            )
+
+            if not evicted:
+                return self._cache.get(self.CACHE_EVICTION_ERROR_KEY, 0)
+
+            others = {}
+
+            for entry in evicted:
+                other_index = self.get_cache_key(OTHER_VIEW_NAME, entry["method"])
 
-        self._cache.set(index, entry, None)
+                if other_index not in others:
+                    others[other_index] = self._cache.get(other_index) or {
+                        "view_name": OTHER_VIEW_NAME, "method": entry["method"],
+                    }
 
-    def fetch_all(self, ordering=None):
+                if entry.get("total_calls"):
+                    # Entries saved by the previous versions don't have dispersion stats
+                    merge_counters(others[other_index], dict(dict.fromkeys(self.COUNTER_FIELDS, 0), **entry))
+
+            self._cache.set_many(others, None)
+
+            for other_index in others:
+                self.add_index(other_index)
+
+            # Index is updated first, so the deleted entries aren't counted as evicted by the cache
+            evicted_indexes = [self.get_cache_key(entry["view_name"], entry["method"]) for entry in evicted]
+            self.remove_indexes(evicted_indexes)
+            self._cache.delete_many(
+                evicted_indexes + [self.get_slow_requests_key(index) for index in evicted_indexes],
+            )
+
+            # Entries added until the next batch inherit the largest evicted total time
+            error = evicted[-1].get("total_time", 0) + evicted[-1].get("time_error", 0)
+            self._cache.set(self.CACHE_EVICTION_ERROR_KEY, error, None)
+            return error
+        finally:
+            self._cache.delete(self.CACHE_EVICTION_LOCK_KEY)
+
+    def add_ewma(self, entry, sql_count, view_execution_time, weight):
+        """Updates moving averages of the cached entry.
+
+        :param dict entry: Cached entry
+        :param float sql_count: Number of executed SQL queries per call
+        :param float view_execution_time: View execution time per call
+        :param int weight: Number of requests represented by the values
+        """
+        now = time.time()
+        half_life = speedinfo_settings.SPEEDINFO_EWMA_HALF_LIFE
+        total_weight = entry.get("ewma_weight", 0)
+        elapsed = now - entry.get("ewma_updated_at", now)
+
+        entry["ewma_time_per_call"], entry["ewma_weight"] = add_decayed_value(
+            entry.get("ewma_time_per_call", 0), total_weight, elapsed, view_execution_time, weight, half_life,
+        )
+        entry["ewma_sql_count_per_call"] = add_decayed_value(
+            entry.get("ewma_sql_count_per_call", 0), total_weight, elapsed, sql_count, weight, half_life,
+        )[0]
+        entry["ewma_updated_at"] = now
+
+    def get_entry_object(self, entry):
+        """Converts cached entry to :class:`speedinfo.models.ViewProfiler` object.
+
+        :param dict entry: Cached entry
+        :rtype: :class:`speedinfo.models.ViewProfiler`
+        """
+        breakdowns = dict(
+            (name, dict((value, tuple(counters)) for value, counters in values.items()))
+            for name, values in entry.get("breakdowns", {}).items()
+        )
+
+        return ViewProfiler(**dict(entry, breakdowns=breakdowns))
+
+    def fetch_entries(self, filters=None):
+        return filter_objects([self.get_entry_object(entry) for entry in self.get_entries(self.indexes())], filters)
+
+    def fetch_all(self, ordering=None, filters=None, offset=0, limit=None):
+        results = sort_objects(self.fetch_entries(filters), ordering)
+
+        if limit is None:
+            return results[offset:]
+        else:
+            return results[offset:offset + limit]
+
+    def iter_all(self, ordering=None, filters=None):
+        # Entries have to be loaded all at once to be sorted
+        if ordering:
+            return iter(self.fetch_all(ordering, filters))
+
+        return self.iter_entries(filters)
+
+    def iter_entries(self, filters=None):
+        indexes = self.indexes()
+
+        for i in range(0, len(indexes), self.ITER_CHUNK_SIZE):
+            entries = self.get_entries(indexes[i:i + self.ITER_CHUNK_SIZE])
+
+            for entry in filter_objects([self.get_entry_object(entry) for entry in entries], filters):
+                yield entry
+
+    def fetch_counters(self):
+        return [
+            dict((field, entry.get(field, 0)) for field in self.COUNTER_FIELDS)
+            for entry in self.get_entries(self.indexes())
+        ]
+
+    def fetch_breakdowns(self, name, keys=None):
+        return self.fetch_breakdowns_by_names([name], keys)[name]
+
+    def fetch_breakdowns_by_names(self, names, keys=None):
+        if keys is None:
+            indexes = self.indexes()
+        else:
+            indexes = [self.get_cache_key(view_name, method) for view_name, method in keys]
+
+        results = dict((name, {}) for name in names)
+
+        for entry in self._cache.get_many(indexes).values():
+            breakdowns = entry.get("breakdowns", {})
+
+            for name in names:
+                if breakdowns.get(name):
+                    results[name][(entry["view_name"], entry["method"])] = dict(
+                        (value, tuple(counters)) for value, counters in breakdowns[name].items()
+                    )
+
+        return results
+
+    def count(self, filters=None):
+        return len(self.fetch_entries(filters))
+
+    def add_slow_request(self, view_name, method, path, query_hash, user_id, status_code, is_cache_hit,
+                         sql_time, sql_count, duration, created_at):
+        # Requests are stored as tuples to reduce the size of the cache value
+        key = self.get_slow_requests_key(self.get_cache_key(view_name, method))
+        slow_requests = self._cache.get(key) or []
+        slow_requests.append((
+            view_name, method, path, query_hash, user_id, status_code,
+            is_cache_hit, sql_time, sql_count, duration, created_at,
+        ))
+
+        limit = speedinfo_settings.SPEEDINFO_SLOW_REQUESTS_PER_VIEW
+        self._cache.set(key, slow_requests[-limit:], None)
+
+    def fetch_slow_requests(self, ordering=None):
+        keys = [self.get_slow_requests_key(index) for index in self.indexes()]
+        duration_pos = self.SLOW_REQUEST_FIELDS.index("duration")
+        slow_requests = heapq.nlargest(
+            speedinfo_settings.SPEEDINFO_SLOW_REQUESTS_LIMIT,
+            [item for items in self._cache.get_many(keys).values() for item in items],
+            key=lambda item: item[duration_pos],
+        )
         results = [
-            ViewProfiler(**self._cache.get(index))
-            for index in self.indexes()
+            SlowRequest(**dict(zip(self.SLOW_REQUEST_FIELDS, item)))
+            for item in slow_requests
         ]
 
-        order_fields = [
-            (field[1:], True) if field.startswith("-") else (field, False)
-            for field in ordering or []
+        return sort_objects(results, ordering)
+
+    def add_snapshot(self, name, started_at, finished_at, entries):
+        # Snapshots are stored as a list of (id, name, started_at, finished_at) tuples
+        snapshot_id = uuid.uuid4().hex
+        snapshots = self._cache.get(self.CACHE_SNAPSHOTS_KEY) or []
+        snapshots.append((snapshot_id, name, started_at, finished_at))
+
+        limit = speedinfo_settings.SPEEDINFO_SNAPSHOTS_LIMIT
+        self._cache.set(self.get_snapshot_key(snapshot_id), entries, None)
+        self._cache.set(self.CACHE_SNAPSHOTS_KEY, snapshots[-limit:], None)
+        self._cache.delete_many([self.get_snapshot_key(item[0]) for item in snapshots[:-limit]])
+
+        return snapshot_id
+
+    def fetch_snapshots(self, ordering=None):
+        results = [
+            Snapshot(id=snapshot_id, name=name, started_at=started_at, finished_at=finished_at)
+            for snapshot_id, name, started_at, finished_at in self._cache.get(self.CACHE_SNAPSHOTS_KEY) or []
         ]
 
-        return sorted(results, key=cmp_to_key(comparator(order_fields)))
+        return sort_objects(results, ordering)
+
+    def fetch_snapshot_counters(self, snapshot_id):
+        return self._cache.get(self.get_snapshot_key(snapshot_id))
 
     def reset(self):
-        self._cache.delete_many(self.indexes() + [self.CACHE_INDEXES_KEY])
+        indexes = self.indexes()
+        self._cache.delete_many(
+            indexes + [self.get_slow_requests_key(index) for index in indexes] +
+            self.get_index_keys() + [self.CACHE_INDEXES_KEY, self.CACHE_EVICTIONS_KEY, self.CACHE_EVICTION_ERROR_KEY],
+        )
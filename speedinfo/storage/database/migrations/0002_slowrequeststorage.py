@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.25 on 2026-10-19 06:49
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowRequestStorage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=255, verbose_name=b'View name')),
+                ('method', models.CharField(max_length=8, verbose_name=b'HTTP method')),
+                ('path', models.CharField(max_length=255, verbose_name=b'Path')),
+                ('query_hash', models.CharField(blank=True, max_length=8, verbose_name=b'Query string hash')),
+                ('user_id', models.CharField(blank=True, max_length=64, verbose_name=b'User ID')),
+                ('status_code', models.PositiveIntegerField(default=0, verbose_name=b'Status code')),
+                ('is_cache_hit', models.BooleanField(default=False, verbose_name=b'Cache hit')),
+                ('sql_count', models.PositiveIntegerField(default=0, verbose_name=b'SQL queries count')),
+                ('sql_time', models.FloatField(default=0, verbose_name=b'SQL time')),
+                ('duration', models.FloatField(default=0, verbose_name=b'Duration')),
+                ('created_at', models.DateTimeField(verbose_name=b'Time')),
+            ],
+            options={
+                'db_table': 'speedinfo_storage_database_slowrequest',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='slowrequeststorage',
+            index_together=set([('view_name', 'method')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.25 on 2026-10-19 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0002_slowrequeststorage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotStorage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name=b'Name')),
+                ('started_at', models.DateTimeField(verbose_name=b'Started at')),
+                ('finished_at', models.DateTimeField(verbose_name=b'Finished at')),
+            ],
+            options={
+                'db_table': 'speedinfo_storage_database_snapshot',
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotEntryStorage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=255, verbose_name=b'View name')),
+                ('method', models.CharField(max_length=8, verbose_name=b'HTTP method')),
+                ('anon_calls', models.PositiveIntegerField(default=0, verbose_name=b'Anonymous calls')),
+                ('cache_hits', models.PositiveIntegerField(default=0, verbose_name=b'Cache hits')),
+                ('sql_total_time', models.FloatField(default=0, verbose_name=b'SQL total time')),
+                ('sql_total_count', models.PositiveIntegerField(default=0, verbose_name=b'SQL total queries count')),
+                ('total_calls', models.PositiveIntegerField(default=0, verbose_name=b'Total calls')),
+                ('total_time', models.FloatField(default=0, verbose_name=b'Total time')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='database.SnapshotStorage')),
+            ],
+            options={
+                'db_table': 'speedinfo_storage_database_snapshotentry',
+            },
+        ),
+    ]
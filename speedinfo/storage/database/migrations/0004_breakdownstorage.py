@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.25 on 2026-10-19 10:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0003_snapshotstorage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BreakdownStorage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=255, verbose_name=b'View name')),
+                ('method', models.CharField(max_length=8, verbose_name=b'HTTP method')),
+                ('name', models.CharField(max_length=32, verbose_name=b'Dimension name')),
+                ('value', models.CharField(max_length=255, verbose_name=b'Dimension value')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name=b'Count')),
+                ('total_time', models.FloatField(default=0, verbose_name=b'Total time')),
+            ],
+            options={
+                'db_table': 'speedinfo_storage_database_breakdown',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='breakdownstorage',
+            unique_together=set([('view_name', 'method', 'name', 'value')]),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.25 on 2026-10-19 11:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0004_breakdownstorage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshotentrystorage',
+            name='time_min',
+            field=models.FloatField(default=0, verbose_name=b'Min time'),
+        ),
+        migrations.AddField(
+            model_name='snapshotentrystorage',
+            name='time_max',
+            field=models.FloatField(default=0, verbose_name=b'Max time'),
+        ),
+        migrations.AddField(
+            model_name='snapshotentrystorage',
+            name='time_m2',
+            field=models.FloatField(default=0, verbose_name=b'Time sum of squared deviations'),
+        ),
+        migrations.AddField(
+            model_name='snapshotentrystorage',
+            name='sql_count_min',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Min SQL queries count'),
+        ),
+        migrations.AddField(
+            model_name='snapshotentrystorage',
+            name='sql_count_max',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Max SQL queries count'),
+        ),
+        migrations.AddField(
+            model_name='snapshotentrystorage',
+            name='sql_count_m2',
+            field=models.FloatField(default=0, verbose_name=b'SQL queries count sum of squared deviations'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='time_min',
+            field=models.FloatField(default=0, verbose_name=b'Min time'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='time_max',
+            field=models.FloatField(default=0, verbose_name=b'Max time'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='time_m2',
+            field=models.FloatField(default=0, verbose_name=b'Time sum of squared deviations'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='sql_count_min',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Min SQL queries count'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='sql_count_max',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Max SQL queries count'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='sql_count_m2',
+            field=models.FloatField(default=0, verbose_name=b'SQL queries count sum of squared deviations'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.25 on 2026-10-19 12:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0005_dispersion_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='ewma_time_per_call',
+            field=models.FloatField(default=0, verbose_name=b'Recent time per call'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='ewma_sql_count_per_call',
+            field=models.FloatField(default=0, verbose_name=b'Recent SQL queries per call'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='ewma_weight',
+            field=models.FloatField(default=0, verbose_name=b'Recent calls weight'),
+        ),
+        migrations.AddField(
+            model_name='storage',
+            name='ewma_updated_at',
+            field=models.FloatField(default=0, verbose_name=b'Recent values update timestamp'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.25 on 2026-10-19 13:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0006_ewma'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='time_error',
+            field=models.FloatField(default=0, verbose_name=b'Total time error'),
+        ),
+    ]
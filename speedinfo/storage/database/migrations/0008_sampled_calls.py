@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.25 on 2026-10-19 16:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0007_time_error'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storage',
+            name='sampled_calls',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Sampled calls'),
+        ),
+        migrations.AddField(
+            model_name='snapshotentrystorage',
+            name='sampled_calls',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Sampled calls'),
+        ),
+    ]
@@ -14,8 +14,94 @@ class Storage(models.Model):
     sql_total_time = models.FloatField("SQL total time", default=0)
     sql_total_count = models.PositiveIntegerField("SQL total queries count", default=0)
     total_calls = models.PositiveIntegerField("Total calls", default=0)
+    sampled_calls = models.PositiveIntegerField("Sampled calls", default=0)
     total_time = models.FloatField("Total time", default=0)
+    time_min = models.FloatField("Min time", default=0)
+    time_max = models.FloatField("Max time", default=0)
+    time_m2 = models.FloatField("Time sum of squared deviations", default=0)
+    sql_count_min = models.PositiveIntegerField("Min SQL queries count", default=0)
+    sql_count_max = models.PositiveIntegerField("Max SQL queries count", default=0)
+    sql_count_m2 = models.FloatField("SQL queries count sum of squared deviations", default=0)
+    ewma_time_per_call = models.FloatField("Recent time per call", default=0)
+    ewma_sql_count_per_call = models.FloatField("Recent SQL queries per call", default=0)
+    ewma_weight = models.FloatField("Recent calls weight", default=0)
+    ewma_updated_at = models.FloatField("Recent values update timestamp", default=0)
+    time_error = models.FloatField("Total time error", default=0)
 
     class Meta:
         unique_together = ("view_name", "method")
         db_table = "speedinfo_storage_database"
+
+
+class BreakdownStorage(models.Model):
+    """
+    Database storage for the counters broken down by dimensions
+    """
+    view_name = models.CharField("View name", max_length=255)
+    method = models.CharField("HTTP method", max_length=8)
+    name = models.CharField("Dimension name", max_length=32)
+    value = models.CharField("Dimension value", max_length=255)
+    count = models.PositiveIntegerField("Count", default=0)
+    total_time = models.FloatField("Total time", default=0)
+
+    class Meta:
+        unique_together = ("view_name", "method", "name", "value")
+        db_table = "speedinfo_storage_database_breakdown"
+
+
+class SlowRequestStorage(models.Model):
+    """
+    Database storage for the slow requests details
+    """
+    view_name = models.CharField("View name", max_length=255)
+    method = models.CharField("HTTP method", max_length=8)
+    path = models.CharField("Path", max_length=255)
+    query_hash = models.CharField("Query string hash", max_length=8, blank=True)
+    user_id = models.CharField("User ID", max_length=64, blank=True)
+    status_code = models.PositiveIntegerField("Status code", default=0)
+    is_cache_hit = models.BooleanField("Cache hit", default=False)
+    sql_count = models.PositiveIntegerField("SQL queries count", default=0)
+    sql_time = models.FloatField("SQL time", default=0)
+    duration = models.FloatField("Duration", default=0)
+    created_at = models.DateTimeField("Time")
+
+    class Meta:
+        index_together = ("view_name", "method")
+        db_table = "speedinfo_storage_database_slowrequest"
+
+
+class SnapshotStorage(models.Model):
+    """
+    Database storage for the snapshots of profiling data
+    """
+    name = models.CharField("Name", max_length=255)
+    started_at = models.DateTimeField("Started at")
+    finished_at = models.DateTimeField("Finished at")
+
+    class Meta:
+        db_table = "speedinfo_storage_database_snapshot"
+
+
+class SnapshotEntryStorage(models.Model):
+    """
+    Database storage for the profiling data of the snapshot
+    """
+    snapshot = models.ForeignKey(SnapshotStorage, related_name="entries", on_delete=models.CASCADE)
+    view_name = models.CharField("View name", max_length=255)
+    method = models.CharField("HTTP method", max_length=8)
+    anon_calls = models.PositiveIntegerField("Anonymous calls", default=0)
+    cache_hits = models.PositiveIntegerField("Cache hits", default=0)
+    sql_total_time = models.FloatField("SQL total time", default=0)
+    sql_total_count = models.PositiveIntegerField("SQL total queries count", default=0)
+    total_calls = models.PositiveIntegerField("Total calls", default=0)
+    sampled_calls = models.PositiveIntegerField("Sampled calls", default=0)
+    total_time = models.FloatField("Total time", default=0)
+    time_min = models.FloatField("Min time", default=0)
+    time_max = models.FloatField("Max time", default=0)
+    time_m2 = models.FloatField("Time sum of squared deviations", default=0)
+    sql_count_min = models.PositiveIntegerField("Min SQL queries count", default=0)
+    sql_count_max = models.PositiveIntegerField("Max SQL queries count", default=0)
+    sql_count_m2 = models.FloatField("SQL queries count sum of squared deviations", default=0)
+
+    class Meta:
+        db_table = "speedinfo_storage_database_snapshotentry"
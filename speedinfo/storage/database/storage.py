@@ -1,44 +1,457 @@
 # coding: utf-8
 
-from django.db import IntegrityError
-from django.db.models import ExpressionWrapper, F, FloatField, IntegerField
+import time
+from itertools import islice
+
+import django
+from django.db import IntegrityError, router, transaction
+from django.db.models import Case, ExpressionWrapper, F, FloatField, IntegerField, Value, When
 from django.forms import model_to_dict
 
-from speedinfo.models import ViewProfiler
-from speedinfo.storage.base import AbstractStorage
-from speedinfo.storage.database.models import Storage
+from speedinfo.conf import speedinfo_settings
+from speedinfo.models import SlowRequest, Snapshot, ViewProfiler
+from speedinfo.stats import get_decay, merge_values
+from speedinfo.storage.base import AbstractStorage, OTHER_VIEW_NAME, SUMMED_FIELDS, create_counters
+from speedinfo.storage.database.models import (
+    BreakdownStorage, SlowRequestStorage, SnapshotEntryStorage, SnapshotStorage, Storage,
+)
 
 
 class DatabaseStorage(AbstractStorage):
-    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time):
+    ITER_CHUNK_SIZE = 100
+
+    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight=1,
+            breakdowns=None):
+        self.merge([create_counters(
+            view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight, breakdowns,
+        )])
+
+    def merge(self, entries, node=None):
+        for counters in entries:
+            self.merge_entry(counters, node)
+
+    def merge_entry(self, counters, node=None):
+        """Merges raw counters of a single view into the database.
+
+        :param dict counters: raw counters as returned by :func:`speedinfo.storage.base.create_counters`
+        :param node: Name of the node which aggregated the counters
+        :type node: str or None
+        """
+        view_name = counters["view_name"]
+        method = counters["method"]
+        calls = counters["total_calls"]
+
         try:
             vp, created = Storage.objects.get_or_create(view_name=view_name, method=method)
         except IntegrityError:
             # IntegrityError raised in the case of concurrent access
             # to get_or_create method from another application worker/thread
             vp = Storage.objects.get(view_name=view_name, method=method)
+        else:
+            if created and (view_name != OTHER_VIEW_NAME):
+                vp.time_error = self.evict(vp)
+
+        # Dispersion stats and extremes are calculated from the values read by get_or_create,
+        # so concurrent updates may make them slightly inaccurate. Counters are updated atomically.
+        if vp.total_calls > 0:
+            vp.time_min = min(vp.time_min, counters["time_min"])
+            vp.time_max = max(vp.time_max, counters["time_max"])
+            vp.sql_count_min = min(vp.sql_count_min, counters["sql_count_min"])
+            vp.sql_count_max = max(vp.sql_count_max, counters["sql_count_max"])
+        else:
+            vp.time_min = counters["time_min"]
+            vp.time_max = counters["time_max"]
+            vp.sql_count_min = counters["sql_count_min"]
+            vp.sql_count_max = counters["sql_count_max"]
+
+        vp.time_m2 = F("time_m2") + (merge_values(
+            vp.total_calls, vp.total_time, vp.time_m2, calls, counters["total_time"], counters["time_m2"],
+        ) - vp.time_m2)
+        vp.sql_count_m2 = F("sql_count_m2") + (merge_values(
+            vp.total_calls, vp.sql_total_count, vp.sql_count_m2,
+            calls, counters["sql_total_count"], counters["sql_count_m2"],
+        ) - vp.sql_count_m2)
+
+        if speedinfo_settings.SPEEDINFO_EWMA_HALF_LIFE and calls > 0:
+            self.add_ewma(
+                vp, counters["sql_total_count"] / float(calls), counters["total_time"] / float(calls), calls,
+            )
+
+        for field in SUMMED_FIELDS:
+            setattr(vp, field, F(field) + counters[field])
 
-        vp.anon_calls = F("anon_calls") + (is_anon_call and 1 or 0)
-        vp.cache_hits = F("cache_hits") + (is_cache_hit and 1 or 0)
-        vp.sql_total_time = F("sql_total_time") + sql_time
-        vp.sql_total_count = F("sql_total_count") + sql_count
-        vp.total_calls = F("total_calls") + 1
-        vp.total_time = F("total_time") + view_execution_time
         vp.save()
 
-    def fetch_all(self, ordering=None):
+        breakdowns = dict(counters.get("breakdowns") or {})
+
+        if node is not None:
+            breakdowns["node"] = {node: (calls, counters["total_time"])}
+
+        self.add_breakdowns(view_name, method, breakdowns)
+
+    def evict(self, vp):
+        """Folds the entry with the least total time into the 'other' entry of the same
+        HTTP method once the number of entries exceeds SPEEDINFO_STORAGE_MAX_ENTRIES.
+        New entry inherits the total time of the evicted one as an error (Space-Saving
+        algorithm), so the views called often enough replace each other in the top
+        instead of being evicted right after they are added.
+
+        :param vp: New entry
+        :type vp: :class:`speedinfo.storage.database.models.Storage`
+        :return: total time inherited by the new entry
+        :rtype: float
+        """
+        limit = speedinfo_settings.SPEEDINFO_STORAGE_MAX_ENTRIES
+
+        if not limit:
+            return 0
+
+        qs = Storage.objects.exclude(view_name=OTHER_VIEW_NAME).exclude(pk=vp.pk)
+
+        if qs.count() < limit:
+            return 0
+
+        evicted = qs.annotate(rank=F("total_time") + F("time_error")).order_by("rank", "pk").first()
+        key = (evicted.view_name, evicted.method)
+        counters = model_to_dict(evicted, fields=self.COUNTER_FIELDS)
+        counters["breakdowns"] = self.fetch_all_breakdowns([key]).get(key, {})
+
+        # Entry may be evicted concurrently by another application worker/thread
+        qs = Storage.objects.filter(pk=evicted.pk)
+
+        if django.VERSION < (1, 9):
+            # Number of deleted rows isn't returned by delete()
+            deleted = qs.exists()
+            qs.delete()
+        else:
+            deleted, _ = qs.delete()
+
+        if deleted:
+            BreakdownStorage.objects.filter(view_name=evicted.view_name, method=evicted.method).delete()
+            SlowRequestStorage.objects.filter(view_name=evicted.view_name, method=evicted.method).delete()
+
+            if evicted.total_calls:
+                self.merge_entry(dict(counters, view_name=OTHER_VIEW_NAME))
+
+        return evicted.total_time + evicted.time_error
+
+    def add_ewma(self, vp, sql_count, view_execution_time, weight):
+        """Sets update expressions of the moving averages. Decay is calculated
+        from the update time read by get_or_create, weights and averages are updated atomically.
+
+        :param vp: Entry to update
+        :type vp: :class:`speedinfo.storage.database.models.Storage`
+        :param float sql_count: Number of executed SQL queries per call
+        :param float view_execution_time: View execution time per call
+        :param int weight: Number of requests represented by the values
+        """
+        now = time.time()
+        decay = get_decay(now - (vp.ewma_updated_at or now), speedinfo_settings.SPEEDINFO_EWMA_HALF_LIFE)
+        total_weight = F("ewma_weight") * decay
+
+        # Fields are saved in the order of declaration, so the averages are calculated from the previous weight
+        # even by the databases which use the updated values in the subsequent assignments (e.g. MySQL)
+        vp.ewma_time_per_call = (
+            (F("ewma_time_per_call") * total_weight + view_execution_time * weight) / (total_weight + weight)
+        )
+        vp.ewma_sql_count_per_call = (
+            (F("ewma_sql_count_per_call") * total_weight + sql_count * weight) / (total_weight + weight)
+        )
+        vp.ewma_weight = total_weight + weight
+        vp.ewma_updated_at = now
+
+    def add_breakdowns(self, view_name, method, breakdowns):
+        """Increments the counters of all dimension values of the entry. Existing counters
+        are read with one query and updated with another, missing ones are inserted in bulk.
+
+        :param str view_name: View name
+        :param str method: HTTP method
+        :param dict breakdowns: dict of dimension names to dict of dimension values to (count, time) pairs
+        """
+        increments = {}
+
+        for name, values in breakdowns.items():
+            for value, (count, total_time) in values.items():
+                item = increments.setdefault((name, value[:255]), [0, 0])
+                item[0] += count
+                item[1] += total_time
+
+        if not increments:
+            return
+
+        ids = dict(
+            ((name, value), pk)
+            for pk, name, value in BreakdownStorage.objects.filter(
+                view_name=view_name, method=method, name__in=set(name for name, _ in increments),
+            ).values_list("pk", "name", "value")
+            if (name, value) in increments
+        )
+
+        if ids:
+            counts = [When(pk=pk, then=Value(increments[key][0])) for key, pk in ids.items()]
+            times = [When(pk=pk, then=Value(increments[key][1])) for key, pk in ids.items()]
+            BreakdownStorage.objects.filter(pk__in=list(ids.values())).update(
+                count=F("count") + Case(*counts, default=Value(0), output_field=IntegerField()),
+                total_time=F("total_time") + Case(*times, default=Value(0.0), output_field=FloatField()),
+            )
+
+        missing = [key for key in increments if key not in ids]
+
+        if missing:
+            try:
+                with transaction.atomic(using=router.db_for_write(BreakdownStorage)):
+                    BreakdownStorage.objects.bulk_create([
+                        BreakdownStorage(
+                            view_name=view_name, method=method, name=name, value=value,
+                            count=increments[(name, value)][0], total_time=increments[(name, value)][1],
+                        )
+                        for name, value in missing
+                    ])
+            except IntegrityError:
+                # Some of the entries were created concurrently by another application worker/thread
+                for name, value in missing:
+                    self.add_breakdown(view_name, method, name, value, *increments[(name, value)])
+
+    def add_breakdown(self, view_name, method, name, value, count, time):
+        """Increments the counters of the dimension value.
+
+        :param str view_name: View name
+        :param str method: HTTP method
+        :param str name: Dimension name
+        :param str value: Dimension value
+        :param int count: Count to add
+        :param float time: Time to add
+        """
+        lookup = dict(view_name=view_name, method=method, name=name, value=value[:255])
+        updated = BreakdownStorage.objects.filter(**lookup).update(
+            count=F("count") + count,
+            total_time=F("total_time") + time,
+        )
+
+        if not updated:
+            try:
+                BreakdownStorage.objects.create(count=count, total_time=time, **lookup)
+            except IntegrityError:
+                # Entry was created concurrently by another application worker/thread
+                BreakdownStorage.objects.filter(**lookup).update(
+                    count=F("count") + count,
+                    total_time=F("total_time") + time,
+                )
+
+    def get_variance_expression(self, m2_field):
+        """Returns expression of the sample variance. Standard deviation is calculated
+        by the model, variance is used to sort the entries by it in the database.
+
+        :param str m2_field: Name of the field with the sum of squared deviations
+        :rtype: :class:`django.db.models.Expression`
+        """
+        return Case(
+            When(total_calls__gt=1, then=ExpressionWrapper(
+                F(m2_field) / (F("total_calls") - 1.0), output_field=FloatField(),
+            )),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+
+    def get_ordering(self, ordering):
+        """Replaces standard deviations in the ordering with the variances.
+
+        :param ordering: list of field names, e.g. ['-time_stddev']
+        :type ordering: list[str]
+        :rtype: list[str]
+        """
+        return [field.replace("_stddev", "_variance") for field in ordering]
+
+    def get_queryset(self, filters=None):
+        """Returns annotated queryset of the entries matching the filters.
+
+        :param filters: filters to apply, see :meth:`speedinfo.storage.base.AbstractStorage.fetch_all`
+        :type filters: dict or None
+        :rtype: :class:`django.db.models.QuerySet`
+        """
         qs = Storage.objects.annotate(
             anon_calls_ratio=ExpressionWrapper(100.0 * F("anon_calls") / F("total_calls"), output_field=FloatField()),
             cache_hits_ratio=ExpressionWrapper(100.0 * F("cache_hits") / F("total_calls"), output_field=FloatField()),
             sql_count_per_call=ExpressionWrapper(F("sql_total_count") / F("total_calls"), output_field=IntegerField()),
             sql_time_ratio=ExpressionWrapper(100.0 * F("sql_total_time") / F("total_time"), output_field=FloatField()),
             time_per_call=ExpressionWrapper(F("total_time") / F("total_calls"), output_field=FloatField()),
+            time_variance=self.get_variance_expression("time_m2"),
+            sql_count_variance=self.get_variance_expression("sql_count_m2"),
+        )
+        filters = filters or {}
+
+        if filters.get("view_name"):
+            qs = qs.filter(view_name__icontains=filters["view_name"])
+
+        if filters.get("method"):
+            qs = qs.filter(method=filters["method"])
+
+        if filters.get("min_calls") is not None:
+            qs = qs.filter(total_calls__gte=filters["min_calls"])
+
+        if filters.get("min_time_per_call") is not None:
+            qs = qs.filter(time_per_call__gte=filters["min_time_per_call"])
+
+        return qs
+
+    def fetch_all(self, ordering=None, filters=None, offset=0, limit=None):
+        qs = self.get_queryset(filters)
+
+        if ordering:
+            qs = qs.order_by(*self.get_ordering(ordering))
+
+        if limit is None:
+            qs = qs[offset:]
+        else:
+            qs = qs[offset:offset + limit]
+
+        return self.get_entries(qs)
+
+    def iter_all(self, ordering=None, filters=None):
+        qs = self.get_queryset(filters)
+
+        if ordering:
+            qs = qs.order_by(*self.get_ordering(ordering))
+
+        iterator = qs.iterator()
+
+        while True:
+            entries = self.get_entries(islice(iterator, self.ITER_CHUNK_SIZE))
+
+            if not entries:
+                break
+
+            for entry in entries:
+                yield entry
+
+    def get_entries(self, items):
+        """Converts the storage items to the entries with the breakdowns attached.
+
+        :param items: iterable of :class:`speedinfo.storage.database.models.Storage`
+        :rtype: list[:class:`speedinfo.models.ViewProfiler`]
+        """
+        entries = [ViewProfiler(**model_to_dict(item)) for item in items]
+        breakdowns = self.fetch_all_breakdowns([(entry.view_name, entry.method) for entry in entries])
+
+        for entry in entries:
+            entry.breakdowns = breakdowns.get((entry.view_name, entry.method), {})
+
+        return entries
+
+    def fetch_counters(self):
+        return list(Storage.objects.values(*self.COUNTER_FIELDS))
+
+    def fetch_all_breakdowns(self, keys=None, names=None):
+        """Returns counters of the entries broken down by all or the named dimensions.
+
+        :param keys: list of (view name, method) pairs to return the counters for, all entries if None
+        :type keys: list[tuple(str, str)] or None
+        :param names: Dimension names, all dimensions if None
+        :type names: list[str] or None
+        :return: dict of (view name, method) pairs to dict of dimension names
+            to dict of dimension values to (count, time) pairs
+        :rtype: dict
+        """
+        qs = BreakdownStorage.objects.all()
+
+        if keys is not None:
+            if not keys:
+                return {}
+
+            qs = qs.filter(view_name__in=set(view_name for view_name, method in keys))
+
+        if names is not None:
+            qs = qs.filter(name__in=names)
+
+        keys = None if keys is None else set(keys)
+        results = {}
+
+        for item in qs.values_list("view_name", "method", "name", "value", "count", "total_time"):
+            if (keys is None) or (item[:2] in keys):
+                breakdown = results.setdefault(item[:2], {}).setdefault(item[2], {})
+                breakdown[item[3]] = (item[4], item[5])
+
+        return results
+
+    def fetch_breakdowns(self, name, keys=None):
+        return self.fetch_breakdowns_by_names([name], keys)[name]
+
+    def fetch_breakdowns_by_names(self, names, keys=None):
+        results = dict((name, {}) for name in names)
+
+        for key, breakdowns in self.fetch_all_breakdowns(keys, names).items():
+            for name, breakdown in breakdowns.items():
+                results[name][key] = breakdown
+
+        return results
+
+    def count(self, filters=None):
+        return self.get_queryset(filters).count()
+
+    def add_slow_request(self, view_name, method, path, query_hash, user_id, status_code, is_cache_hit,
+                         sql_time, sql_count, duration, created_at):
+        SlowRequestStorage.objects.create(
+            view_name=view_name, method=method, path=path[:255], query_hash=query_hash, user_id=user_id,
+            status_code=status_code, is_cache_hit=is_cache_hit, sql_time=sql_time, sql_count=sql_count,
+            duration=duration, created_at=created_at,
         )
 
+        # Keep only the most recent requests of the view
+        stale_ids = list(SlowRequestStorage.objects.filter(
+            view_name=view_name, method=method,
+        ).order_by("-created_at", "-id").values_list(
+            "id", flat=True,
+        )[speedinfo_settings.SPEEDINFO_SLOW_REQUESTS_PER_VIEW:])
+
+        if stale_ids:
+            SlowRequestStorage.objects.filter(id__in=stale_ids).delete()
+
+    def fetch_slow_requests(self, ordering=None):
+        slowest_ids = SlowRequestStorage.objects.order_by("-duration").values_list(
+            "id", flat=True,
+        )[:speedinfo_settings.SPEEDINFO_SLOW_REQUESTS_LIMIT]
+        qs = SlowRequestStorage.objects.filter(id__in=list(slowest_ids))
+
         if ordering:
             qs = qs.order_by(*ordering)
 
-        return [ViewProfiler(**model_to_dict(item)) for item in qs]
+        return [SlowRequest(**model_to_dict(item, exclude=["id"])) for item in qs]
+
+    def add_snapshot(self, name, started_at, finished_at, entries):
+        snapshot = SnapshotStorage.objects.create(name=name, started_at=started_at, finished_at=finished_at)
+        SnapshotEntryStorage.objects.bulk_create([
+            SnapshotEntryStorage(snapshot=snapshot, **entry) for entry in entries
+        ])
+
+        stale_ids = list(SnapshotStorage.objects.order_by("-finished_at", "-id").values_list(
+            "id", flat=True,
+        )[speedinfo_settings.SPEEDINFO_SNAPSHOTS_LIMIT:])
+
+        if stale_ids:
+            SnapshotStorage.objects.filter(id__in=stale_ids).delete()
+
+        return str(snapshot.id)
+
+    def fetch_snapshots(self, ordering=None):
+        qs = SnapshotStorage.objects.all()
+
+        if ordering:
+            qs = qs.order_by(*ordering)
+
+        return [
+            Snapshot(id=str(item.id), name=item.name, started_at=item.started_at, finished_at=item.finished_at)
+            for item in qs
+        ]
+
+    def fetch_snapshot_counters(self, snapshot_id):
+        try:
+            snapshot = SnapshotStorage.objects.get(id=snapshot_id)
+        except (SnapshotStorage.DoesNotExist, ValueError):
+            return None
+
+        return list(snapshot.entries.values(*self.COUNTER_FIELDS))
 
     def reset(self):
         Storage.objects.all().delete()
+        BreakdownStorage.objects.all().delete()
+        SlowRequestStorage.objects.all().delete()
@@ -0,0 +1,197 @@
+# coding: utf-8
+
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from django.db import close_old_connections
+
+from speedinfo.conf import speedinfo_settings
+from speedinfo.storage.base import AbstractStorage, create_counters, merge_counters, upgrade_storage_class
+from speedinfo.utils import import_class
+
+try:
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+except ImportError:
+    from urllib2 import HTTPError, Request, urlopen  # Python 2
+
+logger = logging.getLogger(__name__)
+
+
+class NodeStorage(AbstractStorage):
+    """
+    Storage for multi-node deployments. Profiling data is aggregated in the process
+    memory and the aggregated counters are shipped by the background thread every
+    SPEEDINFO_NODE_FLUSH_INTERVAL seconds, so the shared storage gets one update
+    per view and interval instead of one update per request. Counters are sent
+    to the collector endpoint (SPEEDINFO_NODE_COLLECTOR_URL) or merged directly
+    into SPEEDINFO_NODE_STORAGE, which is also used to read the data.
+    """
+    def __init__(self):
+        self.storage = upgrade_storage_class(import_class(speedinfo_settings.SPEEDINFO_NODE_STORAGE))()
+        self.node = speedinfo_settings.SPEEDINFO_NODE_NAME or socket.gethostname()
+        self.collector_url = speedinfo_settings.SPEEDINFO_NODE_COLLECTOR_URL
+        self.flush_interval = speedinfo_settings.SPEEDINFO_NODE_FLUSH_INTERVAL
+
+        self._entries = {}
+        self._flusher = None
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def ensure_flusher(self):
+        """Starts the background flusher thread. Restarts it
+        in the child process after fork. Remaining counters are
+        flushed on the process exit.
+        """
+        if self._flusher_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._flusher_pid != os.getpid():
+                # Data aggregated before fork belongs to the parent process
+                self._entries = {}
+                self._flusher = threading.Thread(target=self.run_flusher, name="speedinfo-node-flusher")
+                self._flusher.daemon = True
+                self._flusher.start()
+                self._flusher_pid = os.getpid()
+                atexit.register(self.flush)
+
+    def run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+
+            try:
+                self.flush()
+            except Exception:
+                # Thread must survive any error, otherwise the counters are never shipped again
+                logger.exception("Failed to flush profiling data")
+            finally:
+                # Connections opened by the thread aren't closed by the request handlers
+                close_old_connections()
+
+    def flush(self):
+        """Ships the aggregated counters in batches of SPEEDINFO_NODE_BATCH_SIZE entries.
+        Counters are kept until the next flush if the collector or the storage is unavailable.
+        Batches rejected by the collector (e.g. too large or invalid) are dropped.
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries = {}
+
+        batch_size = max(speedinfo_settings.SPEEDINFO_NODE_BATCH_SIZE or len(entries), 1)
+
+        for offset in range(0, len(entries), batch_size):
+            try:
+                self.send(entries[offset:offset + batch_size])
+            except HTTPError as e:
+                if 400 <= e.code < 500:
+                    # Retrying the batch won't help
+                    logger.error("Collector rejected profiling data: %s", e)
+                    continue
+
+                logger.warning("Failed to ship profiling data: %s", e)
+            except (IOError, OSError, socket.error) as e:
+                logger.warning("Failed to ship profiling data: %s", e)
+            except Exception:
+                logger.exception("Failed to ship profiling data")
+            else:
+                continue
+
+            # Remaining batches are shipped on the next flush
+            with self._lock:
+                for counters in entries[offset:]:
+                    self.aggregate(counters)
+
+            break
+
+    def send(self, entries):
+        """Sends the counters to the collector or merges them into the storage.
+
+        :param entries: raw counters as returned by :func:`speedinfo.storage.base.create_counters`
+        :type entries: list[dict]
+        """
+        if not self.collector_url:
+            self.storage.merge(entries, node=self.node)
+            return
+
+        request = Request(
+            self.collector_url,
+            data=json.dumps({"node": self.node, "entries": entries}).encode("utf-8"),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": "Token {}".format(speedinfo_settings.SPEEDINFO_COLLECTOR_TOKEN),
+            },
+        )
+        urlopen(request, timeout=10).close()
+
+    def aggregate(self, counters):
+        """Merges the counters into the process memory. Should be called with the lock acquired.
+
+        :param dict counters: raw counters as returned by :func:`speedinfo.storage.base.create_counters`
+        """
+        key = (counters["view_name"], counters["method"])
+        merge_counters(self._entries.setdefault(key, {"view_name": key[0], "method": key[1]}), counters)
+
+    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight=1,
+            breakdowns=None):
+        self.ensure_flusher()
+        counters = create_counters(
+            view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight, breakdowns,
+        )
+
+        with self._lock:
+            self.aggregate(counters)
+
+    def merge(self, entries, node=None):
+        self.storage.merge(entries, node)
+
+    def fetch_all(self, ordering=None, filters=None, offset=0, limit=None):
+        return self.storage.fetch_all(ordering, filters, offset, limit)
+
+    def iter_all(self, ordering=None, filters=None):
+        return self.storage.iter_all(ordering, filters)
+
+    def fetch_counters(self):
+        return self.storage.fetch_counters()
+
+    def fetch_breakdowns(self, name, keys=None):
+        return self.storage.fetch_breakdowns(name, keys)
+
+    def fetch_breakdowns_by_names(self, names, keys=None):
+        return self.storage.fetch_breakdowns_by_names(names, keys)
+
+    def count_evictions(self):
+        return self.storage.count_evictions()
+
+    def count(self, filters=None):
+        return self.storage.count(filters)
+
+    def add_slow_request(self, view_name, method, path, query_hash, user_id, status_code, is_cache_hit,
+                         sql_time, sql_count, duration, created_at):
+        self.storage.add_slow_request(
+            view_name, method, path, query_hash, user_id, status_code, is_cache_hit,
+            sql_time, sql_count, duration, created_at,
+        )
+
+    def fetch_slow_requests(self, ordering=None):
+        return self.storage.fetch_slow_requests(ordering)
+
+    def add_snapshot(self, name, started_at, finished_at, entries):
+        return self.storage.add_snapshot(name, started_at, finished_at, entries)
+
+    def fetch_snapshots(self, ordering=None):
+        return self.storage.fetch_snapshots(ordering)
+
+    def fetch_snapshot_counters(self, snapshot_id):
+        return self.storage.fetch_snapshot_counters(snapshot_id)
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+
+        self.storage.reset()
@@ -0,0 +1,249 @@
+# coding: utf-8
+
+import os
+import re
+import socket
+import threading
+
+from speedinfo.conf import speedinfo_settings
+from speedinfo.storage.base import AbstractStorage
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Python 2
+
+
+def pack_lines(lines, max_size):
+    """Packs metric lines into newline-separated datagrams
+    not exceeding the specified size.
+
+    :param lines: list of metric lines
+    :type lines: list[str]
+    :param int max_size: maximum datagram size in bytes
+    :return: list of datagrams
+    :rtype: list[bytes]
+    """
+    packets = []
+    packet = []
+    packet_size = 0
+
+    for line in lines:
+        line = line.encode("utf-8")
+
+        # Line separator is taken into account
+        if packet and (packet_size + len(line) + 1 > max_size):
+            packets.append(b"\n".join(packet))
+            packet = []
+            packet_size = 0
+
+        packet_size += len(line) + (1 if packet else 0)
+        packet.append(line)
+
+    if packet:
+        packets.append(b"\n".join(packet))
+
+    return packets
+
+
+def format_ms(seconds):
+    """Formats the duration in milliseconds with up to 3 decimal places,
+    the same way on Python 2 and 3 (e.g. '1250', '0.5').
+
+    :param float seconds: Duration in seconds
+    :rtype: str
+    """
+    return "{:.3f}".format(seconds * 1000).rstrip("0").rstrip(".")
+
+
+class StatsdStorage(AbstractStorage):
+    """
+    Write-only storage that emits profiling data as StatsD or DogStatsD
+    UDP packets instead of storing aggregates. Metrics are queued and sent
+    in batches by the background thread, so requests never block on I/O.
+    The thread sends the metrics every SPEEDINFO_STATSD_FLUSH_INTERVAL seconds
+    or as soon as the queue holds a full packet. Metrics are dropped if the queue
+    is full, the number of dropped metrics is sent as `dropped` counter.
+    """
+    INVALID_CHARS_RE = re.compile(r"[:|@#,\s]")
+
+    # Breakdowns which hold sizes in bytes instead of time, sent as counters
+    SIZE_BREAKDOWNS = ("size",)
+
+    def __init__(self):
+        self.address = (speedinfo_settings.SPEEDINFO_STATSD_HOST, speedinfo_settings.SPEEDINFO_STATSD_PORT)
+        self.prefix = speedinfo_settings.SPEEDINFO_STATSD_PREFIX
+        self.dogstatsd = speedinfo_settings.SPEEDINFO_STATSD_DOGSTATSD
+        self.max_packet_size = speedinfo_settings.SPEEDINFO_STATSD_MAX_PACKET_SIZE
+        self.flush_interval = speedinfo_settings.SPEEDINFO_STATSD_FLUSH_INTERVAL
+        self.dropped = 0
+
+        self._reported_dropped = 0
+        self._queued_size = 0
+        self._wakeup = threading.Event()
+        self._queue = queue.Queue(speedinfo_settings.SPEEDINFO_STATSD_QUEUE_SIZE)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._flusher = None
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def ensure_flusher(self):
+        """Starts the background flusher thread. Restarts it
+        in the child process after fork.
+        """
+        if self._flusher_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._flusher_pid != os.getpid():
+                self._flusher = threading.Thread(target=self.run_flusher, name="speedinfo-statsd-flusher")
+                self._flusher.daemon = True
+                self._flusher.start()
+                self._flusher_pid = os.getpid()
+
+    def run_flusher(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Sends all queued metrics and the number of metrics dropped since the previous flush."""
+        self._queued_size = 0
+        lines = []
+
+        while True:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        dropped = self.dropped - self._reported_dropped
+
+        if dropped > 0:
+            lines.append("{}.dropped:{}|c".format(self.prefix, dropped))
+            self._reported_dropped += dropped
+
+        for packet in pack_lines(lines, self.max_packet_size):
+            try:
+                self._socket.sendto(packet, self.address)
+            except (socket.error, OSError):
+                pass
+
+    def format_metric(self, view_name, method, name, value, metric_type, tags=(), weight=1):
+        """Formats metric line in StatsD or DogStatsD format.
+
+        :param str view_name: View name
+        :param str method: HTTP method
+        :param str name: Metric name
+        :param value: Metric value
+        :param str metric_type: StatsD metric type (`c`, `ms`, etc.)
+        :param tags: DogStatsD tags in addition to the view and method
+        :type tags: tuple(tuple(str, str))
+        :param int weight: Number of requests represented by the metric, sent as a sample rate
+        :rtype: str
+        """
+        sample_rate = "|@{:g}".format(1.0 / weight) if weight != 1 else ""
+
+        if self.dogstatsd:
+            tags = (("view", view_name), ("method", method)) + tuple(tags)
+            return "{}.{}:{}|{}{}|#{}".format(
+                self.prefix, name, value, metric_type, sample_rate,
+                ",".join("{}:{}".format(key, self.INVALID_CHARS_RE.sub("_", tag_value)) for key, tag_value in tags),
+            )
+
+        return "{}.{}.{}.{}:{}|{}{}".format(
+            self.prefix, self.INVALID_CHARS_RE.sub("_", view_name), self.INVALID_CHARS_RE.sub("_", method),
+            name, value, metric_type, sample_rate,
+        )
+
+    def emit(self, view_name, method, metrics, weight=1):
+        """Queues metrics to be sent by the background thread.
+
+        :param str view_name: View name
+        :param str method: HTTP method
+        :param metrics: list of (metric name, value, metric type, DogStatsD tags)
+        :type metrics: list[tuple]
+        :param int weight: Number of requests represented by the metrics
+        """
+        self.ensure_flusher()
+        queued_size = 0
+
+        for name, value, metric_type, tags in metrics:
+            line = self.format_metric(view_name, method, name, value, metric_type, tags, weight)
+
+            try:
+                self._queue.put_nowait(line)
+            except queue.Full:
+                self.dropped += 1
+            else:
+                queued_size += len(line) + 1
+
+        # Size is approximate since it's updated by the request threads without the lock
+        self._queued_size += queued_size
+
+        if self._queued_size >= self.max_packet_size:
+            self._queued_size = 0
+            self._wakeup.set()
+
+    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time, weight=1,
+            breakdowns=None):
+        metrics = [
+            ("calls", 1, "c", ()),
+            ("time", format_ms(view_execution_time), "ms", ()),
+            ("sql_count", sql_count, "c", ()),
+            ("sql_time", format_ms(sql_time), "ms", ()),
+        ]
+
+        if is_anon_call:
+            metrics.append(("anon_calls", 1, "c", ()))
+
+        if is_cache_hit:
+            metrics.append(("cache_hits", 1, "c", ()))
+
+        for name, values in sorted((breakdowns or {}).items()):
+            for value, (count, total_time) in sorted(values.items()):
+                if self.dogstatsd:
+                    # Values are sent as tags, so the number of metric names doesn't grow with them
+                    name_prefix, tags = name, ((name, value),)
+                else:
+                    # Dots in the values (e.g. exception names) would split the metric path
+                    name_prefix = "{}.{}".format(name, self.INVALID_CHARS_RE.sub("_", value).replace(".", "_"))
+                    tags = ()
+
+                metrics.append((name_prefix + ".count", count, "c", tags))
+
+                if name in self.SIZE_BREAKDOWNS:
+                    metrics.append((name_prefix + ".bytes", total_time, "c", tags))
+                else:
+                    metrics.append((name_prefix + ".time", format_ms(total_time), "ms", tags))
+
+        self.emit(view_name, method, metrics, weight)
+
+    def add_slow_request(self, view_name, method, path, query_hash, user_id, status_code, is_cache_hit,
+                         sql_time, sql_count, duration, created_at):
+        self.emit(view_name, method, [("slow_requests", 1, "c", ())])
+
+    def fetch_all(self, ordering=None, filters=None, offset=0, limit=None):
+        return []
+
+    def fetch_breakdowns(self, name, keys=None):
+        return {}
+
+    def count(self, filters=None):
+        return 0
+
+    def fetch_slow_requests(self, ordering=None):
+        return []
+
+    def add_snapshot(self, name, started_at, finished_at, entries):
+        pass
+
+    def fetch_snapshots(self, ordering=None):
+        return []
+
+    def fetch_snapshot_counters(self, snapshot_id):
+        return None
+
+    def reset(self):
+        pass
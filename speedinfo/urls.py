@@ -0,0 +1,10 @@
+# coding: utf-8
+
+from django.conf.urls import url
+
+from speedinfo.views import CollectorView, MetricsView
+
+urlpatterns = [
+    url(r"^metrics/$", MetricsView.as_view(), name="speedinfo-metrics"),
+    url(r"^collect/$", CollectorView.as_view(), name="speedinfo-collect"),
+]
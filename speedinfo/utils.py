@@ -1,7 +1,14 @@
 # coding: utf-8
 
+import threading
+from collections import OrderedDict
 from importlib import import_module
 
+try:
+    from django.urls import resolve, Resolver404  # Django >= 1.10
+except ImportError:
+    from django.core.urlresolvers import resolve, Resolver404
+
 
 def import_class(module_path):
     """Import class by string path.
@@ -18,3 +25,143 @@ def import_class(module_path):
     except (AttributeError, ImportError) as e:
         msg = "Could not import '{}'. {}: {}.".format(module_path, e.__class__.__name__, e)
         raise ImportError(msg)
+
+
+def resolve_view_name(path):
+    """Returns full view name for the path, eg. 'app.module.view_name'.
+
+    :param str path: Requested path
+    :return: view name or None if name can't be resolved
+    :rtype: str or None
+    """
+    try:
+        return resolve(path)._func_path
+    except Resolver404:
+        return None
+
+
+def resolve_request(request):
+    """Resolves requested path once and caches the result in the request object.
+
+    :type request: :class:`django.http.HttpRequest`
+    :return: resolver match or None if path can't be resolved
+    :rtype: :class:`django.urls.ResolverMatch` or None
+    """
+    if not hasattr(request, "_speedinfo_resolver_match"):
+        try:
+            request._speedinfo_resolver_match = resolve(request.path)
+        except Resolver404:
+            request._speedinfo_resolver_match = None
+
+    return request._speedinfo_resolver_match
+
+
+def get_view_name(request):
+    """Returns full view name for the request, eg. 'app.module.view_name'.
+
+    :type request: :class:`django.http.HttpRequest`
+    :return: view name or None if name can't be resolved
+    :rtype: str or None
+    """
+    match = resolve_request(request)
+    return match._func_path if match else None
+
+
+def get_exception_name(exception_type):
+    """Returns full name of the exception class, eg. 'django.http.response.Http404'.
+    Module name is omitted for built-in exceptions.
+
+    :param type exception_type: Exception class
+    :rtype: str
+    """
+    if exception_type.__module__ in ("builtins", "exceptions"):
+        return exception_type.__name__
+
+    return "{}.{}".format(exception_type.__module__, exception_type.__name__)
+
+
+def get_status_class(status_code):
+    """Returns status class of the response, eg. '2xx'.
+
+    :param int status_code: Response status code
+    :rtype: str
+    """
+    return "{}xx".format(status_code // 100)
+
+
+# Multipliers to convert the request start timestamp to seconds
+TIMESTAMP_UNITS = {"s": 1, "ms": 1e-3, "us": 1e-6}
+
+
+def parse_request_start(value, unit=None):
+    """Parses the time when the proxy received the request, e.g. X-Request-Start header value
+    in one of the formats 't=1609459200.123' (nginx), 't=1609459200123456' (Apache) or '1609459200123' (Heroku).
+
+    :param str value: Header value
+    :param unit: Unit of the timestamp, one of 's', 'ms' or 'us'. Unit is guessed by the magnitude if None.
+    :type unit: str or None
+    :return: Unix timestamp in seconds or None if the value is invalid
+    :rtype: float or None
+    """
+    try:
+        timestamp = float(value.strip()[2:] if value.strip().startswith("t=") else value)
+    except ValueError:
+        return None
+
+    if unit is None:
+        if timestamp > 1e14:
+            unit = "us"
+        elif timestamp > 1e11:
+            unit = "ms"
+        else:
+            unit = "s"
+
+    return timestamp * TIMESTAMP_UNITS[unit]
+
+
+def get_header_name(meta_key):
+    """Returns HTTP header name by the key of `request.META`, eg. 'X-Request-Start'.
+
+    :param str meta_key: Key of `request.META`, eg. 'HTTP_X_REQUEST_START'
+    :rtype: str
+    """
+    if meta_key.startswith("HTTP_"):
+        meta_key = meta_key[5:]
+
+    return "-".join(part.capitalize() for part in meta_key.split("_"))
+
+
+class LRUCache(object):
+    """
+    Thread-safe bounded mapping which discards
+    the least recently used items first.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return default
+
+            self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+
+            if len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
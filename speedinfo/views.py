@@ -0,0 +1,72 @@
+# coding: utf-8
+
+import json
+
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+
+from speedinfo import profiler
+from speedinfo.conf import speedinfo_settings
+from speedinfo.metrics import OPENMETRICS_CONTENT_TYPE, PROMETHEUS_CONTENT_TYPE, get_breakdown_metrics, render_metrics
+from speedinfo.storage.base import validate_counters
+
+
+class MetricsView(View):
+    """
+    Exposes profiling data for Prometheus scraping. Renders OpenMetrics
+    format if scraper accepts it, Prometheus text format otherwise.
+    """
+    def get(self, request, *args, **kwargs):
+        openmetrics = "application/openmetrics-text" in request.META.get("HTTP_ACCEPT", "")
+        output = render_metrics(
+            profiler.storage.fetch_counters(), profiler.is_on, openmetrics=openmetrics, overhead=profiler.overhead,
+            breakdowns=profiler.storage.fetch_breakdowns_by_names([name for name, _, _ in get_breakdown_metrics()]),
+            evictions=profiler.storage.count_evictions(),
+        )
+
+        return HttpResponse(
+            output,
+            content_type=OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE,
+        )
+
+
+class CollectorView(View):
+    """
+    Receives the counters aggregated by the application nodes
+    (see :class:`speedinfo.storage.node.storage.NodeStorage`) and merges them
+    into the profiler storage. Requests are authorized by SPEEDINFO_COLLECTOR_TOKEN,
+    collector is disabled if the token is not set.
+    """
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super(CollectorView, self).dispatch(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        token = speedinfo_settings.SPEEDINFO_COLLECTOR_TOKEN
+
+        if not token or not constant_time_compare(
+            request.META.get("HTTP_AUTHORIZATION", ""), "Token {}".format(token),
+        ):
+            return HttpResponseForbidden()
+
+        try:
+            data = json.loads(request.body.decode("utf-8"))
+            node = str(data["node"])
+            entries = list(data["entries"])
+        except (ValueError, TypeError, KeyError):
+            return HttpResponseBadRequest()
+
+        # Entries are validated before the merge to avoid partially applied updates
+        if not all(validate_counters(entry) for entry in entries):
+            return HttpResponseBadRequest()
+
+        try:
+            profiler.storage.merge(entries, node=node)
+        except NotImplementedError:
+            # Storage is write-only (e.g. StatsD), nodes shouldn't retry
+            return HttpResponseBadRequest("Storage doesn't support merging of the counters")
+
+        return HttpResponse(status=204)
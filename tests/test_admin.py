@@ -1,10 +1,17 @@
 # coding: utf-8
 
+import json
+from datetime import datetime
+
 import mock
+from django.contrib import admin
 from django.contrib.auth.models import User
 from django.test import TestCase, override_settings
 
-from speedinfo.models import ViewProfiler
+from speedinfo import profiler
+from speedinfo.admin import ViewProfilerAdmin
+from speedinfo.models import SlowRequest, Snapshot, ViewProfiler
+from speedinfo.storage.database.storage import DatabaseStorage
 
 try:
     from django.urls import reverse  # Django >= 1.10
@@ -30,8 +37,49 @@ class ViewProfilerAdminTestCase(TestCase):
         profiler_mock.storage.fetch_all.return_value = [
             ViewProfiler(view_name="app.view_name", method="GET", total_calls=2, total_time=5),
         ]
+        profiler_mock.storage.count_evictions.return_value = 0
         response = self.client.get(reverse("admin:speedinfo_viewprofiler_changelist"))
         self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "evicted")
+
+        profiler_mock.storage.count_evictions.return_value = 3
+        response = self.client.get(reverse("admin:speedinfo_viewprofiler_changelist"))
+        self.assertContains(response, "3 entries were evicted from the storage")
+        self.assertNotContains(response, "Queue time per call")
+
+        profiler_mock.storage.fetch_breakdowns.return_value = {
+            ("app.view_name", "GET"): {"X-Request-Start": (2, 0.5)},
+            ("app.other_view", "GET"): {"X-Request-Start": (2, 0.3)},
+        }
+        response = self.client.get(reverse("admin:speedinfo_viewprofiler_changelist"))
+        self.assertContains(response, "Queue time per call: 0.2000s")
+
+    def test_search_and_filters(self):
+        profiler.storage.reset()
+        profiler.storage.add(
+            view_name="app.users", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=1, sql_count=2, view_execution_time=2,
+        )
+        profiler.storage.add(
+            view_name="app.news", method="POST", is_anon_call=True, is_cache_hit=False,
+            sql_time=1, sql_count=2, view_execution_time=0.01,
+        )
+        url = reverse("admin:speedinfo_viewprofiler_changelist")
+
+        response = self.client.get(url, {"q": "users"})
+        self.assertContains(response, "app.users")
+        self.assertNotContains(response, "app.news")
+
+        response = self.client.get(url, {"method": "POST"})
+        self.assertNotContains(response, "app.users")
+        self.assertContains(response, "app.news")
+
+        response = self.client.get(url, {"min_time_per_call": "1"})
+        self.assertContains(response, "app.users")
+        self.assertNotContains(response, "app.news")
+
+        response = self.client.get(url, {"min_calls": "invalid"})
+        self.assertEqual(response.status_code, 302)
 
     @mock.patch("speedinfo.admin.profiler")
     def test_switch(self, profiler_mock):
@@ -44,18 +92,104 @@ class ViewProfilerAdminTestCase(TestCase):
         self.client.get(reverse("admin:speedinfo-profiler-reset"))
         profiler_mock.storage.reset.assert_called_once()
 
+    @mock.patch("speedinfo.admin.profiler")
+    def test_sampling(self, profiler_mock):
+        profiler_mock.sampling_rules = {"admin:": 0, "*": 0.5}
+        url = reverse("admin:speedinfo-profiler-sampling")
+
+        response = self.client.get(url)
+        self.assertContains(response, "* 0.5\nadmin: 0")
+
+        response = self.client.post(url, {"rules": "*  0.1\n\napp.views.index 1\n"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(profiler_mock.sampling_rules, {"*": 0.1, "app.views.index": 1})
+
+        for rules in ("app.views.index", "app.views.index 2", "app.views.index high"):
+            response = self.client.post(url, {"rules": rules})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context["form"].errors)
+
+    @mock.patch("speedinfo.admin.profiler")
+    def test_session(self, profiler_mock):
+        url = reverse("admin:speedinfo-profiler-session")
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(url, {"name": "release", "duration": "", "max_requests": ""})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["form"].errors)
+        profiler_mock.start_session.assert_not_called()
+
+        response = self.client.post(url, {"name": "release", "duration": "5", "max_requests": ""})
+        self.assertEqual(response.status_code, 302)
+        profiler_mock.start_session.assert_called_once_with(name="release", duration=300, max_requests=None)
+
+        self.client.get(reverse("admin:speedinfo-profiler-session-stop"))
+        profiler_mock.stop_session.assert_called_once()
+
+    @mock.patch("speedinfo.admin.profiler")
+    def test_switch_session(self, profiler_mock):
+        profiler_mock.is_on = True
+        profiler_mock.session = {"name": "release"}
+        self.client.get(reverse("admin:speedinfo-profiler-switch"))
+        profiler_mock.stop_session.assert_called_once()
+
+    @mock.patch("speedinfo.admin.profiler")
+    def test_regressions(self, profiler_mock):
+        self.client.get(reverse("admin:speedinfo-profiler-baseline"))
+        profiler_mock.freeze_baseline.assert_called_once_with("Baseline")
+
+        url = reverse("admin:speedinfo-profiler-regressions")
+        profiler_mock.detect_regressions.return_value = None
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        profiler_mock.detect_regressions.return_value = [dict(
+            view_name="app.view_name", method="GET", metric="time_per_call",
+            baseline_value=0.1, value=0.2, change=1.0, z_score=5.0,
+        )]
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "app.view_name")
+        self.assertContains(response, "+100%")
+
+    @override_settings(SPEEDINFO_DIMENSIONS=[
+        "speedinfo.dimensions.common.RouteDimension",
+        "speedinfo.dimensions.common.ReleaseDimension",
+    ])
+    @mock.patch("speedinfo.admin.profiler")
+    def test_dimensions(self, profiler_mock):
+        url = reverse("admin:speedinfo-profiler-dimensions")
+        profiler_mock.storage.fetch_breakdowns.return_value = {
+            ("app.view_name", "GET"): {"^func/$": (3, 0.3), "^func/(?P<pk>[0-9]+)/$": (1, 0.5)},
+            ("app.other_view", "POST"): {"^func/$": (1, 0.2)},
+        }
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        profiler_mock.storage.fetch_breakdowns.assert_called_with("dimension.route")
+        self.assertListEqual(
+            [(group["value"], group["calls"], [item["view_name"] for item in group["views"]])
+             for group in response.context["groups"]],
+            [("^func/$", 4, ["app.view_name", "app.other_view"]), ("^func/(?P<pk>[0-9]+)/$", 1, ["app.view_name"])],
+        )
+
+        self.client.get(url, {"dimension": "release"})
+        profiler_mock.storage.fetch_breakdowns.assert_called_with("dimension.release")
+        self.assertEqual(self.client.get(url, {"dimension": "tenant"}).status_code, 404)
+
     @mock.patch("speedinfo.managers.profiler")
     def test_export(self, profiler_mock):
-        profiler_mock.storage.fetch_all.return_value = [
+        profiler_mock.storage.iter_all.return_value = iter([
             ViewProfiler(
                 view_name="app.view_name", method="GET", anon_calls=8, cache_hits=3,
                 sql_total_time=40, sql_total_count=20, total_calls=10, total_time=50,
             ),
-        ]
+        ])
         response = self.client.get(reverse("admin:speedinfo-profiler-export"))
         self.assertEquals(response.get("Content-Disposition"), "attachment; filename=profiler.csv")
 
-        output = response.content.decode()
+        output = b"".join(response.streaming_content).decode()
         self.assertEqual(
             output,
             "View name,HTTP method,Anonymous calls,Cache hits,SQL queries per call,"
@@ -63,6 +197,80 @@ class ViewProfilerAdminTestCase(TestCase):
             "app.view_name,GET,80.0%,30.0%,2,80.0%,10,5.00000000,50.0000\r\n",
         )
 
+    @override_settings(SPEEDINFO_ADMIN_COLUMNS=(
+        ("View name", "{}", "view_name"),
+        ("Total calls", "{}", "total_calls"),
+        ("Time per call", "{:.4f}", "time_per_call"),
+    ))
+    @mock.patch("speedinfo.managers.profiler")
+    def test_raw_export(self, profiler_mock):
+        profiler_mock.storage.iter_all.return_value = iter([
+            ViewProfiler(view_name="app.view_name", method="GET", total_calls=4, total_time=5),
+        ])
+        response = self.client.get(reverse("admin:speedinfo-profiler-export"), {"format": "raw"})
+        self.assertEqual(response.get("Content-Disposition"), "attachment; filename=profiler.csv")
+        self.assertEqual(
+            b"".join(response.streaming_content).decode(),
+            "view_name,total_calls,time_per_call\r\n"
+            "app.view_name,4,1.25\r\n",
+        )
+        self.assertEqual(profiler_mock.storage.iter_all.call_count, 1)
+
+        # Ordering is a tuple or a list depending on Django version
+        ordering, = profiler_mock.storage.iter_all.call_args[0]
+        self.assertListEqual(list(ordering), ["-total_time"])
+        self.assertDictEqual(profiler_mock.storage.iter_all.call_args[1], {"filters": {}})
+
+    @override_settings(SPEEDINFO_ADMIN_COLUMNS=(
+        ("View name", "{}", "view_name"),
+        ("Total calls", "{}", "total_calls"),
+        ("Time per call", "{:.4f}", "time_per_call"),
+    ))
+    @mock.patch("speedinfo.managers.profiler")
+    def test_jsonl_export(self, profiler_mock):
+        profiler_mock.storage.iter_all.return_value = iter([
+            ViewProfiler(view_name="view1", method="GET", total_calls=4, total_time=5),
+            ViewProfiler(view_name="view2", method="GET", total_calls=1, total_time=2),
+        ])
+        response = self.client.get(reverse("admin:speedinfo-profiler-export"), {"format": "jsonl"})
+        self.assertEqual(response.get("Content-Disposition"), "attachment; filename=profiler.jsonl")
+        self.assertEqual(
+            [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()],
+            [
+                {"view_name": "view1", "total_calls": 4, "time_per_call": 1.25},
+                {"view_name": "view2", "total_calls": 1, "time_per_call": 2},
+            ],
+        )
+
+    @mock.patch("speedinfo.managers.profiler")
+    def test_slow_requests_export(self, profiler_mock):
+        profiler_mock.storage.fetch_slow_requests.return_value = [
+            SlowRequest(
+                view_name="app.view_name", method="GET", path="/path/", status_code=500,
+                duration=3, created_at=datetime(2020, 1, 1),
+            ),
+        ]
+        response = self.client.get(reverse("admin:speedinfo-profiler-export"), {
+            "format": "jsonl",
+            "dataset": "slow",
+        })
+        self.assertEqual(response.get("Content-Disposition"), "attachment; filename=slow-requests.jsonl")
+
+        row = json.loads(b"".join(response.streaming_content).decode())
+        self.assertEqual(row["path"], "/path/")
+        self.assertEqual(row["duration"], 3)
+        self.assertEqual(row["created_at"], "2020-01-01T00:00:00")
+        self.assertEqual(profiler_mock.storage.fetch_slow_requests.call_count, 1)
+        ordering, = profiler_mock.storage.fetch_slow_requests.call_args[0]
+        self.assertListEqual(list(ordering), ["created_at"])
+
+    def test_invalid_export_params(self):
+        response = self.client.get(reverse("admin:speedinfo-profiler-export"), {"format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse("admin:speedinfo-profiler-export"), {"dataset": "unknown"})
+        self.assertEqual(response.status_code, 400)
+
     @override_settings(SPEEDINFO_ADMIN_COLUMNS=(
         ("View name", "{}", "view_name"),
         ("HTTP method", "{}", "method"),
@@ -72,14 +280,14 @@ class ViewProfilerAdminTestCase(TestCase):
     ))
     @mock.patch("speedinfo.managers.profiler")
     def test_partial_export(self, profiler_mock):
-        profiler_mock.storage.fetch_all.return_value = [
+        profiler_mock.storage.iter_all.return_value = iter([
             ViewProfiler(
                 view_name="app.view_name", method="GET", anon_calls=8, cache_hits=3,
                 sql_total_time=40, sql_total_count=20, total_calls=10, total_time=50,
             ),
-        ]
+        ])
         response = self.client.get(reverse("admin:speedinfo-profiler-export"))
-        output = response.content.decode()
+        output = b"".join(response.streaming_content).decode()
 
         self.assertEqual(
             output,
@@ -100,6 +308,31 @@ class ViewProfilerAdminTestCase(TestCase):
         response = self.client.get(reverse("admin:speedinfo_viewprofiler_changelist"))
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(SPEEDINFO_ADMIN_COLUMNS=(
+        ("View name", "{}", "view_name"),
+        ("Calls", "{}", "total_calls"),
+        ("Time per call", "{:.4f}", "time_per_call"),
+        ("Server errors", "{:.1f}%", "errors_ratio"),
+    ))
+    @mock.patch("speedinfo.managers.profiler")
+    @mock.patch("speedinfo.admin.profiler")
+    def test_sortable_columns(self, profiler_mock, managers_profiler_mock):
+        profiler_mock.storage = managers_profiler_mock.storage = DatabaseStorage()
+        profiler_mock.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=0, sql_count=0, view_execution_time=0.5,
+        )
+
+        model_admin = ViewProfilerAdmin(ViewProfiler, admin.site)
+        self.assertEqual(model_admin.total_calls_wrapper.admin_order_field, "total_calls")
+        self.assertEqual(model_admin.time_per_call_wrapper.admin_order_field, "time_per_call")
+        self.assertFalse(hasattr(model_admin.errors_ratio_wrapper, "admin_order_field"))
+
+        for index in range(1, 5):
+            response = self.client.get(reverse("admin:speedinfo_viewprofiler_changelist"), {"o": index})
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "app.view_name")
+
     @override_settings(SPEEDINFO_ADMIN_COLUMNS=(
         ("View name", "{}", "view_name"),
         ("HTTP method", "{}", "method"),
@@ -107,14 +340,96 @@ class ViewProfilerAdminTestCase(TestCase):
     ))
     @mock.patch("speedinfo.managers.profiler")
     def test_extra_columns_export(self, profiler_mock):
-        profiler_mock.storage.fetch_all.return_value = [
+        profiler_mock.storage.iter_all.return_value = iter([
             ViewProfiler(view_name="app.view_name", method="GET", extra="Value"),
-        ]
+        ])
         response = self.client.get(reverse("admin:speedinfo-profiler-export"))
-        output = response.content.decode()
+        output = b"".join(response.streaming_content).decode()
 
         self.assertEqual(
             output,
             "View name,HTTP method,Extra\r\n"
             "app.view_name,GET,Value\r\n",
         )
+
+
+@override_settings(
+    SPEEDINFO_STORAGE="speedinfo.storage.cache.storage.CacheStorage",
+    SPEEDINFO_TESTS=True,
+)
+class SlowRequestAdminTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(SlowRequestAdminTestCase, cls).setUpClass()
+        User.objects.create_superuser(username="admin", email="", password="123456")
+
+    def setUp(self):
+        self.client.login(username="admin", password="123456")
+
+    @mock.patch("speedinfo.managers.profiler")
+    def test_admin_index(self, profiler_mock):
+        profiler_mock.storage.fetch_slow_requests.return_value = [
+            SlowRequest(
+                view_name="app.view_name", method="GET", path="/path/", status_code=500,
+                duration=3, created_at=datetime(2020, 1, 1),
+            ),
+        ]
+        response = self.client.get(reverse("admin:speedinfo_slowrequest_changelist"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "/path/")
+
+
+@override_settings(
+    SPEEDINFO_STORAGE="speedinfo.storage.cache.storage.CacheStorage",
+    SPEEDINFO_TESTS=True,
+)
+class SnapshotAdminTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(SnapshotAdminTestCase, cls).setUpClass()
+        User.objects.create_superuser(username="admin", email="", password="123456")
+
+    def setUp(self):
+        self.client.login(username="admin", password="123456")
+
+    @mock.patch("speedinfo.managers.profiler")
+    def test_admin_index(self, profiler_mock):
+        profiler_mock.storage.fetch_snapshots.return_value = [
+            Snapshot(id="abc", name="release", started_at=datetime(2020, 1, 1), finished_at=datetime(2020, 1, 2)),
+        ]
+        response = self.client.get(reverse("admin:speedinfo_snapshot_changelist"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "release")
+        self.assertContains(response, "?baseline=abc")
+
+    @mock.patch("speedinfo.admin.profiler")
+    def test_compare(self, profiler_mock):
+        counters = dict(
+            view_name="app.view_name", method="GET", anon_calls=0, cache_hits=0,
+            sql_total_time=0, sql_total_count=0, total_calls=2, total_time=1,
+        )
+        profiler_mock.storage.fetch_snapshots.return_value = []
+        profiler_mock.storage.fetch_snapshot_counters.return_value = [counters]
+        profiler_mock.storage.fetch_counters.return_value = [dict(counters, total_time=2)]
+        url = reverse("admin:speedinfo-snapshot-compare")
+
+        response = self.client.get(url, {"baseline": "abc"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "100%")
+
+        response = self.client.get(url, {"baseline": "abc", "snapshot": "abc"})
+        self.assertEqual(response.context["results"][0]["change"], 0)
+
+        profiler_mock.storage.fetch_snapshot_counters.return_value = None
+        response = self.client.get(url, {"baseline": "missing"})
+        self.assertEqual(response.status_code, 404)
+
+    @mock.patch("speedinfo.admin.profiler")
+    def test_set_baseline(self, profiler_mock):
+        url = reverse("admin:speedinfo-snapshot-baseline")
+        profiler_mock.storage.fetch_snapshot_counters.return_value = None
+        self.assertEqual(self.client.get(url, {"snapshot": "missing"}).status_code, 404)
+
+        profiler_mock.storage.fetch_snapshot_counters.return_value = []
+        self.assertEqual(self.client.get(url, {"snapshot": "abc"}).status_code, 302)
+        self.assertEqual(profiler_mock.baseline, "abc")
@@ -1,6 +1,10 @@
 # coding: utf-8
 
+import gc
+import unittest
+
 import django
+import mock
 from django.core.checks import run_checks
 from django.test import TestCase, override_settings
 
@@ -73,3 +77,40 @@ class AppsTestCase(TestCase):
         messages = run_checks()
         self.assertTrue(len(messages) > 0)
         self.assertEqual(messages[0].id, "speedinfo.E005")
+
+    @override_settings(SPEEDINFO_PROFILE_CELERY_TASKS=True)
+    def test_missing_celery(self):
+        try:
+            import celery  # noqa: F401
+        except ImportError:
+            messages = run_checks()
+            self.assertEqual(messages[0].id, "speedinfo.E006")
+        else:
+            self.assertEqual(run_checks(), [])
+
+    @unittest.skipUnless(hasattr(gc, "callbacks"), "Garbage collector callbacks are not supported")
+    @override_settings(SPEEDINFO_PROFILE_GC=True)
+    def test_gc_callbacks(self):
+        self.assertEqual(run_checks(), [])
+
+        with mock.patch("speedinfo.apps.gc", spec=[]):
+            messages = run_checks()
+            self.assertListEqual([message.id for message in messages], ["speedinfo.W002"])
+
+    @override_settings(SPEEDINFO_STORAGE="speedinfo.storage.node.storage.NodeStorage", SPEEDINFO_NODE_COLLECTOR_URL="/")
+    def test_node_storage(self):
+        messages = run_checks()
+        self.assertListEqual([message.id for message in messages], ["speedinfo.E007", "speedinfo.E008"])
+
+    @override_settings(SPEEDINFO_DIMENSIONS=[
+        "speedinfo.dimensions.common.RouteDimension",
+        "speedinfo.dimensions.common.RouteDimension",
+        "speedinfo.dimensions.common.HeaderDimension",
+        "speedinfo.dimensions.common.UnknownDimension",
+    ])
+    def test_dimensions(self):
+        messages = run_checks()
+        self.assertListEqual(
+            [message.id for message in messages],
+            ["speedinfo.E010", "speedinfo.E010", "speedinfo.E009"],
+        )
@@ -0,0 +1,49 @@
+# coding: utf-8
+
+import mock
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+try:
+    from StringIO import StringIO  # Python 2
+except ImportError:
+    from io import StringIO
+
+
+@mock.patch("speedinfo.management.commands.speedinfo_regressions.profiler")
+class RegressionsCommandTestCase(TestCase):
+    def test_freeze(self, profiler_mock):
+        profiler_mock.freeze_baseline.return_value = "abc"
+        stdout = StringIO()
+
+        call_command("speedinfo_regressions", freeze=True, snapshot_name="release", stdout=stdout)
+        profiler_mock.freeze_baseline.assert_called_once_with("release")
+        self.assertIn("abc", stdout.getvalue())
+
+    def test_no_regressions(self, profiler_mock):
+        profiler_mock.detect_regressions.return_value = []
+        stdout = StringIO()
+
+        call_command("speedinfo_regressions", threshold=0.5, stdout=stdout)
+        profiler_mock.detect_regressions.assert_called_once_with(None, threshold=0.5, z_score=None, min_calls=None)
+        self.assertIn("No regressions found", stdout.getvalue())
+
+    def test_regressions(self, profiler_mock):
+        profiler_mock.detect_regressions.return_value = [dict(
+            view_name="app.view_name", method="GET", metric="time_per_call",
+            baseline_value=0.1, value=0.25, change=1.5, z_score=5.0,
+        )]
+        stdout = StringIO()
+
+        with self.assertRaises(CommandError) as context:
+            call_command("speedinfo_regressions", baseline="abc", stdout=stdout)
+
+        self.assertEqual(str(context.exception), "1 regression(s) found.")
+
+        self.assertIn("app.view_name GET: time_per_call 0.100000 -> 0.250000 (+150%)", stdout.getvalue())
+
+    def test_missing_baseline(self, profiler_mock):
+        profiler_mock.detect_regressions.return_value = None
+
+        with self.assertRaises(CommandError):
+            call_command("speedinfo_regressions")
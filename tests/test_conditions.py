@@ -1,8 +1,16 @@
 # coding: utf-8
 
+import mock
 from django.test import RequestFactory, TestCase, override_settings
 
-from speedinfo.conditions.exclude_urls import ExcludeURLCondition
+from speedinfo.conditions.exclude_urls import ExcludeURLCondition, URLMatcher
+from speedinfo.conditions.exclude_views import ExcludeViewCondition
+from speedinfo.conditions.sampling import RateLimitCondition, RateSamplingCondition, round_weight
+
+try:
+    from django.urls import reverse  # Django >= 1.10
+except ImportError:
+    from django.core.urlresolvers import reverse
 
 
 @override_settings(
@@ -40,3 +48,149 @@ class ExcludeURLConditionTestCase(TestCase):
         request = self.factory.get("/weak/more/")
         self.assertTrue(self.condition.process_request(request))
         self.assertTrue(self.condition.process_response(request))
+
+    @override_settings(SPEEDINFO_EXCLUDE_URLS=[r"/news/\d+/$", "/about/"])
+    def test_regex_match(self):
+        self.assertFalse(self.condition.process_request(self.factory.get("/news/10/")))
+        self.assertTrue(self.condition.process_request(self.factory.get("/news/latest/")))
+        self.assertFalse(self.condition.process_request(self.factory.get("/about/team/")))
+
+    @override_settings(SPEEDINFO_EXCLUDE_URLS=["/api/internal/"], SPEEDINFO_INCLUDE_URLS=["/api/"])
+    def test_include_urls(self):
+        self.assertTrue(self.condition.process_request(self.factory.get("/api/users/")))
+        self.assertFalse(self.condition.process_request(self.factory.get("/api/internal/")))
+        self.assertFalse(self.condition.process_request(self.factory.get("/news/")))
+
+    @override_settings(SPEEDINFO_TESTS=False, SPEEDINFO_EXCLUDE_URLS_CACHE_SIZE=2)
+    def test_decisions_cache(self):
+        condition = ExcludeURLCondition()
+
+        for path in ["/strict/", "/a/", "/b/", "/c/"]:
+            condition.process_request(self.factory.get(path))
+
+        self.assertEqual(len(condition.decisions), 2)
+        self.assertIsNone(condition.decisions.get("/strict/"))
+        self.assertTrue(condition.decisions.get("/c/"))
+
+
+class URLMatcherTestCase(TestCase):
+    def test_literal_patterns(self):
+        matcher = URLMatcher(["/admin/", "^/static/", "/news/$"])
+
+        self.assertEqual(matcher.prefixes, ("/admin/", "/static/"))
+        self.assertEqual(matcher.paths, frozenset(["/news/"]))
+        self.assertListEqual(matcher.regexes, [])
+
+        self.assertTrue(matcher.match("/admin/users/"))
+        self.assertTrue(matcher.match("/static/app.css"))
+        self.assertTrue(matcher.match("/news/"))
+        self.assertFalse(matcher.match("/news/1/"))
+        self.assertFalse(matcher.match("/"))
+
+    def test_regex_patterns(self):
+        matcher = URLMatcher([r"/news/\d+/$", r"/movie/(?P<id>\d+)/", r"/series/(?P<id>\d+)/"])
+
+        self.assertEqual(len(matcher.regexes), 3)
+        self.assertTrue(matcher.match("/news/1/"))
+        self.assertTrue(matcher.match("/movie/1/cast/"))
+        self.assertTrue(matcher.match("/series/1/"))
+        self.assertFalse(matcher.match("/news/1/comments/"))
+
+        matcher = URLMatcher([r"/news/\d+/$", r"/movie/\d+/"])
+        self.assertEqual(len(matcher.regexes), 1)
+        self.assertTrue(matcher.match("/movie/1/"))
+
+        # Backreferences refer to the groups of their own pattern
+        matcher = URLMatcher([r"/news/(\d+)/", r"/(\w+)/\1/$", r"/movie/\d+/"])
+        self.assertEqual(len(matcher.regexes), 2)
+        self.assertTrue(matcher.match("/news/1/"))
+        self.assertTrue(matcher.match("/movie/1/"))
+        self.assertTrue(matcher.match("/page/page/"))
+        self.assertFalse(matcher.match("/page/1/"))
+
+    def test_empty(self):
+        matcher = URLMatcher([])
+        self.assertFalse(matcher)
+        self.assertFalse(matcher.match("/"))
+
+
+@override_settings(
+    SPEEDINFO_EXCLUDE_VIEWS=["tests.views.Class*", "django.contrib.admin.*"],
+    SPEEDINFO_TESTS=True,
+)
+class ExcludeViewConditionTestCase(TestCase):
+    def setUp(self):
+        self.condition = ExcludeViewCondition()
+        self.factory = RequestFactory()
+
+    def test_exclude_views(self):
+        self.assertTrue(self.condition.process_request(self.factory.get(reverse("func-view"))))
+        self.assertFalse(self.condition.process_request(self.factory.get(reverse("class-view"))))
+        self.assertFalse(self.condition.process_request(self.factory.get(reverse("admin:index"))))
+        self.assertTrue(self.condition.process_response(None))
+
+    @override_settings(SPEEDINFO_TESTS=False)
+    def test_decisions_cache(self):
+        condition = ExcludeViewCondition()
+        condition.process_request(self.factory.get(reverse("class-view")))
+        self.assertDictEqual(condition.decisions, {"tests.views.ClassBasedView": False})
+
+
+@override_settings(SPEEDINFO_TESTS=True)
+class SamplingConditionsTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    @mock.patch("speedinfo.conditions.sampling.random.random")
+    def test_round_weight(self, random_mock):
+        random_mock.return_value = 0.2
+        self.assertEqual(round_weight(3.25), 4)
+        self.assertEqual(round_weight(3), 3)
+
+        random_mock.return_value = 0.3
+        self.assertEqual(round_weight(3.25), 3)
+
+    @override_settings(SPEEDINFO_SAMPLING_RATE=0.25)
+    @mock.patch("speedinfo.conditions.sampling.random.random")
+    def test_rate_sampling(self, random_mock):
+        condition = RateSamplingCondition()
+        request = self.factory.get(reverse("func-view"))
+
+        random_mock.return_value = 0.1
+        self.assertEqual(condition.process_request(request), 4)
+        self.assertTrue(condition.process_response(request))
+
+        random_mock.return_value = 0.5
+        self.assertEqual(condition.process_request(request), 0)
+
+    @override_settings(SPEEDINFO_SAMPLING_RATE=0)
+    def test_disabled_rate_sampling(self):
+        self.assertEqual(RateSamplingCondition().process_request(self.factory.get(reverse("func-view"))), 0)
+
+    @override_settings(SPEEDINFO_SAMPLING_RATE_LIMIT=1, SPEEDINFO_SAMPLING_RATE_LIMIT_BURST=2)
+    @mock.patch("speedinfo.conditions.sampling.default_timer")
+    def test_rate_limit(self, timer_mock):
+        condition = RateLimitCondition()
+        request = self.factory.get(reverse("func-view"))
+        another_request = self.factory.get(reverse("class-view"))
+
+        timer_mock.return_value = 100
+        self.assertEqual(condition.process_request(request), 1)
+        self.assertEqual(condition.process_request(request), 1)
+        self.assertEqual(condition.process_request(request), 0)
+        self.assertEqual(condition.process_request(request), 0)
+
+        # Buckets are separate for each view
+        self.assertEqual(condition.process_request(another_request), 1)
+
+        # Sampled request represents the skipped ones
+        timer_mock.return_value = 101
+        self.assertEqual(condition.process_request(request), 3)
+        self.assertEqual(condition.process_request(request), 0)
+
+        # Skipped request profiled by tail sampling is not represented by the sampled one
+        condition.process_tail_sampled(request)
+        timer_mock.return_value = 102
+        self.assertEqual(condition.process_request(request), 1)
+        condition.process_tail_sampled(request)
+        self.assertEqual(condition.buckets["tests.views.func_view"][2], 0)
@@ -0,0 +1,78 @@
+# coding: utf-8
+
+import mock
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from speedinfo.dimensions.common import HeaderDimension, ReleaseDimension, RouteDimension
+from speedinfo.dimensions.dispatcher import DimensionsDispatcher
+
+try:
+    from django.urls import reverse  # Django >= 1.10
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+class TenantDimension(HeaderDimension):
+    name = "tenant"
+    header = "HTTP_X_TENANT"
+
+
+@override_settings(
+    SPEEDINFO_STORAGE="speedinfo.storage.cache.storage.CacheStorage",
+    SPEEDINFO_TESTS=True,
+)
+class DimensionsTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.response = HttpResponse()
+
+    def test_route(self):
+        self.assertEqual(RouteDimension().get_value(self.factory.get(reverse("func-view")), self.response), "^func/$")
+        self.assertIsNone(RouteDimension().get_value(self.factory.get("/unknown/"), self.response))
+
+        with mock.patch("speedinfo.dimensions.common.resolve_request") as resolve_request_mock:
+            resolve_request_mock.return_value = mock.Mock(spec=["view_name"], view_name="blog:article-archive")
+            self.assertEqual(RouteDimension().get_value(self.factory.get("/"), self.response), "blog:article-archive")
+
+    @override_settings(SPEEDINFO_RELEASE="1.2.0")
+    def test_release(self):
+        self.assertEqual(ReleaseDimension().get_value(self.factory.get("/"), self.response), "1.2.0")
+
+    def test_header(self):
+        request = self.factory.get("/", HTTP_X_TENANT="acme")
+        self.assertEqual(TenantDimension().get_value(request, self.response), "acme")
+        self.assertIsNone(TenantDimension().get_value(self.factory.get("/"), self.response))
+
+    @override_settings(SPEEDINFO_DIMENSIONS=[
+        "speedinfo.dimensions.common.RouteDimension",
+        "tests.test_dimensions.TenantDimension",
+    ])
+    def test_breakdowns(self):
+        dispatcher = DimensionsDispatcher()
+        request = self.factory.get(reverse("func-view"), HTTP_X_TENANT="acme")
+        self.assertDictEqual(dispatcher.get_breakdowns(request, self.response, 0.5), {
+            "dimension.route": {"^func/$": (1, 0.5)},
+            "dimension.tenant": {"acme": (1, 0.5)},
+        })
+
+        # Dimensions without value are omitted
+        request = self.factory.get(reverse("func-view"))
+        self.assertDictEqual(dispatcher.get_breakdowns(request, self.response, 0.5), {
+            "dimension.route": {"^func/$": (1, 0.5)},
+        })
+
+    @override_settings(
+        SPEEDINFO_DIMENSIONS=["tests.test_dimensions.TenantDimension"],
+        SPEEDINFO_DIMENSION_MAX_VALUES=2,
+    )
+    def test_cardinality_limit(self):
+        dispatcher = DimensionsDispatcher()
+        values = []
+
+        for tenant in ("a", "b", "c", "a", "d", "b"):
+            request = self.factory.get("/", HTTP_X_TENANT=tenant)
+            breakdowns = dispatcher.get_breakdowns(request, self.response, 0.5)
+            values.extend(breakdowns["dimension.tenant"])
+
+        self.assertListEqual(values, ["a", "b", "other", "a", "other", "b"])
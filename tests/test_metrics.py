@@ -0,0 +1,117 @@
+# coding: utf-8
+
+import os
+
+import mock
+from django.test import TestCase, override_settings
+
+from speedinfo.metrics import render_metrics
+from speedinfo.overhead import OverheadMonitor
+
+try:
+    from django.urls import reverse  # Django >= 1.10
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+@override_settings(
+    SPEEDINFO_STORAGE="speedinfo.storage.cache.storage.CacheStorage",
+    SPEEDINFO_TESTS=True,
+)
+class MetricsTestCase(TestCase):
+    entries = [
+        dict(
+            view_name="app.view_name", method="GET", anon_calls=8, cache_hits=3,
+            sql_total_time=0.25, sql_total_count=20, total_calls=10, total_time=1.5,
+        ),
+    ]
+
+    def test_render_openmetrics(self):
+        output = render_metrics(self.entries, is_on=True)
+        lines = output.splitlines()
+
+        self.assertIn("speedinfo_profiler_enabled 1", lines)
+        self.assertIn("# TYPE speedinfo_view_calls counter", lines)
+        self.assertIn('speedinfo_view_calls_total{view="app.view_name",method="GET"} 10', lines)
+        self.assertIn('speedinfo_view_sql_duration_seconds_total{view="app.view_name",method="GET"} 0.25', lines)
+        self.assertIn("# TYPE speedinfo_view_duration_seconds summary", lines)
+        self.assertIn('speedinfo_view_duration_seconds_count{view="app.view_name",method="GET"} 10', lines)
+        self.assertIn('speedinfo_view_duration_seconds_sum{view="app.view_name",method="GET"} 1.5', lines)
+        self.assertEqual(lines[-1], "# EOF")
+
+    def test_render_prometheus(self):
+        lines = render_metrics(self.entries, is_on=False, openmetrics=False).splitlines()
+
+        self.assertIn("speedinfo_profiler_enabled 0", lines)
+        self.assertIn("# TYPE speedinfo_view_calls_total counter", lines)
+        self.assertNotIn("# EOF", lines)
+
+    def test_render_overhead(self):
+        overhead = OverheadMonitor()
+        overhead.total_overhead = 0.5
+        overhead.total_requests = 100
+        overhead.rate = 0.25
+
+        lines = render_metrics(self.entries, is_on=True, overhead=overhead).splitlines()
+        self.assertIn("# TYPE speedinfo_overhead_seconds counter", lines)
+        self.assertIn('speedinfo_overhead_seconds_total{{pid="{}"}} 0.5'.format(os.getpid()), lines)
+        self.assertIn('speedinfo_overhead_requests_total{{pid="{}"}} 100'.format(os.getpid()), lines)
+        self.assertIn('speedinfo_overhead_sampling_rate{{pid="{}"}} 0.25'.format(os.getpid()), lines)
+
+        lines = render_metrics(self.entries, is_on=True, openmetrics=False, overhead=overhead).splitlines()
+        self.assertIn("# TYPE speedinfo_overhead_seconds_total counter", lines)
+
+    def test_render_breakdowns(self):
+        breakdowns = {"sql_alias": {("app.view_name", "GET"): {"default": (2, 0.5), "replica": (8, 1.5)}}}
+        lines = render_metrics(self.entries, is_on=True, breakdowns=breakdowns).splitlines()
+
+        self.assertIn("# TYPE speedinfo_view_database_sql_queries counter", lines)
+        self.assertIn(
+            'speedinfo_view_database_sql_queries_total{view="app.view_name",method="GET",database="replica"} 8',
+            lines,
+        )
+        self.assertIn(
+            "speedinfo_view_database_sql_duration_seconds_total"
+            '{view="app.view_name",method="GET",database="default"} 0.5',
+            lines,
+        )
+
+    @override_settings(SPEEDINFO_DIMENSIONS=["speedinfo.dimensions.common.RouteDimension"])
+    def test_render_dimensions(self):
+        breakdowns = {"dimension.route": {("app.view_name", "GET"): {"^func/$": (4, 0.5)}}}
+        lines = render_metrics(self.entries, is_on=True, breakdowns=breakdowns).splitlines()
+
+        self.assertIn("# TYPE speedinfo_view_route_calls counter", lines)
+        self.assertIn('speedinfo_view_route_calls_total{view="app.view_name",method="GET",route="^func/$"} 4', lines)
+        self.assertIn(
+            'speedinfo_view_route_duration_seconds_total{view="app.view_name",method="GET",route="^func/$"} 0.5',
+            lines,
+        )
+
+    def test_render_evictions(self):
+        lines = render_metrics(self.entries, is_on=True, evictions=5).splitlines()
+        self.assertIn("# TYPE speedinfo_storage_evictions counter", lines)
+        self.assertIn("speedinfo_storage_evictions_total 5", lines)
+        self.assertNotIn("speedinfo_storage_evictions_total 5", render_metrics(self.entries, is_on=True))
+
+    def test_label_escaping(self):
+        entries = [dict(self.entries[0], view_name='app."quoted"\\view\n')]
+        output = render_metrics(entries, is_on=True)
+        self.assertIn('speedinfo_view_calls_total{view="app.\\"quoted\\"\\\\view\\n",method="GET"} 10', output)
+
+    @mock.patch("speedinfo.views.profiler")
+    def test_metrics_view(self, profiler_mock):
+        profiler_mock.is_on = True
+        profiler_mock.storage.fetch_counters.return_value = self.entries
+        profiler_mock.overhead = OverheadMonitor()
+        profiler_mock.storage.fetch_breakdowns_by_names.return_value = {}
+        profiler_mock.storage.count_evictions.return_value = None
+
+        response = self.client.get(reverse("speedinfo-metrics"), HTTP_ACCEPT="application/openmetrics-text")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("application/openmetrics-text"))
+        self.assertIn(b"speedinfo_view_calls_total", response.content)
+        self.assertEqual(profiler_mock.storage.fetch_breakdowns_by_names.call_count, 1)
+
+        response = self.client.get(reverse("speedinfo-metrics"))
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
@@ -1,12 +1,15 @@
 # coding: utf-8
 
+import zlib
+
 import django
 import mock
 from django.contrib.auth.models import AnonymousUser, User
 from django.core.cache import cache
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.test import RequestFactory, TestCase, modify_settings, override_settings
 
+from speedinfo.conditions.sampling import SamplingCondition, TailSamplingCondition
 from speedinfo.middleware import ProfilerMiddleware
 
 try:
@@ -24,7 +27,7 @@ else:
     SPEEDINFO_STORAGE="speedinfo.storage.cache.storage.CacheStorage",
     SPEEDINFO_TESTS=True,
 )
-@mock.patch("speedinfo.middleware.profiler")
+@mock.patch("speedinfo.middleware.profiler", **{"get_sampling_rate.return_value": 1.0, "overhead.rate": 1.0})
 class ProfilerMiddlewareTestCase(TestCase):
     def setUp(self):
         cache.clear()
@@ -89,6 +92,27 @@ class ProfilerMiddlewareTestCase(TestCase):
         middleware(request)
         self.assertFalse(profiler_mock.storage.add.call_args.kwargs["is_anon_call"])
 
+    def test_interleaved_requests(self, profiler_mock):
+        profiler_mock.is_on = True
+        factory = RequestFactory()
+        first_request = factory.get(reverse("func-view"))
+        second_request = factory.post(reverse("func-view"))
+
+        # Requests served by the threads sharing the middleware instance don't affect each other
+        middleware = ProfilerMiddleware(get_response=HttpResponse)
+        middleware.process_request(first_request)
+        middleware.process_request(second_request)
+        middleware.process_exception(first_request, ValueError())
+
+        middleware.process_response(second_request, HttpResponse())
+        self.assertEqual(profiler_mock.storage.add.call_args.kwargs["method"], "POST")
+        self.assertNotIn("exception", profiler_mock.storage.add.call_args.kwargs["breakdowns"])
+
+        middleware.process_response(first_request, HttpResponse())
+        self.assertEqual(profiler_mock.storage.add.call_args.kwargs["method"], "GET")
+        self.assertIn("ValueError", profiler_mock.storage.add.call_args.kwargs["breakdowns"]["exception"])
+        self.assertFalse(hasattr(first_request, "_speedinfo_ctx"))
+
     def test_cache_hit(self, profiler_mock):
         profiler_mock.is_on = True
 
@@ -121,4 +145,205 @@ class ProfilerMiddlewareTestCase(TestCase):
         self.assertEqual(profiler_mock.storage.add.call_args.kwargs["sql_count"], 0)
 
         self.client.get(reverse("db-func-view"))
-        self.assertEqual(profiler_mock.storage.add.call_args.kwargs["sql_count"], 2)
+        kwargs = profiler_mock.storage.add.call_args.kwargs
+        self.assertEqual(kwargs["sql_count"], 2)
+        self.assertListEqual(list(kwargs["breakdowns"]["sql_alias"]), ["default"])
+        self.assertEqual(kwargs["breakdowns"]["sql_alias"]["default"][0], 2)
+
+    def test_status_and_exception(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        self.client.get(reverse("func-view"))
+        breakdowns = profiler_mock.storage.add.call_args.kwargs["breakdowns"]
+        self.assertListEqual(list(breakdowns["status"]), ["2xx"])
+        self.assertNotIn("exception", breakdowns)
+
+        with self.assertRaises(ValueError):
+            self.client.get(reverse("error-func-view"))
+
+        breakdowns = profiler_mock.storage.add.call_args.kwargs["breakdowns"]
+        self.assertListEqual(list(breakdowns["status"]), ["5xx"])
+        self.assertListEqual(list(breakdowns["exception"]), ["ValueError"])
+        self.assertEqual(breakdowns["exception"]["ValueError"][0], 1)
+
+        # Exception is not carried over to the next request
+        self.client.get("/func/missing/")
+        self.client.get(reverse("func-view"))
+        self.assertNotIn("exception", profiler_mock.storage.add.call_args.kwargs["breakdowns"])
+
+    @override_settings(SPEEDINFO_DIMENSIONS=["speedinfo.dimensions.common.RouteDimension"])
+    def test_dimensions(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        self.client.get(reverse("func-view"))
+        breakdowns = profiler_mock.storage.add.call_args.kwargs["breakdowns"]
+        self.assertListEqual(list(breakdowns["dimension.route"]), ["^func/$"])
+
+    @override_settings(SPEEDINFO_QUEUE_TIME_HEADERS=["HTTP_X_QUEUE_START", "HTTP_X_REQUEST_START"])
+    @mock.patch("time.time", return_value=1609459200.5)
+    def test_queue_time(self, time_mock, profiler_mock):
+        profiler_mock.is_on = True
+
+        self.client.get(reverse("func-view"), HTTP_X_REQUEST_START="t=1609459200250000")
+        breakdowns = profiler_mock.storage.add.call_args.kwargs["breakdowns"]
+        self.assertDictEqual(breakdowns["queue"], {"X-Request-Start": (1, 0.25)})
+
+        # Proxy clock may be ahead of the application server clock
+        self.client.get(reverse("func-view"), HTTP_X_QUEUE_START="1609459201")
+        breakdowns = profiler_mock.storage.add.call_args.kwargs["breakdowns"]
+        self.assertDictEqual(breakdowns["queue"], {"X-Queue-Start": (1, 0)})
+
+        self.client.get(reverse("func-view"), HTTP_X_REQUEST_START="invalid")
+        self.assertNotIn("queue", profiler_mock.storage.add.call_args.kwargs["breakdowns"])
+
+    def test_body_sizes(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        self.client.post(reverse("func-view"), data="x" * 100, content_type="text/plain")
+        breakdowns = profiler_mock.storage.add.call_args.kwargs["breakdowns"]
+        self.assertDictEqual(breakdowns["size"], {"request": (1, 100), "response": (1, 0)})
+
+        self.client.get(reverse("func-view"))
+        breakdowns = profiler_mock.storage.add.call_args.kwargs["breakdowns"]
+        self.assertDictEqual(breakdowns["size"], {"response": (1, 0)})
+
+        middleware = ProfilerMiddleware(get_response=HttpResponse)
+        request = RequestFactory().get("/")
+        response = HttpResponse(zlib.compress(b"x" * 1000))
+        response["Content-Encoding"] = "gzip"
+        sizes = middleware.get_body_sizes(request, response)
+        self.assertDictEqual(sizes, {"response_gzip": (1, len(response.content))})
+
+        # Size of the streaming response is known from the header only
+        response = StreamingHttpResponse(iter([b"x" * 10]))
+        self.assertDictEqual(middleware.get_body_sizes(request, response), {})
+        response["Content-Length"] = "10"
+        self.assertDictEqual(middleware.get_body_sizes(request, response), {"response": (1, 10)})
+
+    @override_settings(SPEEDINFO_SLOW_REQUEST_THRESHOLD=None)
+    def test_slow_request_disabled(self, profiler_mock):
+        profiler_mock.is_on = True
+        self.client.get(reverse("func-view"))
+        profiler_mock.storage.add_slow_request.assert_not_called()
+
+    @override_settings(SPEEDINFO_SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request(self, profiler_mock):
+        profiler_mock.is_on = True
+        self.client.get(reverse("db-func-view"), {"page": 2})
+
+        kwargs = profiler_mock.storage.add_slow_request.call_args.kwargs
+        self.assertEqual(kwargs["view_name"], "tests.views.db_func_view")
+        self.assertEqual(kwargs["method"], "GET")
+        self.assertEqual(kwargs["path"], reverse("db-func-view"))
+        self.assertEqual(kwargs["query_hash"], "{:08x}".format(zlib.crc32(b"page=2") & 0xffffffff))
+        self.assertEqual(kwargs["user_id"], "")
+        self.assertEqual(kwargs["status_code"], 200)
+        self.assertEqual(kwargs["sql_count"], 2)
+
+    @override_settings(SPEEDINFO_SLOW_REQUEST_THRESHOLD=60)
+    def test_fast_request(self, profiler_mock):
+        profiler_mock.is_on = True
+        self.client.get(reverse("func-view"))
+        profiler_mock.storage.add.assert_called_once()
+        profiler_mock.storage.add_slow_request.assert_not_called()
+
+    def test_sampling_weight(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        with mock.patch("speedinfo.middleware.conditions_dispatcher.get_conditions") as get_conditions_mock:
+            get_conditions_mock.return_value = [
+                mock.Mock(spec=SamplingCondition, process_request=mock.Mock(return_value=4)),
+                mock.Mock(process_request=mock.Mock(return_value=True), process_response=mock.Mock(return_value=True)),
+            ]
+            self.client.get(reverse("func-view"))
+            self.assertEqual(profiler_mock.storage.add.call_args.kwargs["weight"], 4)
+
+            profiler_mock.reset_mock()
+            get_conditions_mock.return_value[0].process_request.return_value = 0
+            self.client.get(reverse("func-view"))
+            profiler_mock.storage.add.assert_not_called()
+
+    @override_settings(SPEEDINFO_TAIL_SAMPLING_THRESHOLD=0)
+    def test_tail_sampling(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        with mock.patch("speedinfo.middleware.conditions_dispatcher.get_conditions") as get_conditions_mock:
+            sampling_condition = mock.Mock(spec=SamplingCondition, process_request=mock.Mock(return_value=0))
+            get_conditions_mock.return_value = [sampling_condition, TailSamplingCondition()]
+
+            # Slow request rejected by sampling is profiled with weight 1
+            self.client.get(reverse("func-view"))
+            self.assertEqual(profiler_mock.storage.add.call_args.kwargs["weight"], 1)
+            self.assertEqual(sampling_condition.process_tail_sampled.call_count, 1)
+
+            # Sampled slow request keeps the weight of the sampling condition
+            profiler_mock.reset_mock()
+            sampling_condition.process_request.return_value = 4
+            self.client.get(reverse("func-view"))
+            self.assertEqual(profiler_mock.storage.add.call_args.kwargs["weight"], 4)
+            self.assertEqual(sampling_condition.process_tail_sampled.call_count, 1)
+
+            # Fast request rejected by sampling is not profiled
+            profiler_mock.reset_mock()
+            sampling_condition.process_request.return_value = 0
+
+            with override_settings(SPEEDINFO_TAIL_SAMPLING_THRESHOLD=60):
+                self.client.get(reverse("func-view"))
+                profiler_mock.storage.add.assert_not_called()
+                self.assertEqual(sampling_condition.process_tail_sampled.call_count, 1)
+
+                sampling_condition.process_request.return_value = 4
+                self.client.get(reverse("func-view"))
+                self.assertEqual(profiler_mock.storage.add.call_args.kwargs["weight"], 4)
+
+            # Non-sampling conditions reject requests regardless of tail sampling
+            profiler_mock.reset_mock()
+            get_conditions_mock.return_value = [
+                mock.Mock(process_request=mock.Mock(return_value=False)),
+                TailSamplingCondition(),
+            ]
+            self.client.get(reverse("func-view"))
+            profiler_mock.storage.add.assert_not_called()
+
+    def test_sampling_rules(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        profiler_mock.get_sampling_rate.return_value = 0
+        self.client.get(reverse("func-view"))
+        profiler_mock.storage.add.assert_not_called()
+        profiler_mock.get_sampling_rate.assert_called_with("tests.views.func_view", "")
+
+        with mock.patch("speedinfo.middleware.random.random", return_value=0.1):
+            profiler_mock.get_sampling_rate.return_value = 0.25
+            self.client.get(reverse("func-view"))
+            self.assertEqual(profiler_mock.storage.add.call_args.kwargs["weight"], 4)
+
+            profiler_mock.reset_mock()
+            profiler_mock.get_sampling_rate.return_value = 0.05
+            self.client.get(reverse("func-view"))
+            profiler_mock.storage.add.assert_not_called()
+
+            # Requests rejected by sampling rules are subject to tail sampling
+            with override_settings(SPEEDINFO_TAIL_SAMPLING_THRESHOLD=0):
+                with mock.patch("speedinfo.middleware.conditions_dispatcher.get_conditions") as get_conditions_mock:
+                    get_conditions_mock.return_value = [TailSamplingCondition()]
+                    self.client.get(reverse("func-view"))
+                    self.assertEqual(profiler_mock.storage.add.call_args.kwargs["weight"], 1)
+
+    def test_overhead(self, profiler_mock):
+        profiler_mock.is_on = True
+        self.client.get(reverse("func-view"))
+
+        overhead, duration, weight = profiler_mock.overhead.record.call_args[0]
+        self.assertGreater(overhead, 0)
+        self.assertGreater(duration, 0)
+        self.assertEqual(weight, 1)
+
+    def test_overhead_backoff(self, profiler_mock):
+        profiler_mock.is_on = True
+        profiler_mock.overhead.rate = 0.5
+        profiler_mock.get_sampling_rate.return_value = 0.5
+
+        with mock.patch("speedinfo.middleware.random.random", return_value=0.2):
+            self.client.get(reverse("func-view"))
+            self.assertEqual(profiler_mock.storage.add.call_args.kwargs["weight"], 4)
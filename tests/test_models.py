@@ -22,3 +22,94 @@ class ModelTestCase(TestCase):
     def test_extra_fields(self):
         vp = ViewProfiler(extra="Value")
         self.assertEqual(getattr(vp, "extra", None), "Value")
+
+    def test_sql_by_alias(self):
+        vp = ViewProfiler(total_calls=2, breakdowns={"sql_alias": {"replica": (10, 0.2), "default": (2, 0.004)}})
+        self.assertEqual(vp.sql_by_alias_per_call, "default: 1.0 / 0.0020s, replica: 5.0 / 0.1000s")
+        self.assertEqual(ViewProfiler().sql_by_alias_per_call, "")
+
+    def test_status_and_exceptions(self):
+        vp = ViewProfiler(total_calls=4, breakdowns={
+            "status": {"2xx": (3, 0.3), "5xx": (1, 2)},
+            "exception": {"ValueError": (1, 2)},
+        })
+        self.assertEqual(vp.by_status, "2xx: 75.0% / 0.1000s, 5xx: 25.0% / 2.0000s")
+        self.assertEqual(vp.errors_ratio, 25)
+        self.assertEqual(vp.exceptions, "ValueError: 1 / 2.0000s")
+        self.assertEqual(ViewProfiler().by_status, "")
+        self.assertEqual(ViewProfiler().errors_ratio, 0)
+
+    def test_http(self):
+        vp = ViewProfiler(total_calls=4, total_time=2, breakdowns={"http": {"api.local:80": (8, 0.5)}})
+        self.assertEqual(vp.http_by_host_per_call, "api.local:80: 2.0 / 0.1250s")
+        self.assertEqual(vp.http_time_ratio, 25)
+        self.assertEqual(ViewProfiler().http_by_host_per_call, "")
+        self.assertEqual(ViewProfiler().http_time_ratio, 0)
+
+    def test_connection_time(self):
+        vp = ViewProfiler(total_calls=4, breakdowns={
+            "db_connect": {"default": (4, 0.08), "replica": (2, 0.02)},
+            "db_transaction": {"default": (2, 0.2)},
+            "db_commit": {"default": (2, 0.04)},
+        })
+        self.assertAlmostEqual(vp.connect_time_per_call, 0.025)
+        self.assertAlmostEqual(vp.transaction_time_per_call, 0.05)
+        self.assertAlmostEqual(vp.commit_time_per_call, 0.01)
+        self.assertEqual(ViewProfiler().connect_time_per_call, 0)
+
+    def test_gc_pauses(self):
+        vp = ViewProfiler(total_calls=4, total_time=2, breakdowns={"gc": {"gen0": (10, 0.02), "gen2": (1, 0.08)}})
+        self.assertEqual(vp.gc_pauses, "gen0: 10 / 0.0020s, gen2: 1 / 0.0800s")
+        self.assertAlmostEqual(vp.gc_time_ratio, 5)
+        self.assertEqual(ViewProfiler().gc_pauses, "")
+        self.assertEqual(ViewProfiler().gc_time_ratio, 0)
+
+    def test_body_sizes(self):
+        vp = ViewProfiler(total_calls=4, breakdowns={
+            "size": {"request": (2, 300), "response": (1, 4000), "response_gzip": (3, 3000)},
+        })
+        self.assertEqual(vp.request_size_per_call, 150)
+        self.assertEqual(vp.response_size_per_call, 4000)
+        self.assertEqual(vp.compressed_response_size_per_call, 1000)
+        self.assertEqual(vp.response_total_size, 7000)
+        self.assertEqual(ViewProfiler().request_size_per_call, 0)
+        self.assertEqual(ViewProfiler().response_total_size, 0)
+
+    def test_queue_time(self):
+        vp = ViewProfiler(total_calls=4, breakdowns={"queue": {"X-Request-Start": (2, 0.5), "X-Queue-Start": (2, 0.3)}})
+        self.assertEqual(vp.queue_time_per_call, 0.2)
+        self.assertEqual(ViewProfiler().queue_time_per_call, 0)
+
+    def test_dimensions(self):
+        vp = ViewProfiler(total_calls=4, breakdowns={
+            "status": {"2xx": (4, 0.4)},
+            "dimension.route": {"^func/$": (3, 0.3), "^func/(?P<pk>[0-9]+)/$": (1, 0.2)},
+            "dimension.tenant": {"acme": (4, 0.5)},
+        })
+        self.assertEqual(
+            vp.dimensions,
+            "route=^func/$: 75.0% / 0.1000s, route=^func/(?P<pk>[0-9]+)/$: 25.0% / 0.2000s, "
+            "tenant=acme: 100.0% / 0.1250s",
+        )
+        self.assertEqual(ViewProfiler().dimensions, "")
+
+    @mock.patch("speedinfo.managers.profiler")
+    def test_storage_pushdown(self, profiler_mock):
+        profiler_mock.storage.fetch_all.return_value = []
+        profiler_mock.storage.count.return_value = 25
+
+        qs = ViewProfiler.objects.filter_storage(method="GET").order_by("-total_time")
+        list(qs[10:20])
+
+        # Ordering is a tuple or a list depending on Django version
+        self.assertEqual(profiler_mock.storage.fetch_all.call_count, 1)
+        ordering, = profiler_mock.storage.fetch_all.call_args[0]
+        self.assertListEqual(list(ordering), ["-total_time"])
+        self.assertDictEqual(profiler_mock.storage.fetch_all.call_args[1], {
+            "filters": {"method": "GET"}, "offset": 10, "limit": 10,
+        })
+
+        self.assertEqual(qs.count(), 25)
+        self.assertEqual(qs[10:20].count(), 10)
+        self.assertEqual(qs[20:40].count(), 5)
+        profiler_mock.storage.count.assert_called_with({"method": "GET"})
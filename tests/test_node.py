@@ -0,0 +1,204 @@
+# coding: utf-8
+
+import json
+import math
+
+import mock
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+
+from speedinfo.storage.base import create_counters
+from speedinfo.storage.node.storage import HTTPError, NodeStorage
+
+try:
+    from django.urls import reverse  # Django >= 1.10
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+@override_settings(
+    SPEEDINFO_NODE_STORAGE="speedinfo.storage.cache.storage.CacheStorage",
+    SPEEDINFO_NODE_FLUSH_INTERVAL=60,
+    SPEEDINFO_TESTS=True,
+)
+class NodeStorageTestCase(TestCase):
+    def setUp(self):
+        self.storage = self.create_storage("web1")
+        self.storage.reset()
+
+    def create_storage(self, node, **settings):
+        with override_settings(SPEEDINFO_NODE_NAME=node, **settings):
+            return NodeStorage()
+
+    def add(self, storage, execution_time, sql_count=1):
+        storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=False, is_cache_hit=False,
+            sql_time=0.1, sql_count=sql_count, view_execution_time=execution_time,
+            breakdowns={"sql_alias": {"default": (sql_count, 0.1)}},
+        )
+
+    def test_aggregation(self):
+        another_storage = self.create_storage("web2")
+
+        for execution_time in (2, 4, 4):
+            self.add(self.storage, execution_time)
+
+        for execution_time in (5, 9):
+            self.add(another_storage, execution_time, sql_count=3)
+
+        # Data is shipped on flush only
+        self.assertEqual(self.storage.count(), 0)
+
+        self.storage.flush()
+        another_storage.flush()
+        another_storage.flush()
+
+        entry = self.storage.fetch_all()[0]
+        self.assertEqual(entry.total_calls, 5)
+        self.assertEqual(entry.total_time, 24)
+        self.assertEqual((entry.time_min, entry.time_max), (2, 9))
+        self.assertEqual(entry.sql_total_count, 9)
+        self.assertAlmostEqual(entry.time_stddev, math.sqrt(26.8 / 4))
+        self.assertEqual(entry.sql_by_alias, {"default": (9, 0.5)})
+        self.assertEqual(entry.breakdowns["node"], {"web1": (3, 10), "web2": (2, 14)})
+        self.assertEqual(entry.by_node, "web1: 3 / 3.3333s, web2: 2 / 7.0000s")
+
+    @override_settings(SPEEDINFO_COLLECTOR_TOKEN="secret")
+    @mock.patch("speedinfo.storage.node.storage.logger")
+    def test_collector_url(self, logger_mock):
+        storage = self.create_storage("web1", SPEEDINFO_NODE_COLLECTOR_URL="http://collector/speedinfo/collect/")
+        self.add(storage, 1)
+
+        with mock.patch("speedinfo.storage.node.storage.urlopen", side_effect=IOError) as urlopen_mock:
+            storage.flush()
+
+        request = urlopen_mock.call_args[0][0]
+        self.assertEqual(request.get_full_url(), "http://collector/speedinfo/collect/")
+        self.assertEqual(request.get_header("Authorization"), "Token secret")
+        self.assertEqual(json.loads(request.data.decode("utf-8"))["node"], "web1")
+
+        # Counters are kept until the collector is available
+        self.add(storage, 3)
+
+        with mock.patch("speedinfo.storage.node.storage.urlopen") as urlopen_mock:
+            storage.flush()
+
+        entries = json.loads(urlopen_mock.call_args[0][0].data.decode("utf-8"))["entries"]
+        self.assertEqual([(e["view_name"], e["total_calls"], e["total_time"]) for e in entries], [
+            ("app.view_name", 2, 4),
+        ])
+        self.assertEqual(storage.count(), 0)
+
+    @override_settings(SPEEDINFO_NODE_BATCH_SIZE=2)
+    @mock.patch("speedinfo.storage.node.storage.logger")
+    def test_batches(self, logger_mock):
+        storage = self.create_storage("web1", SPEEDINFO_NODE_COLLECTOR_URL="http://collector/speedinfo/collect/")
+
+        for i in range(5):
+            storage.add(
+                view_name="app.view{}".format(i), method="GET", is_anon_call=False, is_cache_hit=False,
+                sql_time=0, sql_count=0, view_execution_time=1,
+            )
+
+        # Rejected batch is dropped, the batches after the unavailable collector are kept
+        errors = [HTTPError("http://collector/", 400, "Bad Request", {}, None), mock.Mock(), IOError]
+
+        with mock.patch("speedinfo.storage.node.storage.urlopen", side_effect=errors) as urlopen_mock:
+            storage.flush()
+
+        self.assertEqual(urlopen_mock.call_count, 3)
+        self.assertEqual(
+            [len(json.loads(call[0][0].data.decode("utf-8"))["entries"]) for call in urlopen_mock.call_args_list],
+            [2, 2, 1],
+        )
+
+        with mock.patch("speedinfo.storage.node.storage.urlopen") as urlopen_mock:
+            storage.flush()
+
+        entries = json.loads(urlopen_mock.call_args[0][0].data.decode("utf-8"))["entries"]
+        self.assertListEqual([entry["view_name"] for entry in entries], ["app.view4"])
+
+    @mock.patch("speedinfo.storage.node.storage.logger")
+    def test_storage_error(self, logger_mock):
+        self.add(self.storage, 1)
+
+        with mock.patch.object(self.storage.storage, "merge", side_effect=DatabaseError):
+            self.storage.flush()
+
+        self.assertTrue(logger_mock.exception.called)
+
+        # Counters are kept until the storage is available
+        self.add(self.storage, 3)
+        self.storage.flush()
+
+        entry = self.storage.fetch_all()[0]
+        self.assertEqual((entry.total_calls, entry.total_time), (2, 4))
+
+    @mock.patch("speedinfo.storage.node.storage.logger")
+    @mock.patch("speedinfo.storage.node.storage.close_old_connections")
+    def test_flusher(self, close_mock, logger_mock):
+        self.add(self.storage, 1)
+
+        # Flusher thread keeps running after the errors and releases database connections
+        with mock.patch.object(self.storage, "flush", side_effect=[ValueError, None]) as flush_mock, \
+                mock.patch("speedinfo.storage.node.storage.time.sleep", side_effect=[None, None, SystemExit]):
+            with self.assertRaises(SystemExit):
+                self.storage.run_flusher()
+
+        self.assertEqual(flush_mock.call_count, 2)
+        self.assertEqual(close_mock.call_count, 2)
+        self.assertEqual(logger_mock.exception.call_count, 1)
+
+    def test_reset(self):
+        self.add(self.storage, 1)
+        self.storage.reset()
+        self.storage.flush()
+        self.assertEqual(self.storage.count(), 0)
+
+
+@override_settings(
+    SPEEDINFO_STORAGE="speedinfo.storage.cache.storage.CacheStorage",
+    SPEEDINFO_COLLECTOR_TOKEN="secret",
+    SPEEDINFO_TESTS=True,
+)
+class CollectorViewTestCase(TestCase):
+    def post(self, data, token="secret"):
+        return self.client.post(
+            reverse("speedinfo-collect"), json.dumps(data), content_type="application/json",
+            HTTP_AUTHORIZATION="Token {}".format(token),
+        )
+
+    @mock.patch("speedinfo.views.profiler")
+    def test_collect(self, profiler_mock):
+        counters = create_counters("app.view_name", "GET", False, False, 0, 1, 0.5)
+        response = self.post({"node": "web1", "entries": [counters]})
+
+        self.assertEqual(response.status_code, 204)
+        profiler_mock.storage.merge.assert_called_once_with([counters], node="web1")
+
+    @mock.patch("speedinfo.views.profiler")
+    def test_invalid_requests(self, profiler_mock):
+        self.assertEqual(self.post({"node": "web1", "entries": []}, token="wrong").status_code, 403)
+        self.assertEqual(self.post({"entries": []}).status_code, 400)
+        self.assertEqual(self.post({"node": "web1", "entries": [{"view_name": "app"}]}).status_code, 400)
+
+        counters = create_counters(
+            "app.view_name", "GET", False, False, 0, 1, 0.5, breakdowns={"status": {"2xx": (1, 0.5)}},
+        )
+        self.assertEqual(self.post({"node": "web1", "entries": [dict(counters, total_time="0.5")]}).status_code, 400)
+        self.assertEqual(self.post({"node": "web1", "entries": [
+            counters, dict(counters, breakdowns={"status": {"2xx": [1]}}),
+        ]}).status_code, 400)
+        self.assertEqual(self.post({"node": "web1", "entries": [dict(counters, breakdowns=[])]}).status_code, 400)
+        self.assertEqual(self.client.post(reverse("speedinfo-collect")).status_code, 403)
+
+        with override_settings(SPEEDINFO_COLLECTOR_TOKEN=None):
+            self.assertEqual(self.post({"node": "web1", "entries": []}, token="None").status_code, 403)
+
+        profiler_mock.storage.merge.assert_not_called()
+
+    @mock.patch("speedinfo.views.profiler")
+    def test_write_only_storage(self, profiler_mock):
+        profiler_mock.storage.merge.side_effect = NotImplementedError
+        counters = create_counters("app.view_name", "GET", False, False, 0, 1, 0.5)
+        self.assertEqual(self.post({"node": "web1", "entries": [counters]}).status_code, 400)
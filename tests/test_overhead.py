@@ -0,0 +1,56 @@
+# coding: utf-8
+
+import mock
+from django.test import TestCase, override_settings
+
+from speedinfo.overhead import OverheadMonitor
+
+
+@override_settings(SPEEDINFO_OVERHEAD_WINDOW=10, SPEEDINFO_OVERHEAD_MIN_RATE=0.01)
+class OverheadMonitorTestCase(TestCase):
+    def record_window(self, monitor, overhead, duration, weight, requests=10):
+        with mock.patch("speedinfo.overhead.default_timer", return_value=monitor.window_start):
+            for i in range(requests - 1):
+                monitor.record(overhead, duration, weight)
+
+        with mock.patch("speedinfo.overhead.default_timer", return_value=monitor.window_start + 11):
+            monitor.record(overhead, duration, weight)
+
+    def test_totals(self):
+        monitor = OverheadMonitor()
+        self.record_window(monitor, 0.001, 0.1, 1)
+
+        self.assertAlmostEqual(monitor.total_overhead, 0.01)
+        self.assertEqual(monitor.total_requests, 10)
+        self.assertEqual(monitor.window_weight, 0)
+
+    def test_no_budget(self):
+        monitor = OverheadMonitor()
+        self.record_window(monitor, 0.05, 0.1, 1)
+        self.assertEqual(monitor.rate, 1.0)
+
+    @override_settings(SPEEDINFO_OVERHEAD_BUDGET_RATIO=0.01)
+    def test_budget_ratio(self):
+        monitor = OverheadMonitor()
+
+        # Overhead is 4% of the request time
+        self.record_window(monitor, 0.004, 0.1, 1)
+        self.assertAlmostEqual(monitor.rate, 0.25)
+
+        # Sampled requests represent the rejected ones
+        self.record_window(monitor, 0.004, 0.1, 4)
+        self.assertAlmostEqual(monitor.rate, 0.25)
+
+        # Rate is restored when the overhead is well below the budget
+        self.record_window(monitor, 0.001, 0.1, 4)
+        self.assertAlmostEqual(monitor.rate, 0.5)
+
+    @override_settings(SPEEDINFO_OVERHEAD_BUDGET_TIME=0.001)
+    def test_budget_time(self):
+        monitor = OverheadMonitor()
+
+        self.record_window(monitor, 0.002, 0.1, 1)
+        self.assertAlmostEqual(monitor.rate, 0.5)
+
+        self.record_window(monitor, 1, 0.1, 1)
+        self.assertAlmostEqual(monitor.rate, 0.01)
@@ -1,9 +1,13 @@
 # coding: utf-8
 
+from datetime import timedelta
+
+import mock
 from django.core.cache import cache
 from django.test import TestCase, override_settings
 
 from speedinfo import profiler
+from speedinfo.profiler import Profiler
 from speedinfo.storage.cache.storage import CacheStorage
 
 
@@ -24,3 +28,134 @@ class ProfilerTestCase(TestCase):
 
     def test_storage(self):
         self.assertIsInstance(profiler.storage, CacheStorage)
+
+    def test_config(self):
+        self.assertEqual(profiler.config, {})
+        self.assertEqual(profiler.sampling_rules, {})
+
+        profiler.config = {"key": "value"}
+        profiler.sampling_rules = {"*": 0.5}
+        self.assertEqual(profiler.config, {"key": "value", "sampling_rules": {"*": 0.5}})
+
+    @override_settings(SPEEDINFO_TESTS=False, SPEEDINFO_CONFIG_REFRESH_INTERVAL=60)
+    def test_config_refresh(self):
+        profiler.config = {"key": "value"}
+        cache.set(Profiler.PROFILER_CONFIG_CACHE_KEY, {"key": "changed"})
+        self.assertEqual(profiler.config, {"key": "value"})
+
+        # Simulates expiration of the locally cached config
+        profiler._config_expires_at = 0
+        self.assertEqual(profiler.config, {"key": "changed"})
+
+    def test_sampling_rate(self):
+        self.assertEqual(profiler.get_sampling_rate("app.views.index"), 1.0)
+
+        profiler.sampling_rules = {
+            "*": 0.5,
+            "api:": 0.2,
+            "api:v1:": 0,
+            "app.views.index": 1,
+            "app.views.list": 0.1,
+        }
+        self.assertEqual(profiler.get_sampling_rate("app.views.index", "api:v1"), 1)
+        self.assertEqual(profiler.get_sampling_rate("app.views.list"), 0.1)
+        self.assertEqual(profiler.get_sampling_rate("app.views.detail", "api:v1"), 0)
+        self.assertEqual(profiler.get_sampling_rate("app.views.detail", "api:v2"), 0.2)
+        self.assertEqual(profiler.get_sampling_rate("app.views.detail", "apiv1"), 0.5)
+        self.assertEqual(profiler.get_sampling_rate("app.views.detail"), 0.5)
+
+    def test_session(self):
+        profiler.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=3, sql_count=2, view_execution_time=3,
+        )
+        profiler.start_session("release", max_requests=2)
+
+        # Profiling data is reset on start
+        self.assertTrue(profiler.is_on)
+        self.assertEqual(profiler.session["name"], "release")
+        self.assertEqual(profiler.storage.count(), 0)
+
+        profiler.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=3, sql_count=2, view_execution_time=3,
+        )
+        self.assertTrue(profiler.check_session())
+        self.assertTrue(profiler.check_session())
+        self.assertTrue(profiler.check_session(count_request=False))
+        self.assertFalse(profiler.check_session())
+
+        # Session data is saved as a snapshot
+        self.assertFalse(profiler.is_on)
+        self.assertIsNone(profiler.session)
+        self.assertTrue(profiler.check_session())
+
+        snapshots = profiler.storage.fetch_snapshots(["-finished_at"])
+        self.assertEqual(snapshots[0].name, "release")
+        self.assertEqual(profiler.storage.fetch_snapshot_counters(snapshots[0].id)[0]["total_calls"], 1)
+
+    def test_session_requests_incr_error(self):
+        profiler.start_session("release", max_requests=2)
+
+        with mock.patch.object(cache, "incr", side_effect=TypeError):
+            self.assertTrue(profiler.check_session())
+            self.assertTrue(profiler.check_session())
+            self.assertFalse(profiler.check_session())
+
+        self.assertFalse(profiler.is_on)
+
+    def test_session_duration(self):
+        profiler.start_session("release", duration=60)
+        self.assertTrue(profiler.check_session())
+
+        started_at = profiler.session["started_at"]
+
+        with mock.patch("django.utils.timezone.now", return_value=started_at + timedelta(seconds=60)):
+            self.assertFalse(profiler.check_session(count_request=False))
+
+        self.assertFalse(profiler.is_on)
+        self.assertIsNone(profiler.session)
+
+    def test_stop_session_once(self):
+        self.assertIsNone(profiler.stop_session())
+
+        profiler.start_session("release", duration=60)
+        session = profiler.session
+
+        with mock.patch.object(profiler.storage, "save_snapshot") as save_snapshot_mock:
+            # Another worker has already stopped the session
+            cache.add(Profiler.PROFILER_SESSION_STOPPED_CACHE_KEY.format(session["id"]), True)
+            profiler.stop_session()
+            save_snapshot_mock.assert_not_called()
+
+            cache.delete(Profiler.PROFILER_SESSION_STOPPED_CACHE_KEY.format(session["id"]))
+            self.assertEqual(profiler.stop_session(), session)
+            save_snapshot_mock.assert_called_once()
+
+    def add_calls(self, count, execution_time):
+        for i in range(count):
+            profiler.storage.add(
+                view_name="app.view_name", method="GET", is_anon_call=False, is_cache_hit=False,
+                sql_time=0, sql_count=1, view_execution_time=execution_time + i % 2 * 0.01,
+            )
+
+    def test_baseline(self):
+        self.assertIsNone(profiler.baseline)
+        self.assertIsNone(profiler.detect_regressions())
+
+        self.add_calls(10, 0.1)
+        baseline_id = profiler.freeze_baseline("before deploy")
+
+        self.assertEqual(profiler.baseline, baseline_id)
+        self.assertEqual(profiler.storage.count(), 0)
+        self.assertEqual(profiler.storage.fetch_snapshots()[0].name, "before deploy")
+
+        self.add_calls(10, 0.1)
+        self.assertListEqual(profiler.detect_regressions(), [])
+
+        self.add_calls(10, 0.5)
+        regressions = profiler.detect_regressions()
+        self.assertListEqual([(item["view_name"], item["metric"]) for item in regressions], [
+            ("app.view_name", "time_per_call"),
+        ])
+        self.assertListEqual(profiler.detect_regressions(baseline_id, min_calls=100), [])
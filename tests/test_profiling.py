@@ -0,0 +1,369 @@
+# coding: utf-8
+
+import gc
+import threading
+import unittest
+
+import mock
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from speedinfo import profile
+from speedinfo.db_monitor import instrument_connection
+from speedinfo.integrations.celery import active_blocks, task_postrun_handler, task_prerun_handler
+from speedinfo.integrations.commands import ProfiledCommandMixin
+from speedinfo.monitor import ContextStackMonitor
+from speedinfo.profiling import ProfilingContext
+
+try:
+    from StringIO import StringIO  # Python 2
+except ImportError:
+    from io import StringIO
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.request import urlopen
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer  # Python 2
+    from urllib2 import urlopen
+
+
+@override_settings(
+    SPEEDINFO_STORAGE="speedinfo.storage.cache.storage.CacheStorage",
+    SPEEDINFO_TESTS=True,
+)
+@mock.patch("speedinfo.profiling.profiler", **{"get_sampling_rate.return_value": 1.0, "overhead.rate": 1.0})
+class ProfilingTestCase(TestCase):
+    def test_context_manager(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        with profile("app.reports.build"):
+            User.objects.count()
+
+        kwargs = profiler_mock.storage.add.call_args.kwargs
+        self.assertEqual(kwargs["view_name"], "app.reports.build")
+        self.assertEqual(kwargs["method"], "BLOCK")
+        self.assertEqual(kwargs["sql_count"], 1)
+        self.assertEqual(kwargs["weight"], 1)
+
+    def test_decorator(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        @profile("app.tasks.send_email", kind="TASK")
+        def send_email(address):
+            return address
+
+        self.assertEqual(send_email("test@example.com"), "test@example.com")
+        self.assertEqual(profiler_mock.storage.add.call_args.kwargs["method"], "TASK")
+
+    def test_exception(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        with self.assertRaises(ValueError):
+            with profile("app.reports.build"):
+                raise ValueError
+
+        profiler_mock.storage.add.assert_called_once()
+        self.assertListEqual(list(profiler_mock.storage.add.call_args.kwargs["breakdowns"]["exception"]), [
+            "ValueError",
+        ])
+
+    def test_disabled(self, profiler_mock):
+        profiler_mock.is_on = False
+
+        with profile("app.reports.build"):
+            pass
+
+        profiler_mock.storage.add.assert_not_called()
+
+        profiler_mock.is_on = True
+        profiler_mock.get_sampling_rate.return_value = 0
+
+        with profile("app.reports.build"):
+            pass
+
+        profiler_mock.storage.add.assert_not_called()
+
+        profiler_mock.get_sampling_rate.return_value = 1.0
+        profiler_mock.check_session.return_value = False
+
+        with profile("app.reports.build"):
+            pass
+
+        profiler_mock.storage.add.assert_not_called()
+
+    def test_sampling(self, profiler_mock):
+        profiler_mock.is_on = True
+        profiler_mock.get_sampling_rate.return_value = 0.5
+
+        with mock.patch("speedinfo.profiling.random.random", return_value=0.2):
+            with profile("app.reports.build"):
+                pass
+
+        self.assertEqual(profiler_mock.storage.add.call_args.kwargs["weight"], 2)
+
+    def test_celery_task(self, profiler_mock):
+        profiler_mock.is_on = True
+        task = mock.Mock()
+        task.name = "app.tasks.send_email"
+
+        task_prerun_handler(task_id="1", task=task)
+        self.assertIn("1", active_blocks)
+        task_postrun_handler(task_id="1", task=task)
+        self.assertNotIn("1", active_blocks)
+
+        kwargs = profiler_mock.storage.add.call_args.kwargs
+        self.assertEqual(kwargs["view_name"], "app.tasks.send_email")
+        self.assertEqual(kwargs["method"], "TASK")
+
+        # Unknown task is ignored
+        task_postrun_handler(task_id="2", task=task)
+
+    def test_command(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        class Command(ProfiledCommandMixin, BaseCommand):
+            def handle(self, *args, **options):
+                return "done"
+
+        stdout = StringIO()
+        Command().execute(no_color=True, force_color=False, skip_checks=True, stdout=stdout)
+        self.assertEqual(stdout.getvalue(), "done\n")
+
+        kwargs = profiler_mock.storage.add.call_args.kwargs
+        self.assertEqual(kwargs["view_name"], __name__)
+        self.assertEqual(kwargs["method"], "COMMAND")
+
+
+@override_settings(DEBUG=False)
+class ProfilingContextTestCase(TestCase):
+    def test_nested_contexts(self):
+        outer = ProfilingContext()
+        outer.start()
+        User.objects.count()
+
+        inner = ProfilingContext()
+        inner.start()
+        User.objects.count()
+        self.assertEqual(inner.get_sql_stats()[0], 1)
+        inner.stop()
+
+        # Inner context keeps the debug mode enabled by the outer one
+        if not hasattr(connection, "execute_wrappers"):
+            self.assertTrue(connection.force_debug_cursor)
+
+        self.assertEqual(outer.get_sql_stats()[0], 2)
+        outer.stop()
+
+        self.assertFalse(connection.force_debug_cursor)
+        self.assertEqual(len(connection.queries), 0)
+
+    @unittest.skipUnless(hasattr(connection, "execute_wrappers"), "Execute wrappers are not supported")
+    def test_execute_wrapper(self):
+        queries = []
+
+        def execute_wrapper(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(execute_wrapper):
+            context = ProfilingContext()
+            context.start()
+            User.objects.count()
+
+        # Queries are counted regardless of the bounded queries log
+        connection.queries_log.clear()
+        User.objects.count()
+        self.assertEqual(context.get_sql_stats()[0], 2)
+        self.assertGreaterEqual(context.get_sql_stats()[1], 0)
+        context.stop()
+
+        # Execute wrappers added by the application are removed correctly
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(execute_wrapper, connection.execute_wrappers)
+
+    @unittest.skipUnless(hasattr(gc, "callbacks"), "Garbage collector callbacks are not supported")
+    @override_settings(SPEEDINFO_PROFILE_GC=True)
+    def test_gc_stats(self):
+        # Automatic collections would make the numbers unpredictable
+        if gc.isenabled():
+            gc.disable()
+            self.addCleanup(gc.enable)
+
+        outer = ProfilingContext()
+        outer.start()
+        gc.collect(0)
+
+        inner = ProfilingContext()
+        inner.start()
+        gc.collect(2)
+        self.assertListEqual(list(inner.get_gc_stats()), ["gen2"])
+        inner.stop()
+
+        gc.collect(2)
+        stats = outer.get_gc_stats()
+        outer.stop()
+        gc.collect(0)
+
+        # Collections triggered in the inner context are counted by the outer one as well
+        self.assertEqual(stats["gen0"][0], 1)
+        self.assertEqual(stats["gen2"][0], 2)
+        self.assertGreater(stats["gen2"][1], 0)
+        self.assertDictEqual(outer.get_gc_stats(), stats)
+
+    def test_gc_stats_disabled(self):
+        context = ProfilingContext()
+        context.start()
+        gc.collect(0)
+        self.assertDictEqual(context.get_gc_stats(), {})
+        context.stop()
+
+
+class EventMonitor(ContextStackMonitor):
+    def install(self):
+        pass
+
+
+class ContextStackMonitorTestCase(TestCase):
+    def test_record(self):
+        monitor = EventMonitor()
+        outer = monitor.start()
+        inner = monitor.start()
+        monitor.record("event", 0.5)
+        monitor.stop(inner)
+        monitor.record("event", 0.25)
+
+        # Events in other threads are not attributed to the contexts
+        thread = threading.Thread(target=monitor.record, args=("event", 1))
+        thread.start()
+        thread.join()
+
+        monitor.stop(outer)
+        monitor.record("event", 1)
+
+        self.assertDictEqual(inner, {"event": [1, 0.5]})
+        self.assertDictEqual(outer, {"event": [2, 0.75]})
+
+
+class DatabaseConnectionStub(object):
+    alias = "stub"
+    autocommit = True
+    connection = None
+
+    def connect(self):
+        self.connection = object()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def set_autocommit(self, autocommit):
+        self.autocommit = autocommit
+
+    def _start_transaction_under_autocommit(self):
+        pass
+
+
+@override_settings(SPEEDINFO_PROFILE_CONNECTIONS=True)
+class ConnectionStatsTestCase(TransactionTestCase):
+    def test_instrument_connection(self):
+        conn = DatabaseConnectionStub()
+        stats = instrument_connection(conn)
+        self.assertIs(instrument_connection(conn), stats)
+
+        conn.connect()
+        conn.set_autocommit(False)
+        conn.commit()
+        conn.set_autocommit(True)
+
+        # Autocommit restored without a transaction started is not counted
+        conn.set_autocommit(True)
+
+        self.assertListEqual([stats[name][0] for name in ("db_connect", "db_transaction", "db_commit")], [1, 1, 1])
+
+        # SQLite transactions started by atomic blocks of Django < 2.0 end with the commit or the rollback
+        conn._start_transaction_under_autocommit()
+        conn.commit()
+        conn._start_transaction_under_autocommit()
+        conn.rollback()
+        conn.rollback()
+
+        self.assertListEqual([stats[name][0] for name in ("db_connect", "db_transaction", "db_commit")], [1, 3, 2])
+
+    def test_connection_stats(self):
+        context = ProfilingContext()
+        context.start()
+
+        with transaction.atomic():
+            User.objects.count()
+
+            # Savepoints are a part of the outer transaction
+            with transaction.atomic():
+                User.objects.count()
+
+        User.objects.count()
+        stats = context.get_connection_stats()
+        context.stop()
+
+        self.assertEqual(stats["db_transaction"]["default"][0], 1)
+        self.assertEqual(stats["db_commit"]["default"][0], 1)
+        self.assertNotIn("db_connect", stats)
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(SPEEDINFO_PROFILE_HTTP=True)
+class HTTPStatsTestCase(TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), OkHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_address[1])
+
+    def test_http_stats(self):
+        outer = ProfilingContext()
+        outer.start()
+        urlopen(self.url).read()
+
+        inner = ProfilingContext()
+        inner.start()
+        urlopen(self.url).read()
+        inner_stats = inner.get_http_stats()
+        inner.stop()
+
+        stats = outer.get_http_stats()
+        outer.stop()
+        urlopen(self.url).read()
+
+        host = "127.0.0.1:{}".format(self.server.server_address[1])
+        self.assertListEqual(list(inner_stats), [host])
+        self.assertEqual(inner_stats[host][0], 1)
+        self.assertEqual(stats[host][0], 2)
+        self.assertGreater(stats[host][1], 0)
+        self.assertDictEqual(outer.get_http_stats(), stats)
+
+    @mock.patch("speedinfo.profiling.profiler", **{"get_sampling_rate.return_value": 1.0, "overhead.rate": 1.0})
+    def test_profiled_block(self, profiler_mock):
+        profiler_mock.is_on = True
+
+        with profile("app.tasks.sync"):
+            urlopen(self.url).read()
+
+        breakdowns = profiler_mock.storage.add.call_args.kwargs["breakdowns"]
+        self.assertEqual(breakdowns["http"]["127.0.0.1:{}".format(self.server.server_address[1])][0], 1)
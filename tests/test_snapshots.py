@@ -0,0 +1,92 @@
+# coding: utf-8
+
+from django.test import TestCase
+
+from speedinfo.snapshots import compare_counters, detect_regressions
+
+
+class SnapshotsTestCase(TestCase):
+    def counters(self, view_name, total_calls, total_time):
+        return dict(
+            view_name=view_name, method="GET", anon_calls=0, cache_hits=0,
+            sql_total_time=0, sql_total_count=0, total_calls=total_calls, total_time=total_time,
+        )
+
+    def test_compare_counters(self):
+        results = compare_counters(
+            [self.counters("app.fast", 10, 1), self.counters("app.slow", 2, 2), self.counters("app.removed", 1, 1)],
+            [self.counters("app.fast", 10, 0.5), self.counters("app.slow", 4, 8), self.counters("app.added", 1, 1)],
+        )
+
+        self.assertListEqual(
+            [("app.slow", 1.0), ("app.fast", -0.5), ("app.added", None), ("app.removed", None)],
+            [(item["view_name"], item["change"]) for item in results],
+        )
+        self.assertDictEqual(results[0], dict(
+            view_name="app.slow", method="GET", baseline_calls=2, calls=4,
+            baseline_time_per_call=1.0, time_per_call=2.0, change=1.0,
+        ))
+        self.assertIsNone(results[2]["baseline_calls"])
+        self.assertIsNone(results[3]["time_per_call"])
+
+    def stats(self, view_name, values, sql_counts=None):
+        sql_counts = sql_counts or [0] * len(values)
+        count = len(values)
+        time_mean = sum(values) / float(count)
+        sql_mean = sum(sql_counts) / float(count)
+
+        return dict(
+            self.counters(view_name, count, sum(values)), sql_total_count=sum(sql_counts),
+            time_m2=sum((value - time_mean) ** 2 for value in values),
+            sql_count_m2=sum((value - sql_mean) ** 2 for value in sql_counts),
+        )
+
+    def test_detect_regressions(self):
+        baseline = [
+            self.stats("app.slower", [1, 1.1] * 10),
+            self.stats("app.noisy", [0.1, 2] * 10),
+            self.stats("app.queries", [1] * 20, [0] * 20),
+            self.stats("app.rare", [1]),
+        ]
+        counters = [
+            self.stats("app.slower", [1.5, 1.6] * 10),
+            self.stats("app.noisy", [0.1, 2.8] * 10),
+            self.stats("app.queries", [1] * 20, [2] * 20),
+            self.stats("app.rare", [10]),
+            self.stats("app.added", [10] * 20),
+        ]
+
+        results = detect_regressions(baseline, counters, threshold=0.2, z_score=3, min_calls=10)
+        self.assertListEqual(
+            [("app.queries", "sql_count_per_call", None), ("app.slower", "time_per_call", 0.48)],
+            [(item["view_name"], item["metric"], item["change"] and round(item["change"], 2)) for item in results],
+        )
+        self.assertIsNone(results[0]["z_score"])
+        self.assertGreater(results[1]["z_score"], 3)
+
+        # Difference of the constant values is significant with any z-score
+        results = detect_regressions(baseline, counters, threshold=0.2, z_score=1000, min_calls=1)
+        self.assertListEqual(["app.queries", "app.rare"], [item["view_name"] for item in results])
+
+        results = detect_regressions(baseline, counters, threshold=0.5, z_score=3, min_calls=10)
+        self.assertListEqual(["app.queries"], [item["view_name"] for item in results])
+
+    def test_detect_regressions_sampling(self):
+        baseline = [self.stats("app.view", [1, 1.1] * 10)]
+        counters = [self.stats("app.view", [1.5, 1.6] * 10)]
+        results = detect_regressions(baseline, counters, threshold=0.2, z_score=20, min_calls=1)
+        self.assertEqual(len(results), 1)
+
+        # Total calls estimated from a few sampled calls don't make the increase significant
+        baseline[0]["sampled_calls"] = counters[0]["sampled_calls"] = 4
+        self.assertListEqual(detect_regressions(baseline, counters, threshold=0.2, z_score=20, min_calls=1), [])
+        self.assertListEqual(detect_regressions(baseline, counters, threshold=0.2, z_score=3, min_calls=10), [])
+
+    def test_detect_regressions_without_stats(self):
+        # Snapshots saved before dispersion stats were tracked
+        results = detect_regressions(
+            [self.counters("app.view", 10, 1)], [self.counters("app.view", 10, 2)],
+            threshold=0.2, z_score=3, min_calls=10,
+        )
+        self.assertEqual(results[0]["change"], 1.0)
+        self.assertIsNone(results[0]["z_score"])
@@ -0,0 +1,51 @@
+# coding: utf-8
+
+import math
+
+from django.test import TestCase
+
+from speedinfo.stats import add_decayed_value, add_value, get_decay, get_stddev, merge_values
+
+
+class StatsTestCase(TestCase):
+    def accumulate(self, values):
+        count, total, m2 = 0, 0, 0.0
+
+        for value in values:
+            m2 = add_value(count, total, m2, value)
+            count += 1
+            total += value
+
+        return count, total, m2
+
+    def test_add_value(self):
+        count, total, m2 = self.accumulate([2, 4, 4, 5, 9])
+        self.assertAlmostEqual(m2, 26.8)
+        self.assertAlmostEqual(get_stddev(count, m2), math.sqrt(26.8 / 4))
+
+    def test_add_weighted_value(self):
+        m2 = add_value(2, 6, 2.0, 5, weight=3)
+        self.assertAlmostEqual(m2, self.accumulate([2, 4, 5, 5, 5])[2])
+
+    def test_merge_values(self):
+        first = self.accumulate([2, 4, 4])
+        second = self.accumulate([5, 9])
+
+        self.assertAlmostEqual(merge_values(*(first + second)), 26.8)
+        self.assertAlmostEqual(merge_values(0, 0, 0.0, *second), second[2])
+        self.assertAlmostEqual(merge_values(*(first + (0, 0, 0.0))), first[2])
+
+    def test_stddev(self):
+        self.assertEqual(get_stddev(0, 0), 0)
+        self.assertEqual(get_stddev(1, 0), 0)
+        self.assertAlmostEqual(get_stddev(3, 8), 2)
+
+    def test_add_decayed_value(self):
+        self.assertEqual(add_decayed_value(0, 0, 0, 5, 1, 10), (5, 1))
+        self.assertEqual(add_decayed_value(2, 4, 10, 5, 2, 10), (3.5, 4))
+        self.assertEqual(add_decayed_value(2, 4, 0, 5, 4, 10), (3.5, 8))
+
+    def test_decay(self):
+        self.assertEqual(get_decay(0, 10), 1)
+        self.assertEqual(get_decay(20, 10), 0.25)
+        self.assertEqual(get_decay(-5, 10), 1)
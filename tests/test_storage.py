@@ -1,10 +1,18 @@
 # coding: utf-8
 
+import math
+import socket
+from datetime import datetime, timedelta
+
+import mock
 from django.forms import model_to_dict
 from django.test import TestCase, override_settings
 
 from speedinfo.conf import speedinfo_settings
-from speedinfo.models import ViewProfiler
+from speedinfo.models import SlowRequest, ViewProfiler
+from speedinfo.storage.base import AbstractStorage, create_counters, merge_counters, upgrade_storage_class
+from speedinfo.storage.cache.storage import CacheStorage
+from speedinfo.storage.statsd.storage import StatsdStorage, pack_lines
 from speedinfo.utils import import_class
 
 
@@ -27,8 +35,9 @@ class StorageTestCase(object):
         self.assertEqual(len(entries), 1)
         self.assertDictEqual(dict(
             view_name="app.view_name", method="GET", anon_calls=1, cache_hits=1,
-            sql_total_time=2, sql_total_count=3, total_calls=1, total_time=4,
-        ), model_to_dict(entries[0], exclude=["id"]))
+            sql_total_time=2, sql_total_count=3, total_calls=1, sampled_calls=1, total_time=4,
+            time_min=4, time_max=4, time_m2=0, sql_count_min=3, sql_count_max=3, sql_count_m2=0,
+        ), model_to_dict(entries[0], fields=self.storage.COUNTER_FIELDS))
 
     def test_add_grouping(self):
         self.storage.add(
@@ -45,18 +54,155 @@ class StorageTestCase(object):
         )
 
         entries = self.storage.fetch_all()
-        dict_entries = [model_to_dict(e, exclude=["id"]) for e in entries]
+        dict_entries = [model_to_dict(e, fields=self.storage.COUNTER_FIELDS) for e in entries]
 
         self.assertEqual(len(entries), 2)
         self.assertIn(dict(
             view_name="app.view_name", method="GET", anon_calls=2, cache_hits=1,
-            sql_total_time=4, sql_total_count=3, total_calls=2, total_time=5,
+            sql_total_time=4, sql_total_count=3, total_calls=2, sampled_calls=2, total_time=5,
+            time_min=2, time_max=3, time_m2=0.5, sql_count_min=1, sql_count_max=2, sql_count_m2=0.5,
         ), dict_entries)
         self.assertIn(dict(
             view_name="app.view_name", method="POST", anon_calls=0, cache_hits=0,
-            sql_total_time=10, sql_total_count=5, total_calls=1, total_time=7,
+            sql_total_time=10, sql_total_count=5, total_calls=1, sampled_calls=1, total_time=7,
+            time_min=7, time_max=7, time_m2=0, sql_count_min=5, sql_count_max=5, sql_count_m2=0,
         ), dict_entries)
 
+    def test_add_weight(self):
+        self.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=True,
+            sql_time=2, sql_count=3, view_execution_time=4, weight=5,
+        )
+        self.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=False, is_cache_hit=False,
+            sql_time=1, sql_count=1, view_execution_time=1,
+        )
+        entries = self.storage.fetch_all()
+
+        self.assertDictContainsSubset(dict(
+            view_name="app.view_name", method="GET", anon_calls=5, cache_hits=5,
+            sql_total_time=11, sql_total_count=16, total_calls=6, sampled_calls=2, total_time=21,
+            time_min=1, time_max=4, sql_count_min=1, sql_count_max=3,
+        ), model_to_dict(entries[0], fields=self.storage.COUNTER_FIELDS))
+
+        # Weighted request counts as several requests with the same values
+        self.assertAlmostEqual(entries[0].time_m2, 7.5)
+        self.assertAlmostEqual(entries[0].sql_count_m2, 10 / 3.0)
+
+    def test_dispersion_stats(self):
+        for execution_time, sql_count in [(2, 1), (4, 3), (4, 1), (5, 7), (9, 3)]:
+            self.storage.add(
+                view_name="app.view_name", method="GET", is_anon_call=False, is_cache_hit=False,
+                sql_time=0, sql_count=sql_count, view_execution_time=execution_time,
+            )
+        self.storage.add(
+            view_name="app.another_view", method="GET", is_anon_call=False, is_cache_hit=False,
+            sql_time=0, sql_count=1, view_execution_time=1,
+        )
+
+        entries = self.storage.fetch_all(ordering=["-time_stddev"])
+        self.assertEqual(entries[0].view_name, "app.view_name")
+        self.assertAlmostEqual(entries[0].time_stddev, math.sqrt(26.8 / 4))
+        self.assertAlmostEqual(entries[0].sql_count_stddev, math.sqrt(24 / 4.0))
+        self.assertEqual(entries[1].time_stddev, 0)
+        self.assertEqual(entries[1].sql_count_stddev, 0)
+
+    def test_merge(self):
+        self.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=1, sql_count=1, view_execution_time=2,
+        )
+        counters = create_counters("app.view_name", "GET", False, True, 2, 3, 4, breakdowns={"sql_alias": {
+            "replica": (3, 2),
+        }})
+        merge_counters(counters, create_counters("app.view_name", "GET", False, False, 1, 2, 6))
+        self.storage.merge([counters], node="web1")
+
+        entry = self.storage.fetch_all()[0]
+        self.assertDictEqual(dict(
+            view_name="app.view_name", method="GET", anon_calls=1, cache_hits=1,
+            sql_total_time=4, sql_total_count=6, total_calls=3, sampled_calls=3, total_time=12,
+            time_min=2, time_max=6, time_m2=8, sql_count_min=1, sql_count_max=3, sql_count_m2=2,
+        ), model_to_dict(entry, fields=self.storage.COUNTER_FIELDS))
+        self.assertDictEqual(entry.sql_by_alias, {"replica": (3, 2)})
+        self.assertDictEqual(self.storage.fetch_breakdowns("node"), {("app.view_name", "GET"): {"web1": (2, 10)}})
+
+    @override_settings(SPEEDINFO_STORAGE_MAX_ENTRIES=2)
+    def test_max_entries(self):
+        for view_name, execution_time in [("a", 5), ("b", 1), ("c", 2), ("d", 1), ("a", 1)]:
+            self.storage.add(
+                view_name="app." + view_name, method="GET", is_anon_call=False, is_cache_hit=False,
+                sql_time=0, sql_count=1, view_execution_time=execution_time,
+                breakdowns={"sql_alias": {"default": (1, 0)}},
+            )
+
+        # Least expensive entry is folded into 'other', new entry inherits its total time
+        entries = dict((entry.view_name, entry) for entry in self.storage.fetch_all())
+        self.assertListEqual(sorted(entries), ["app.a", "app.d", "other"])
+        self.assertEqual(entries["app.a"].total_calls, 2)
+        self.assertEqual(entries["app.d"].total_time, 1)
+        self.assertEqual(entries["app.d"].time_error, 3)
+        self.assertEqual(entries["other"].total_calls, 2)
+        self.assertEqual(entries["other"].total_time, 3)
+        self.assertEqual(entries["other"].time_max, 2)
+        self.assertDictEqual(entries["other"].sql_by_alias, {"default": (2, 0)})
+
+    @override_settings(SPEEDINFO_EWMA_HALF_LIFE=60)
+    def test_ewma(self):
+        def add(timestamp, execution_time, sql_count, weight=1):
+            with mock.patch("time.time", return_value=timestamp):
+                self.storage.add(
+                    view_name="app.view_name", method="GET", is_anon_call=False, is_cache_hit=False,
+                    sql_time=0, sql_count=sql_count, view_execution_time=execution_time, weight=weight,
+                )
+
+        add(1000, 1, 2)
+        add(1000, 3, 4)
+        entry = self.storage.fetch_all()[0]
+        self.assertAlmostEqual(entry.ewma_time_per_call, 2)
+        self.assertAlmostEqual(entry.ewma_sql_count_per_call, 3)
+
+        # Weight of the previous calls is halved after the half-life
+        add(1060, 6, 0, weight=2)
+        entry = self.storage.fetch_all(ordering=["-ewma_time_per_call"])[0]
+        self.assertAlmostEqual(entry.ewma_time_per_call, 14 / 3.0)
+        self.assertAlmostEqual(entry.ewma_sql_count_per_call, 1)
+        self.assertAlmostEqual(entry.ewma_weight, 3)
+        self.assertAlmostEqual(entry.time_per_call, 4)
+
+    def test_breakdowns(self):
+        self.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=3, sql_count=3, view_execution_time=4,
+            breakdowns={"sql_alias": {"default": (1, 1), "replica": (2, 2)}},
+        )
+        self.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=1, sql_count=1, view_execution_time=4, weight=2,
+            breakdowns={"sql_alias": {"replica": (1, 0.5)}},
+        )
+        self.storage.add(
+            view_name="app.another_view", method="POST", is_anon_call=True, is_cache_hit=False,
+            sql_time=0, sql_count=0, view_execution_time=1,
+        )
+
+        self.assertDictEqual(self.storage.fetch_breakdowns("sql_alias"), {
+            ("app.view_name", "GET"): {"default": (1, 1), "replica": (4, 3)},
+        })
+        self.assertDictEqual(self.storage.fetch_breakdowns("sql_alias", keys=[("app.another_view", "POST")]), {})
+        self.assertDictEqual(self.storage.fetch_breakdowns("unknown"), {})
+        self.assertDictEqual(self.storage.fetch_breakdowns_by_names(["sql_alias", "unknown"]), {
+            "sql_alias": {("app.view_name", "GET"): {"default": (1, 1), "replica": (4, 3)}},
+            "unknown": {},
+        })
+
+        entries = self.storage.fetch_all(ordering=["view_name"])
+        self.assertDictEqual(entries[0].sql_by_alias, {})
+        self.assertDictEqual(entries[1].sql_by_alias, {"default": (1, 1), "replica": (4, 3)})
+
+        self.storage.reset()
+        self.assertDictEqual(self.storage.fetch_breakdowns("sql_alias"), {})
+
     def test_entry_type(self):
         self.storage.add(
             view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
@@ -93,15 +239,164 @@ class StorageTestCase(object):
         ])
         self.assertEqual(entries[0].view_name, "view2")
 
+    def test_filters(self):
+        self.storage.add(
+            view_name="app.users", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=1, sql_count=2, view_execution_time=2,
+        )
+        self.storage.add(
+            view_name="app.users", method="POST", is_anon_call=False, is_cache_hit=False,
+            sql_time=1, sql_count=2, view_execution_time=8,
+        )
+        self.storage.add(
+            view_name="app.news", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=1, sql_count=2, view_execution_time=1,
+        )
+        self.storage.add(
+            view_name="app.news", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=1, sql_count=2, view_execution_time=1,
+        )
+
+        def fetch(**filters):
+            return sorted((e.view_name, e.method) for e in self.storage.fetch_all(filters=filters))
+
+        self.assertListEqual(fetch(view_name="USER"), [("app.users", "GET"), ("app.users", "POST")])
+        self.assertListEqual(fetch(method="GET"), [("app.news", "GET"), ("app.users", "GET")])
+        self.assertListEqual(fetch(min_calls=2), [("app.news", "GET")])
+        self.assertListEqual(fetch(min_time_per_call=2), [("app.users", "GET"), ("app.users", "POST")])
+        self.assertListEqual(fetch(view_name="users", method="POST"), [("app.users", "POST")])
+
+        self.assertEqual(self.storage.count(), 3)
+        self.assertEqual(self.storage.count({"method": "GET"}), 2)
+        self.assertEqual(self.storage.count({"view_name": "missing"}), 0)
+
+    def test_offset_limit(self):
+        for i in range(5):
+            self.storage.add(
+                view_name="view{}".format(i), method="GET", is_anon_call=True, is_cache_hit=False,
+                sql_time=1, sql_count=2, view_execution_time=i,
+            )
+
+        entries = self.storage.fetch_all(ordering=["-total_time"], offset=1, limit=2)
+        self.assertListEqual([e.view_name for e in entries], ["view3", "view2"])
+
+        entries = self.storage.fetch_all(ordering=["-total_time"], offset=3)
+        self.assertListEqual([e.view_name for e in entries], ["view1", "view0"])
+
+    def test_iter_all(self):
+        for i in range(3):
+            self.storage.add(
+                view_name="view{}".format(i), method="GET", is_anon_call=True, is_cache_hit=False,
+                sql_time=1, sql_count=2, view_execution_time=i,
+            )
+
+        entries = self.storage.iter_all(ordering=["-total_time"])
+        self.assertNotIsInstance(entries, list)
+        self.assertListEqual([e.view_name for e in entries], ["view2", "view1", "view0"])
+
+        entries = self.storage.iter_all(filters={"view_name": "view1"})
+        self.assertListEqual([e.view_name for e in entries], ["view1"])
+
+        self.storage.add(
+            view_name="view1", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=1, sql_count=2, view_execution_time=1, breakdowns={"sql_alias": {"default": (2, 1)}},
+        )
+        entries = list(self.storage.iter_all(filters={"view_name": "view1"}))
+        self.assertListEqual(list(entries[0].breakdowns["sql_alias"]["default"]), [2, 1])
+
+    def test_fetch_counters(self):
+        self.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=True,
+            sql_time=2, sql_count=3, view_execution_time=4,
+        )
+        counters = self.storage.fetch_counters()
+
+        self.assertEqual(len(counters), 1)
+        self.assertDictContainsSubset(dict(
+            view_name="app.view_name", method="GET", anon_calls=1, cache_hits=1,
+            sql_total_time=2, sql_total_count=3, total_calls=1, sampled_calls=1, total_time=4,
+        ), counters[0])
+
+    def add_slow_request(self, view_name="app.view_name", method="GET", duration=1, created_at=None):
+        self.storage.add(
+            view_name=view_name, method=method, is_anon_call=False, is_cache_hit=False,
+            sql_time=0.5, sql_count=2, view_execution_time=duration,
+        )
+        self.storage.add_slow_request(
+            view_name=view_name, method=method, path="/path/", query_hash="0a1b2c3d", user_id="1",
+            status_code=200, is_cache_hit=False, sql_time=0.5, sql_count=2, duration=duration,
+            created_at=created_at or datetime(2020, 1, 1),
+        )
+
+    def test_add_slow_request(self):
+        self.add_slow_request(duration=3)
+        slow_requests = self.storage.fetch_slow_requests()
+
+        self.assertEqual(len(slow_requests), 1)
+        self.assertIsInstance(slow_requests[0], SlowRequest)
+        self.assertDictEqual(dict(
+            view_name="app.view_name", method="GET", path="/path/", query_hash="0a1b2c3d", user_id="1",
+            status_code=200, is_cache_hit=False, sql_time=0.5, sql_count=2, duration=3,
+            created_at=datetime(2020, 1, 1),
+        ), model_to_dict(slow_requests[0], exclude=["id"]))
+
+    @override_settings(SPEEDINFO_SLOW_REQUESTS_PER_VIEW=2)
+    def test_slow_requests_per_view_limit(self):
+        for i in range(4):
+            self.add_slow_request(duration=i, created_at=datetime(2020, 1, 1) + timedelta(seconds=i))
+        self.add_slow_request(view_name="app.another_view", duration=1)
+
+        slow_requests = self.storage.fetch_slow_requests(ordering=["view_name", "-duration"])
+        self.assertListEqual(
+            [("app.another_view", 1), ("app.view_name", 3), ("app.view_name", 2)],
+            [(r.view_name, r.duration) for r in slow_requests],
+        )
+
+    @override_settings(SPEEDINFO_SLOW_REQUESTS_LIMIT=2)
+    def test_slow_requests_limit(self):
+        self.add_slow_request(view_name="view1", duration=3)
+        self.add_slow_request(view_name="view2", duration=1)
+        self.add_slow_request(view_name="view3", duration=2)
+
+        slow_requests = self.storage.fetch_slow_requests(ordering=["duration"])
+        self.assertListEqual(["view3", "view1"], [r.view_name for r in slow_requests])
+
     def test_reset(self):
         self.storage.add(
             view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
             sql_time=3, sql_count=2, view_execution_time=3,
         )
+        self.add_slow_request()
         self.storage.reset()
 
         entries = self.storage.fetch_all()
         self.assertEqual(len(entries), 0)
+        self.assertEqual(len(self.storage.fetch_slow_requests()), 0)
+
+    @override_settings(SPEEDINFO_SNAPSHOTS_LIMIT=2)
+    def test_snapshots(self):
+        self.storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=3, sql_count=2, view_execution_time=3,
+        )
+
+        for i in range(3):
+            self.storage.save_snapshot(
+                "session{}".format(i), datetime(2020, 1, 1, i), datetime(2020, 1, 1, i, 30),
+            )
+
+        snapshots = self.storage.fetch_snapshots(ordering=["-finished_at"])
+        self.assertListEqual(["session2", "session1"], [snapshot.name for snapshot in snapshots])
+        self.assertEqual(snapshots[0].started_at, datetime(2020, 1, 1, 2))
+
+        # Snapshots are kept after reset
+        self.storage.reset()
+        self.assertListEqual(self.storage.fetch_snapshot_counters(snapshots[1].id), [dict(
+            view_name="app.view_name", method="GET", anon_calls=1, cache_hits=0,
+            sql_total_time=3, sql_total_count=2, total_calls=1, sampled_calls=1, total_time=3,
+            time_min=3, time_max=3, time_m2=0, sql_count_min=2, sql_count_max=2, sql_count_m2=0,
+        )])
+        self.assertIsNone(self.storage.fetch_snapshot_counters("0"))
 
 
 @override_settings(
@@ -118,9 +413,303 @@ class StorageTestCase(object):
         },
     })
 class CacheStorageTestCase(StorageTestCase, TestCase):
-    pass
+    def add(self, view_name):
+        self.storage.add(
+            view_name=view_name, method="GET", is_anon_call=False, is_cache_hit=False,
+            sql_time=0, sql_count=1, view_execution_time=1,
+        )
+
+    def test_evicted_entry(self):
+        self.add("app.view_name")
+        self.add("app.another_view")
+        self.storage._cache.delete(self.storage.get_cache_key("app.view_name", "GET"))
+
+        # Evicted entry is skipped and removed from the index
+        self.assertListEqual([entry.view_name for entry in self.storage.fetch_all()], ["app.another_view"])
+        self.assertEqual(self.storage.count_evictions(), 1)
+        self.assertListEqual(self.storage.indexes(), [self.storage.get_cache_key("app.another_view", "GET")])
+
+        # Entry evicted along with the index entry is noticed on update
+        self.add("app.another_view")
+        self.storage._cache.delete(self.storage.get_cache_key("app.another_view", "GET"))
+        self.add("app.another_view")
+        self.assertEqual(self.storage.count_evictions(), 2)
+        self.assertEqual(self.storage.fetch_all()[0].total_calls, 1)
+
+        self.storage.reset()
+        self.assertEqual(self.storage.count_evictions(), 0)
+
+    @override_settings(SPEEDINFO_STORAGE_MAX_ENTRIES=20)
+    def test_eviction_batch(self):
+        for i in range(20):
+            self.add("app.view{:02d}".format(i))
+
+        # Batch of the entries is evicted at once to make room for the new ones
+        with mock.patch.object(self.storage, "get_entries", wraps=self.storage.get_entries) as get_entries_mock:
+            self.add("app.new_view1")
+            self.add("app.new_view2")
+            self.assertEqual(get_entries_mock.call_count, 1)
+
+        entries = dict((entry.view_name, entry) for entry in self.storage.fetch_all())
+        self.assertEqual(len(entries), 21)
+        self.assertEqual(entries["other"].total_calls, 2)
+        self.assertEqual(entries["app.new_view1"].time_error, 1)
+        self.assertEqual(entries["app.new_view2"].time_error, 1)
+
+        # Entries aren't folded while another worker is evicting them
+        self.storage._cache.set(self.storage.CACHE_EVICTION_LOCK_KEY, 1)
+        self.add("app.new_view3")
+        self.assertEqual(self.storage.count(), 22)
+        self.assertEqual(self.storage.fetch_all(filters={"view_name": "other"})[0].total_calls, 2)
+
+        # Entries added over the limit are evicted with the next batch
+        self.storage._cache.delete(self.storage.CACHE_EVICTION_LOCK_KEY)
+        self.add("app.new_view4")
+        self.assertEqual(self.storage.count(), 20)
+        self.assertEqual(self.storage.fetch_all(filters={"view_name": "other"})[0].total_calls, 5)
+
+    def test_evicted_index(self):
+        self.add("app.view_name")
+        self.storage._cache.delete_many(self.storage.get_index_keys())
+        self.assertListEqual(self.storage.fetch_all(), [])
+
+        # Entry is listed again on update
+        self.add("app.view_name")
+        entries = self.storage.fetch_all()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].total_calls, 2)
+        self.assertEqual(self.storage.count_evictions(), 0)
 
 
 @override_settings(SPEEDINFO_STORAGE="speedinfo.storage.database.storage.DatabaseStorage", SPEEDINFO_TESTS=True)
 class DatabaseStorageTestCase(StorageTestCase, TestCase):
-    pass
+    def test_add_breakdowns(self):
+        breakdowns = {"sql_alias": {"default": (2, 0.5)}, "status": {"2xx": (1, 1)}}
+        self.storage.add_breakdowns("app.view_name", "GET", breakdowns)
+
+        # Existing values are read and updated with a query each, new ones are inserted
+        # with a single query (wrapped in a savepoint) regardless of the number of values
+        breakdowns = {"sql_alias": {"default": (1, 0.5), "replica": (3, 1)}, "status": {"2xx": (1, 2), "5xx": (1, 3)}}
+
+        with self.assertNumQueries(5):
+            self.storage.add_breakdowns("app.view_name", "GET", breakdowns)
+
+        self.assertDictEqual(self.storage.fetch_all_breakdowns()[("app.view_name", "GET")], {
+            "sql_alias": {"default": (3, 1), "replica": (3, 1)},
+            "status": {"2xx": (2, 3), "5xx": (1, 3)},
+        })
+
+
+class StatsdStorageTestCase(TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.settimeout(5)
+        self.addCleanup(self.server.close)
+
+    def create_storage(self, **settings):
+        settings.setdefault("SPEEDINFO_STATSD_PORT", self.server.getsockname()[1])
+        settings.setdefault("SPEEDINFO_STATSD_FLUSH_INTERVAL", 60)
+
+        with override_settings(**settings):
+            return StatsdStorage()
+
+    def receive(self):
+        return self.server.recv(65535).decode().split("\n")
+
+    def test_statsd(self):
+        storage = self.create_storage()
+        storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=True, is_cache_hit=False,
+            sql_time=0.5, sql_count=3, view_execution_time=1.25,
+        )
+        storage.flush()
+
+        self.assertListEqual(self.receive(), [
+            "speedinfo.app.view_name.GET.calls:1|c",
+            "speedinfo.app.view_name.GET.time:1250|ms",
+            "speedinfo.app.view_name.GET.sql_count:3|c",
+            "speedinfo.app.view_name.GET.sql_time:500|ms",
+            "speedinfo.app.view_name.GET.anon_calls:1|c",
+        ])
+
+    def test_breakdowns(self):
+        storage = self.create_storage()
+        storage.add(
+            view_name="app.view_name", method="GET", is_anon_call=False, is_cache_hit=False,
+            sql_time=0.5, sql_count=3, view_execution_time=1.25,
+            breakdowns={"sql_alias": {"replica": (3, 0.5)}},
+        )
+        storage.flush()
+
+        self.assertListEqual(self.receive()[-2:], [
+            "speedinfo.app.view_name.GET.sql_alias.replica.count:3|c",
+            "speedinfo.app.view_name.GET.sql_alias.replica.time:500|ms",
+        ])
+        self.assertDictEqual(storage.fetch_breakdowns("sql_alias"), {})
+
+    def test_size_breakdown(self):
+        storage = self.create_storage()
+        storage.add(
+            view_name="app.view_name", method="POST", is_anon_call=False, is_cache_hit=False,
+            sql_time=0, sql_count=0, view_execution_time=0.1,
+            breakdowns={"size": {"request": (1, 100), "response_gzip": (1, 2048)}},
+        )
+        storage.flush()
+
+        # Sizes are sent in bytes rather than as timers
+        self.assertListEqual(self.receive()[-4:], [
+            "speedinfo.app.view_name.POST.size.request.count:1|c",
+            "speedinfo.app.view_name.POST.size.request.bytes:100|c",
+            "speedinfo.app.view_name.POST.size.response_gzip.count:1|c",
+            "speedinfo.app.view_name.POST.size.response_gzip.bytes:2048|c",
+        ])
+
+    def test_dogstatsd(self):
+        storage = self.create_storage(SPEEDINFO_STATSD_DOGSTATSD=True, SPEEDINFO_STATSD_PREFIX="app")
+        storage.add(
+            view_name="app.view:name", method="POST", is_anon_call=False, is_cache_hit=True,
+            sql_time=0, sql_count=0, view_execution_time=0.1,
+            breakdowns={"exception": {"django.http.Http404": (1, 0.0125)}},
+        )
+        storage.flush()
+
+        # Breakdown values are sent as tags
+        self.assertListEqual(self.receive(), [
+            "app.calls:1|c|#view:app.view_name,method:POST",
+            "app.time:100|ms|#view:app.view_name,method:POST",
+            "app.sql_count:0|c|#view:app.view_name,method:POST",
+            "app.sql_time:0|ms|#view:app.view_name,method:POST",
+            "app.cache_hits:1|c|#view:app.view_name,method:POST",
+            "app.exception.count:1|c|#view:app.view_name,method:POST,exception:django.http.Http404",
+            "app.exception.time:12.5|ms|#view:app.view_name,method:POST,exception:django.http.Http404",
+        ])
+
+    def test_batching(self):
+        storage = self.create_storage(SPEEDINFO_STATSD_MAX_PACKET_SIZE=100)
+
+        for i in range(10):
+            storage.add(
+                view_name="view", method="GET", is_anon_call=False, is_cache_hit=False,
+                sql_time=0, sql_count=0, view_execution_time=0,
+            )
+        storage.flush()
+
+        lines = []
+
+        while len(lines) < 40:
+            packet = self.server.recv(65535)
+            self.assertLessEqual(len(packet), 100)
+            lines.extend(packet.decode().split("\n"))
+
+        self.assertEqual(len(lines), 40)
+
+    def test_background_flush(self):
+        storage = self.create_storage(SPEEDINFO_STATSD_FLUSH_INTERVAL=0.01)
+        storage.add_slow_request(
+            view_name="view", method="GET", path="/", query_hash="", user_id="", status_code=200,
+            is_cache_hit=False, sql_time=0, sql_count=0, duration=1, created_at=datetime(2020, 1, 1),
+        )
+        self.assertListEqual(self.receive(), ["speedinfo.view.GET.slow_requests:1|c"])
+
+    def test_queue_overflow(self):
+        storage = self.create_storage(SPEEDINFO_STATSD_QUEUE_SIZE=2)
+        storage.add(
+            view_name="view", method="GET", is_anon_call=False, is_cache_hit=False,
+            sql_time=0, sql_count=0, view_execution_time=0,
+        )
+        self.assertEqual(storage.dropped, 2)
+
+        # Number of dropped metrics is reported once
+        storage.flush()
+        self.assertEqual(self.receive()[-1], "speedinfo.dropped:2|c")
+        storage.add_slow_request(
+            view_name="view", method="GET", path="/", query_hash="", user_id="", status_code=200,
+            is_cache_hit=False, sql_time=0, sql_count=0, duration=1, created_at=datetime(2020, 1, 1),
+        )
+        storage.flush()
+        self.assertListEqual(self.receive(), ["speedinfo.view.GET.slow_requests:1|c"])
+
+    def test_full_packet_flush(self):
+        storage = self.create_storage(SPEEDINFO_STATSD_MAX_PACKET_SIZE=100)
+
+        # Flusher doesn't wait for the interval once the queue holds a full packet
+        for i in range(3):
+            storage.add(
+                view_name="view", method="GET", is_anon_call=False, is_cache_hit=False,
+                sql_time=0, sql_count=0, view_execution_time=0,
+            )
+
+        self.assertEqual(self.receive()[0], "speedinfo.view.GET.calls:1|c")
+
+    def test_sample_rate(self):
+        storage = self.create_storage()
+        storage.add(
+            view_name="view", method="GET", is_anon_call=False, is_cache_hit=False,
+            sql_time=0, sql_count=0, view_execution_time=0, weight=4,
+        )
+        storage.flush()
+        self.assertEqual(self.receive()[0], "speedinfo.view.GET.calls:1|c|@0.25")
+
+    def test_pack_lines(self):
+        self.assertListEqual(pack_lines(["aaa", "bbb", "ccc"], 7), [b"aaa\nbbb", b"ccc"])
+        self.assertListEqual(pack_lines(["aaaaaaaaaa", "b"], 5), [b"aaaaaaaaaa", b"b"])
+        self.assertListEqual(pack_lines([], 5), [])
+
+    def test_read_methods(self):
+        storage = self.create_storage()
+        self.assertListEqual(storage.fetch_all(), [])
+        self.assertEqual(storage.count(), 0)
+        self.assertListEqual(storage.fetch_slow_requests(), [])
+        self.assertListEqual(storage.fetch_snapshots(), [])
+
+
+class LegacyStorage(AbstractStorage):
+    """Storage implemented for the versions without weights, breakdowns and filters."""
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, view_name, method, is_anon_call, is_cache_hit, sql_time, sql_count, view_execution_time):
+        entry = self.entries.setdefault((view_name, method), ViewProfiler(view_name=view_name, method=method))
+        entry.total_calls += 1
+        entry.total_time += view_execution_time
+
+    def fetch_all(self, ordering=None):
+        return sorted(self.entries.values(), key=lambda entry: entry.view_name)
+
+    def reset(self):
+        self.entries = {}
+
+
+class LegacyStorageTestCase(TestCase):
+    def test_upgrade(self):
+        self.assertIs(upgrade_storage_class(CacheStorage), CacheStorage)
+
+        storage = upgrade_storage_class(LegacyStorage)()
+        self.assertIsInstance(storage, LegacyStorage)
+
+        for view_name, weight in [("app.view1", 2), ("app.view2", 1)]:
+            storage.add(
+                view_name=view_name, method="GET", is_anon_call=False, is_cache_hit=False,
+                sql_time=0, sql_count=0, view_execution_time=1, weight=weight,
+                breakdowns={"sql_alias": {"default": (1, 0)}},
+            )
+
+        # Weighted request is added several times, entries are filtered and sliced after fetching
+        self.assertEqual(storage.fetch_all(filters={"view_name": "view1"})[0].total_calls, 2)
+        self.assertListEqual([entry.view_name for entry in storage.fetch_all(offset=1, limit=1)], ["app.view2"])
+        self.assertListEqual([entry.view_name for entry in storage.iter_all()], ["app.view1", "app.view2"])
+        self.assertEqual(storage.count({"min_calls": 2}), 1)
+        self.assertEqual(storage.fetch_counters()[0]["total_time"], 2)
+
+        # Methods added since then fall back to the defaults
+        self.assertDictEqual(storage.fetch_breakdowns("sql_alias"), {})
+        self.assertDictEqual(storage.fetch_breakdowns_by_names(["sql_alias"]), {"sql_alias": {}})
+        self.assertIsNone(storage.count_evictions())
+        self.assertListEqual(storage.fetch_slow_requests(), [])
+        self.assertIsNone(storage.save_snapshot("release", datetime.now(), datetime.now()))
+        self.assertListEqual(storage.fetch_snapshots(), [])
+        self.assertIsNone(storage.fetch_snapshot_counters("abc"))
+
+        with self.assertRaises(NotImplementedError):
+            storage.merge([])
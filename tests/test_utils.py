@@ -0,0 +1,59 @@
+# coding: utf-8
+
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+
+from speedinfo.utils import (
+    LRUCache, get_exception_name, get_header_name, get_status_class, get_view_name, parse_request_start,
+)
+
+try:
+    from django.urls import reverse  # Django >= 1.10
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+
+class UtilsTestCase(TestCase):
+    def test_get_view_name(self):
+        factory = RequestFactory()
+        request = factory.get(reverse("func-view"))
+
+        self.assertEqual(get_view_name(request), "tests.views.func_view")
+        request.path = reverse("class-view")
+        self.assertEqual(get_view_name(request), "tests.views.func_view")
+
+        self.assertIsNone(get_view_name(factory.get("/")))
+
+    def test_get_exception_name(self):
+        self.assertEqual(get_exception_name(ValueError), "ValueError")
+        self.assertEqual(get_exception_name(Http404), "django.http.response.Http404")
+
+    def test_get_status_class(self):
+        self.assertEqual(get_status_class(200), "2xx")
+        self.assertEqual(get_status_class(503), "5xx")
+
+    def test_parse_request_start(self):
+        self.assertEqual(parse_request_start("t=1609459200.5"), 1609459200.5)
+        self.assertEqual(parse_request_start("t=1609459200500000"), 1609459200.5)
+        self.assertEqual(parse_request_start("1609459200500"), 1609459200.5)
+        self.assertEqual(parse_request_start("1609459200500", unit="ms"), 1609459200.5)
+        self.assertIsNone(parse_request_start("t=now"))
+
+    def test_get_header_name(self):
+        self.assertEqual(get_header_name("HTTP_X_REQUEST_START"), "X-Request-Start")
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+
+        cache.set("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.get("d", 4), 4)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
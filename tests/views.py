@@ -32,3 +32,7 @@ def db_func_view(request):
     User.objects.create_user(username="user")
     User.objects.get(username="user")
     return HttpResponse()
+
+
+def error_func_view(request):
+    raise ValueError("Error")